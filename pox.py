@@ -7,15 +7,18 @@ App class
 - Optional Listen-and-Repeat speech recognition mode
 - Camera and diagnostic view
 - User control via keyboard
+- Optional headless mode (no GUI, commands from stdin or control socket)
 
 """
 
 import sys
+import argparse
 import Queue
 import time
 import os
 
 import cv2
+import numpy as np
 
 import poxutil
 import poxtts
@@ -23,39 +26,16 @@ import poxrec
 import poxcom
 import poxfsm
 import poxcv
-
-
-def make_movie(img_path):
-    """Generate an MOV file from a directory of PNG files."""
-
-    # gather file names of frames
-    img_files = []
-    for (dirpath, dirnames, filenames) in os.walk(img_path):
-        img_files.extend(filenames)
-        break
-
-    # only consider PNG files
-    img_files = [each for each in img_files if each.rfind(".png") > 0]
-    if len(img_files) == 0:
-        print "No PNG files found!"
-        return
-
-    # determine size of frames
-    file_path = os.path.join(img_path, img_files[0])
-    size = cv2.cv.GetSize(cv2.cv.LoadImage(file_path))
-
-    # build movie from separate frames
-    # TODO -- may need to change FPS on different systems
-    fps = 15
-    movie_path = os.path.join(img_path, "movie.mov")
-    video_maker = cv2.VideoWriter(movie_path,
-                                  cv2.cv.CV_FOURCC('m', 'p', '4', 'v'),
-                                  fps, size)
-    if video_maker.isOpened():
-        for each in img_files:
-            file_path = os.path.join(img_path, each)
-            img = cv2.imread(file_path)
-            video_maker.write(img)
+import poxcap
+import poxctl
+import poxvid
+import poxmovie
+import poxring
+import poxsrc
+import poxperf
+import poxprof
+import poxdet
+import poxcompat
 
 
 class App(object):
@@ -74,17 +54,42 @@ class App(object):
              "purple": (128, 64, 64),
              "blue": (192, 0, 0)}
 
-    def __init__(self):
+    # bounds of HUD status panel in upper left corner
+    # (status boxes and speech recognition progress bar)
+    # text in status boxes may run past box width (see hud_width)
+    HUD_H = 20 * 4 + 1
+    HUD_WN = 54 + 1
+    HUD_W = 54 + int(poxfsm.SMPhrase.REC_TIMEOUT_SEC) * 10 + 1
+
+    def __init__(self, headless=False, control_port=None,
+                 record_policy=poxvid.DROP_OLDEST, record_video=False,
+                 source=None, detector="haar", free_run=False):
+
+        # headless mode has no monitor window
+        # and takes key commands from stdin or control socket
+        self.headless = headless
+        self.control_port = control_port
+        self.thread_ctl = poxctl.ControlDaemon()
 
         # worker thread stuff
         self.thread_tts = poxtts.TTSDaemon()
         self.thread_rec = poxrec.RECDaemon()
         self.thread_com = poxcom.Com()
+        self.thread_mov = poxmovie.MovieDaemon()
         self.event_queue = Queue.Queue()
 
         # execution stuff
         self.cvx = poxcv.CVMain()
+        self.cvx.set_backend(detector)
+        self.cvx.stagger_enable = True
         self.cvsm = poxfsm.SMLoop()
+        # frame source object, or source spec (see poxsrc.open_source)
+        # that is opened during startup (None for live camera 0)
+        self.source = None
+        self.source_spec = source
+        self.free_run = free_run
+        if hasattr(source, "read"):
+            self.source = source
         self.phrase_mgr = poxutil.PhraseManager()
         self.roi = None
 
@@ -105,6 +110,27 @@ class App(object):
         self.record_path = os.path.join(os.path.dirname(
             os.path.abspath(__file__)), "movie")
         self.record_ok = os.path.isdir(self.record_path)
+        self.record_video = record_video
+
+        # always-on replay ring of recent ROI frames and detections
+        # last few seconds are frozen to disk when ACT state is entered
+        self.ring = None
+        self.ring_sec = 20.0
+        self.ring_freeze_sec = 10.0
+        self.ring_freeze_ct = 0
+        if self.record_ok:
+            self.ring = poxring.FrameRing(
+                os.path.join(self.record_path, "ring.mmap"), self.ring_sec)
+        if record_video:
+            self.recorder = poxvid.ClipRecorder(policy=record_policy)
+        else:
+            self.recorder = poxvid.FrameRecorder(policy=record_policy)
+
+        # face detection settings tuned per camera and resolution
+        # delete file to force calibration at next start-up
+        self.calib_path = os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "cvprofile.json")
+        self.calib_sec = 2.0
 
         # scale the face detection ROI
         # will chop a percentage from top/bottom and left/right
@@ -112,6 +138,34 @@ class App(object):
         self.roi_perc_h = 0.1
         self.roi_perc_w = 0.2
 
+        # HUD layer is cached until one of its inputs changes
+        self.hud_cache = True
+        self.hud_cache_key = None
+        self.hud_overlay = None
+        self.hud_mask = None
+
+        # main loop stage times
+        # (optional panel below HUD shows recent averages)
+        self.perf = poxperf.StageTimer()
+        self.perf_hud = False
+        self.cvx.stage_timer = self.perf
+
+        # motion gate in front of detection
+        self.gate = poxcv.MotionGate()
+        self.gate_enable = True
+
+        # working image scale
+        self.scale_ctl = poxcv.ScaleController()
+        self.scale_adapt = True
+
+        # startup timing
+        self.t_launch = time.time()
+        self.t_first = None
+
+        # on-demand profiler for a few hundred loop iterations
+        # (output goes to movie folder)
+        self.profiler = poxprof.LoopProfiler(self.record_path)
+
     def check_z(self):
         # timer for output "Z" test
         if self.n_z > 0:
@@ -135,20 +189,68 @@ class App(object):
             self.record_sfps = "{:.1f}".format(float(self.record_k) / tx)
             self.record_k = 0
 
+    def is_recording(self):
+        return self.record_ok and self.record_enable
+
     def record_frame(self, frame, name_prefix):
         """Record frames to sequentially numbered files if enabled."""
-        if self.record_ok and self.record_enable:
+        if self.is_recording():
             file_name = name_prefix
             if file_name is None or len(file_name) == 0:
                 file_name = "frame"
             file_name += "_"
             file_name += str(self.record_clip).zfill(2)
-            file_name += "_"
-            file_name += str(self.record_ct).zfill(5)
-            file_name += ".png"
+            if not self.record_video:
+                # video recorder adds segment number and extension
+                file_name += "_"
+                file_name += str(self.record_ct).zfill(5)
+                file_name += ".png"
             file_path = os.path.join(self.record_path, file_name)
             self.record_ct += 1
-            cv2.imwrite(file_path, frame)
+            # frame buffer is reused so writer threads get a copy
+            self.recorder.post_frame(file_path, frame.copy())
+
+    def freeze_replay(self, reason):
+        """Saves last few seconds of replay ring if enabled."""
+        def on_done(name, ct, ok):
+            # called from ring writer thread
+            if ok:
+                print "Replay saved:", name, ct, "frames"
+            else:
+                print "Replay damaged (ring overwrote frames):", name
+
+        if self.ring is not None:
+            # counter keeps names unique within a second
+            self.ring_freeze_ct += 1
+            name = "replay_{0}_{1:03d}_{2}".format(
+                time.strftime("%Y%m%d_%H%M%S"), self.ring_freeze_ct, reason)
+            name = os.path.join(self.record_path, name)
+            ct = self.ring.freeze(name, self.ring_freeze_sec, on_done)
+            print "Replay frozen:", name, ct, "frames"
+
+    def toggle_profiler(self):
+        """Starts profiler or stops it early if already running."""
+        if self.profiler.active:
+            print "Profile saved:", self.profiler.stop()
+        elif self.record_ok:
+            threads = [("tts", self.thread_tts._cmd_thread),
+                       ("rec", self.thread_rec._cmd_thread),
+                       ("com_rx", self.thread_com._rx_thread),
+                       ("com_tx", self.thread_com._tx_thread)]
+            self.profiler.start([x for x in threads if x[1] is not None])
+            print "Profiling", self.profiler.iterations, "iterations"
+        else:
+            print "Profiling disabled.  Path not found:", self.record_path
+
+    def open_source(self):
+        """
+        Opens frame source (live camera unless App was given another).
+        :return: True if opened
+        """
+        if self.source is None:
+            self.source = poxsrc.open_source(self.source_spec,
+                                             self.free_run)
+        return self.source.isOpened()
 
     def get_roi(self, h, w):
         """
@@ -160,9 +262,40 @@ class App(object):
         :param w: Width of source image
         :return: (y0, y1, x0, x1)
         """
-        rh = self.roi_perc_h
-        rw = self.roi_perc_w
-        return int(rh * h), int((1 - rh) * h), int(rw * w), int((1 - rw) * w)
+        return poxcv.get_roi(h, w, self.roi_perc_h, self.roi_perc_w)
+
+    def calibrate(self, grabber, pool, img_scale, device=0):
+        """
+        Applies saved face detection profile for this camera and
+        resolution or creates one from a few seconds of live frames.
+        """
+        if self.cvx.cc_face is None:
+            # only cascade backends have settings to calibrate
+            return
+        ret, img = grabber.read()
+        if not ret:
+            return
+        h, w = img.shape[:2]
+        key = "cam{0}_{1}x{2}_{3}".format(device, w, h, img_scale)
+        if self.cvx.backend.name != "haar":
+            key += "_" + self.cvx.backend.name
+        if self.cvx.load_profile(self.calib_path, key):
+            print "Detection profile loaded:", key
+            return
+
+        print "Calibrating detection (look at camera)..."
+        frames = []
+        t_end = time.time() + self.calib_sec
+        while time.time() < t_end:
+            ret, img = grabber.read()
+            if ret:
+                _, imgx = pool.prepare(img, img_scale, self.get_roi)
+                frames.append(imgx.copy())
+        if self.cvx.calibrate(frames):
+            self.cvx.save_profile(self.calib_path, key)
+            print "Detection profile saved:", key, self.cvx.profile
+        else:
+            print "Calibration failed (no face seen).  Using defaults."
 
     def external_action(self, flag, data=None):
         """
@@ -184,68 +317,99 @@ class App(object):
         # press '?' while monitor has focus
         # to see this menu
         print "? - Display help."
+        print "B - Save last few seconds of replay ring."
+        print "D - Dump main loop stage times."
+        print "F - Start/stop profiling main loop and worker threads."
         print "1 - Toggle eye detection."
         print "2 - Toggle smile detection."
+        print "3 - Toggle face tracking between detections."
+        print "4 - Toggle face search window around last face."
+        print "5 - Toggle adaptive image scale (live camera only)."
+        print "6 - Toggle skipping detection when scene is static."
+        print "7 - Toggle reusing eye/grin results while face is still."
         print "g - Go. Restarts monitoring."
         print "h - Halt. Stops monitoring and any external action."
         print "L - Start scripted speech mode.  Only valid when monitoring."
-        print "M - Make MOV movie file from recorded video frames."
+        print "M - Make MOV movie files from recorded video frames (PNG)."
+        print "P - Toggle stage time panel."
         print "s - (Test) Say next phrase from file."
         print "r - (Test) Recognize phrase that was last spoken."
         print "Q - Quit."
         print "V - Toggle video recording."
         print "Z - (Test) Activate external output for half-second."
         print "ESC - Quit."
+        print "(In headless mode type keys followed by Enter, 'esc' to quit.)"
 
-    def show_monitor_window(self, img, boxes, sfps):
-        # update display items
-        status_color = App.color[self.cvsm.snapshot["color"]]
-        s_label = self.cvsm.snapshot["label"]
+    def hud_key(self, img, sfps):
+        # everything that changes appearance of HUD status panel
+        return (img.shape, self.cvsm.snapshot["color"],
+                self.cvsm.snapshot["label"], self.cvsm.snapshot["prog"],
+                self.cvsm.psm.snapshot["color"], self.s_strikes, sfps,
+                self.record_enable, self.b_eyes, self.b_grin)
 
-        h, w = img.shape[:2]
-        h1, h2, w1, w2 = self.get_roi(h, w)
+    def hud_width(self, sfps):
+        """
+        Returns width of everything draw_hud paints
+        (status boxes or progress bar and any text sticking out of boxes).
+        """
+        pw = App.HUD_WN
+        if int(self.cvsm.snapshot["prog"]) > 0:
+            pw = App.HUD_W
+        for text in (self.cvsm.snapshot["label"], self.s_strikes, sfps):
+            (tw, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_PLAIN,
+                                         1.0, 2)
+            # text starts at x=10, thick strokes spread a bit further
+            pw = max(pw, 10 + tw + 4)
+        return pw
+
+    def draw_hud(self, img, sfps, paint=None):
+        """
+        Draws status items in upper left corner.
+        :param img: Image to draw on (may be cropped to status panel)
+        :param sfps: Frames-per-second string
+        :param paint: If not None, draw everything in this color (for mask)
+        """
+        def color(name):
+            if paint is not None:
+                return paint
+            return App.color[name]
 
-        # draw face boxes and face ROI
-        img_final = img
-        for each in boxes:
-            pt1 = (each[0][0] + w1, each[0][1] + h1)
-            pt2 = (each[1][0] + w1, each[1][1] + h1)
-            cv2.rectangle(img_final, pt1, pt2, App.color["green"])
-        cv2.rectangle(img_final, (w1, h1), (w2, h2), App.color["cyan"])
+        # update display items
+        status_color = color(self.cvsm.snapshot["color"])
+        s_label = self.cvsm.snapshot["label"]
 
         wn = 54  # width of status boxes
         hn = 20  # height of status boxes
 
         # draw status label in upper left
         # along with status color
-        cv2.rectangle(img_final, (0, 0), (wn, hn), status_color,
-                      cv2.cv.CV_FILLED)
-        cv2.rectangle(img_final, (0, 0), (wn, hn), App.color["white"])
-        cv2.putText(img_final, s_label, (10, 14), cv2.FONT_HERSHEY_PLAIN, 1.0,
-                    App.color["white"], 2)
+        cv2.rectangle(img, (0, 0), (wn, hn), status_color, poxcompat.FILLED)
+        cv2.rectangle(img, (0, 0), (wn, hn), color("white"))
+        cv2.putText(img, s_label, (10, 14), cv2.FONT_HERSHEY_PLAIN, 1.0,
+                    color("white"), 2)
 
         # mode state icon box
-        cv2.rectangle(img_final, (0, hn), (wn, hn * 2), App.color["purple"],
-                      cv2.cv.CV_FILLED)
-        cv2.rectangle(img_final, (0, hn), (wn, hn * 2), App.color["white"])
+        cv2.rectangle(img, (0, hn), (wn, hn * 2), color("purple"),
+                      poxcompat.FILLED)
+        cv2.rectangle(img, (0, hn), (wn, hn * 2), color("white"))
 
         # strike count display
         speech_mode_color = self.cvsm.psm.snapshot["color"]
-        cv2.rectangle(img_final, (0, hn * 2), (wn, hn * 3),
-                      App.color[speech_mode_color], cv2.cv.CV_FILLED)
-        cv2.rectangle(img_final, (0, hn * 2), (wn, hn * 3),
-                      App.color["white"])
-        cv2.putText(img_final, self.s_strikes, (10, hn * 2 + 14),
-                    cv2.FONT_HERSHEY_PLAIN, 1.0, App.color["white"], 2)
+        cv2.rectangle(img, (0, hn * 2), (wn, hn * 3),
+                      color(speech_mode_color), poxcompat.FILLED)
+        cv2.rectangle(img, (0, hn * 2), (wn, hn * 3),
+                      color("white"))
+        cv2.putText(img, self.s_strikes, (10, hn * 2 + 14),
+                    cv2.FONT_HERSHEY_PLAIN, 1.0, color("white"), 2)
 
         # frames per second and recording status
         fps_color = "red" if self.record_enable is True else "black"
-        cv2.rectangle(img_final, (0, hn * 3), (wn, hn * 4),
-                      App.color[fps_color], cv2.cv.CV_FILLED)
-        cv2.rectangle(img_final, (0, hn * 3), (wn, hn * 4),
-                      App.color["white"])
-        cv2.putText(img_final, sfps, (10, hn * 3 + 14),
-                    cv2.FONT_HERSHEY_PLAIN, 1.0, App.color["white"], 2)
+        cv2.rectangle(img, (0, hn * 3), (wn, hn * 4),
+                      color(fps_color), poxcompat.FILLED)
+        cv2.rectangle(img, (0, hn * 3), (wn, hn * 4),
+                      color("white"))
+        cv2.putText(img, sfps, (10, hn * 3 + 14),
+                    cv2.FONT_HERSHEY_PLAIN, 1.0, color("white"), 2)
 
         # draw speech recognition progress (timeout) bar if active
         # just a black rectangle that gets filled with gray blocks
@@ -258,44 +422,121 @@ class App(object):
             x2 = wn + (rec_sec - x) * wb
             x3 = wn + rec_sec * wb
             xtrg = x1 + 12 * wb  # see poxrec.py
-            cv2.rectangle(img_final, (x1, 0), (x2, hn), App.color["gray"],
-                          cv2.cv.CV_FILLED)
-            cv2.rectangle(img_final, (x2, 0), (x3, hn), App.color["black"],
-                          cv2.cv.CV_FILLED)
-            cv2.line(img_final, (xtrg, 0), (xtrg, hn), App.color["yellow"])
-            cv2.rectangle(img_final, (x1, 0), (x3, hn), App.color["white"])
+            cv2.rectangle(img, (x1, 0), (x2, hn), color("gray"),
+                          poxcompat.FILLED)
+            cv2.rectangle(img, (x2, 0), (x3, hn), color("black"),
+                          poxcompat.FILLED)
+            cv2.line(img, (xtrg, 0), (xtrg, hn), color("yellow"))
+            cv2.rectangle(img, (x1, 0), (x3, hn), color("white"))
 
         # draw eye detection state indicator (pair of eyes)
         if self.b_eyes:
             e_y = 28
             e_x = 8
             e_dx = 8
-            cv2.circle(img_final, (e_x, e_y), 3, App.color["white"],
-                       cv2.cv.CV_FILLED)
-            cv2.circle(img_final, (e_x + e_dx, e_y), 3, App.color["white"],
-                       cv2.cv.CV_FILLED)
-            cv2.circle(img_final, (e_x, e_y), 1, App.color["black"],
-                       cv2.cv.CV_FILLED)
-            cv2.circle(img_final, (e_x + e_dx, e_y), 1, App.color["black"],
-                       cv2.cv.CV_FILLED)
+            cv2.circle(img, (e_x, e_y), 3, color("white"),
+                       poxcompat.FILLED)
+            cv2.circle(img, (e_x + e_dx, e_y), 3, color("white"),
+                       poxcompat.FILLED)
+            cv2.circle(img, (e_x, e_y), 1, color("black"),
+                       poxcompat.FILLED)
+            cv2.circle(img, (e_x + e_dx, e_y), 1, color("black"),
+                       poxcompat.FILLED)
 
         # draw grin detection state indicator (curve like a grin)
         if self.b_grin:
             g_x = 34
             g_y = 28
-            cv2.ellipse(img_final, (g_x, g_y), (5, 3), 0, 0, 180,
-                        App.color["white"], 2)
+            cv2.ellipse(img, (g_x, g_y), (5, 3), 0, 0, 180,
+                        color("white"), 2)
+
+    def render_hud(self, img, sfps):
+        """
+        Composites status panel onto image with a single masked copy.
+        Panel layer and mask are redrawn only when an input changes.
+        Panel covers status boxes and speech progress bar (if active).
+        """
+        h, w = img.shape[:2]
+        ph = min(h, App.HUD_H)
+        pw = min(w, self.hud_width(sfps))
+        key = self.hud_key(img, sfps)
+        if key != self.hud_cache_key:
+            self.hud_overlay = np.zeros((ph, pw) + img.shape[2:], img.dtype)
+            self.draw_hud(self.hud_overlay, sfps)
+            self.hud_mask = np.zeros((ph, pw), np.uint8)
+            self.draw_hud(self.hud_mask, sfps, (255, 255, 255))
+            self.hud_cache_key = key
+        cv2.bitwise_or(self.hud_overlay, self.hud_overlay,
+                       dst=img[:ph, :pw], mask=self.hud_mask)
+
+    def draw_perf(self, img):
+        """
+        Draws recent average time of each loop stage below status panel.
+        Bars are 2 pixels per ms.
+        """
+        x0 = 0
+        y0 = App.HUD_H + 4
+        hn = 12
+        names = self.perf.names
+        cv2.rectangle(img, (x0, y0), (x0 + 150, y0 + hn * len(names) + 2),
+                      App.color["black"], poxcompat.FILLED)
+        for i, name in enumerate(names):
+            ms = self.perf.recent[i] * 1000.0
+            y = y0 + hn * (i + 1)
+            cv2.putText(img, "{0:7} {1:5.1f}".format(name, ms), (x0 + 2, y),
+                        cv2.FONT_HERSHEY_PLAIN, 0.7, App.color["white"])
+            xb = x0 + 100
+            cv2.rectangle(img, (xb, y - 8), (xb + min(int(ms * 2), 48), y),
+                          App.color["yellow"], poxcompat.FILLED)
+
+    def show_monitor_window(self, img, boxes, sfps):
+        h, w = img.shape[:2]
+        h1, h2, w1, w2 = self.get_roi(h, w)
+
+        # draw face boxes and face ROI
+        img_final = img
+        for each in boxes:
+            pt1 = (each[0][0] + w1, each[0][1] + h1)
+            pt2 = (each[1][0] + w1, each[1][1] + h1)
+            cv2.rectangle(img_final, pt1, pt2, App.color["green"])
+
+        # face track IDs (primary subject in yellow)
+        for track in self.cvx.face_tracks.tracks:
+            if track.missing == 0:
+                name = "green"
+                if track is self.cvx.face_tracks.primary:
+                    name = "yellow"
+                pt = (track.rect[0] + w1 + 2, track.rect[1] + h1 + 12)
+                cv2.putText(img_final, str(track.id), pt,
+                            cv2.FONT_HERSHEY_PLAIN, 1.0, App.color[name])
+        cv2.rectangle(img_final, (w1, h1), (w2, h2), App.color["cyan"])
+
+        # status items on top
+        if self.hud_cache:
+            self.render_hud(img_final, sfps)
+        else:
+            self.draw_hud(img_final, sfps)
+        if self.perf_hud:
+            self.draw_perf(img_final)
+        self.perf.mark(poxperf.S_HUD)
 
         # record frame if enabled and update monitor
         self.record_frame(img_final, "img")
-        cv2.imshow("POX Monitor", img_final)
+        self.perf.mark(poxperf.S_RECORD)
+        if not self.headless:
+            cv2.imshow("POX Monitor", img_final)
+        self.perf.mark(poxperf.S_HUD)
 
     def wait_and_check_keys(self, event_list):
         result = True
         # this is where all key input comes from
         # key press that affects state machine will be stuffed in event
         # that event will be handled at next iteration
-        key = cv2.waitKey(1)
+        # (or from control daemon if there is no window)
+        if self.headless:
+            key = self.thread_ctl.poll_key()
+        else:
+            key = cv2.waitKey(1)
         if key == 27 or key == ord('Q'):
             # esc or Q to quit
             result = False
@@ -304,7 +545,33 @@ class App(object):
             self.b_eyes = not self.b_eyes
         elif key == ord('2'):
             # toggle grin detection
+            # (found in parallel with eyes while it is on)
             self.b_grin = not self.b_grin
+            self.cvx.set_parallel(self.b_grin)
+        elif key == ord('3'):
+            # toggle detect-then-track mode
+            self.cvx.track_enable = not self.cvx.track_enable
+            self.cvx.track_reset()
+            print "Tracking:", self.cvx.track_enable
+        elif key == ord('4'):
+            # toggle search window mode
+            self.cvx.window_enable = not self.cvx.window_enable
+            print "Search window:", self.cvx.window_enable
+        elif key == ord('5'):
+            # toggle adaptive image scale
+            self.scale_adapt = not self.scale_adapt
+            print "Adaptive scale:", self.scale_adapt
+        elif key == ord('6'):
+            # toggle motion gate
+            self.gate_enable = not self.gate_enable
+            if self.gate_enable:
+                # reference and result may be from before gate was off
+                self.gate.reset()
+            print "Motion gate:", self.gate_enable
+        elif key == ord('7'):
+            # toggle staggered eye/grin search
+            self.cvx.stagger_enable = not self.cvx.stagger_enable
+            print "Staggered eyes/grin:", self.cvx.stagger_enable
         elif key in poxfsm.USER_KEYS:
             event_list.append(poxfsm.SMEvent(poxfsm.SMEvent.E_KEY, key))
         elif key == ord('s'):
@@ -319,6 +586,15 @@ class App(object):
                 self.thread_rec.post_cmd('hear', self.phrase)
         elif key == ord('?'):
             App.show_help()
+        elif key == ord('B'):
+            self.freeze_replay("key")
+        elif key == ord('D'):
+            print "Stage times:"
+            print self.perf.report()
+        elif key == ord('P'):
+            self.perf_hud = not self.perf_hud
+        elif key == ord('F'):
+            self.toggle_profiler()
         elif key == ord('Z'):
             self.n_z = 10
             self.external_action(True)
@@ -326,16 +602,20 @@ class App(object):
             if self.record_ok:
                 if self.record_enable is True:
                     self.record_enable = False
+                    self.recorder.end_clip()
                 else:
                     # new clip, reset frame ct
                     self.record_enable = True
                     self.record_clip += 1
                     self.record_ct = 0
         elif key == ord('M'):
-            print "Begin making movie"
-            make_movie(self.record_path)
-            print "Finished"
-            self.reset_fps()
+            # movies are built in background
+            # and daemon will post a message when done
+            self.recorder.flush()
+            if self.thread_mov.start(self.event_queue, self.record_path):
+                print "Begin making movies"
+            else:
+                print "Still making movies"
         return result
 
     def loop(self):
@@ -348,20 +628,46 @@ class App(object):
         - Check keyboard input
         """
 
-        # need a 0 as argument
-        vcap = cv2.VideoCapture(0)
+        # frame source is normally opened by a startup task
+        if self.source is None:
+            self.open_source()
+        vcap = self.source
         if not vcap.isOpened():
-            print "Camera Device failed to open."
+            print "Frame source failed to open."
             return False
 
-        # this may need to change depending on camera
-        # (seemed like a good value for MacBook Pro)
-        img_scale = 0.5
+        grabber = None
+        clock = None
+        if vcap.free_run:
+            # every frame is processed in order
+            # and timers run on frame timestamps
+            reader = vcap
+            clock = poxutil.VirtualClock()
+            poxutil.set_clock(clock)
+        else:
+            # frames are captured on their own thread
+            # loop always takes the freshest one
+            grabber = poxcap.FrameGrabber(vcap)
+            grabber.start()
+            reader = grabber
+
+        # starting scale (seemed like a good value for MacBook Pro)
+        # live camera scale is then adjusted to hold target FPS
+        img_scale = self.scale_ctl.scale
+        adapt = vcap.live
+
+        # preallocated buffers for each stage of frame pipeline
+        pool = poxcv.FramePool()
 
         # this must persist between iterations
         events = []
 
+        # recorded frames keep default settings (repeatable results)
+        if vcap.live:
+            self.calibrate(reader, pool, img_scale, vcap.device)
+
         self.reset_fps()
+        self.perf.start()
 
         while True:
 
@@ -369,16 +675,49 @@ class App(object):
             # grab image, downsize, extract ROI, run detection
             # b_found will be result of face/eye/grin detection
             # boxes have data for drawing rectangles for what was detected
-            ret, img = vcap.read()
-            img_small = cv2.resize(img, (0, 0), fx=img_scale, fy=img_scale)
-            h, w = img_small.shape[:2]
-            h1, h2, w1, w2 = self.get_roi(h, w)
-            imgx = img_small[h1:h2, w1:w2]
-            b_found, boxes = self.cvx.detect(imgx, self.b_eyes, self.b_grin)
+            ret, img = reader.read()
+            self.perf.mark(poxperf.S_CAPTURE)
+            if not ret:
+                if vcap.is_done():
+                    print "End of frames."
+                    break
+                # camera stalled but still allow user to quit
+                # (stall time stays in capture stage of this iteration)
+                if not self.wait_and_check_keys(events):
+                    break
+                self.perf.mark(poxperf.S_KEY)
+                self.perf.end()
+                continue
+            t_frame = time.time()
+            if clock is not None:
+                clock.set(reader.t)
+            if self.t_first is None:
+                self.t_first = time.time()
+                print "First frame: {0:.0f}ms after launch".format(
+                    (self.t_first - self.t_launch) * 1000.0)
+            # headless mode only needs full frame for recording
+            display = not self.headless or self.is_recording()
+            img_small, imgx = pool.prepare(img, img_scale, self.get_roi,
+                                           display)
+            # detection is skipped if nothing moved since last good result
+            skip = self.gate_enable and self.gate.check(imgx, reader.t)
+            self.perf.mark(poxperf.S_ROI)
+            if skip:
+                b_found, boxes = self.gate.last
+            else:
+                b_found, boxes = self.cvx.detect(imgx, self.b_eyes,
+                                                 self.b_grin, pool.gray)
+                self.gate.store(b_found, boxes, reader.t)
+                # face tracks and boxes are built after last feature
+                self.perf.mark(poxperf.S_FACE)
+            if self.ring is not None:
+                faces, features = self.cvx.face_table()
+                self.ring.push(imgx, reader.t, b_found, faces, features)
+            self.perf.mark(poxperf.S_RING)
 
             # propagate face/eye found event
             if b_found:
-                events.append(poxfsm.SMEvent(poxfsm.SMEvent.E_CVOK))
+                events.append(poxfsm.EV_CVOK)
 
             # poll to see if workers sent any messages
             while not self.event_queue.empty():
@@ -386,7 +725,7 @@ class App(object):
                 self.event_queue.task_done()
                 stokens = x.split()
                 if stokens[0] == poxtts.POX_TTS:
-                    events.append(poxfsm.SMEvent(poxfsm.SMEvent.E_SDONE))
+                    events.append(poxfsm.EV_SDONE)
                 elif stokens[0] == poxrec.POX_REC:
                     if stokens[1] == 'init':
                         # just print out initialization result
@@ -403,6 +742,9 @@ class App(object):
                         events.append(rdone)
                 elif stokens[0] == poxcom.POX_COM:
                     print stokens
+                elif stokens[0] == poxmovie.POX_MOV:
+                    print "Finished making movies:", " ".join(stokens[1:])
+            self.perf.mark(poxperf.S_QUEUE)
 
             # event list may have worker thread events and detection OK event
             # add any state machine timer events to event list
@@ -410,13 +752,11 @@ class App(object):
             outputs = []
             events.extend(self.cvsm.check_timers())
             for event in events:
-                x = self.cvsm.crank(event)
-                outputs.extend(x)
+                self.cvsm.run(event, outputs)
             events = []
 
             # handle any actions produced by state machine
             for action in outputs:
-                assert (isinstance(action, poxfsm.SMEvent))
                 if action.code == poxfsm.SMEvent.E_SAY:
                     # issue command to say a phrase
                     self.thread_tts.post_cmd('say', action.data)
@@ -434,16 +774,19 @@ class App(object):
                     # propagate FAIL message if limit reached
                     self.s_strikes = "X" * action.data
                     if action.data == 3:
-                        events.append(poxfsm.SMEvent(poxfsm.SMEvent.E_SRFAIL))
+                        events.append(poxfsm.EV_SRFAIL)
                 elif action.code == poxfsm.SMEvent.E_XON:
                     self.external_action(True, action.data)
+                    self.freeze_replay("act")
                 elif action.code == poxfsm.SMEvent.E_XOFF:
                     self.external_action(False)
                     self.s_strikes = ""
+            self.perf.mark(poxperf.S_FSM)
 
             # update displays
             self.update_fps()
-            self.show_monitor_window(img_small, boxes, self.record_sfps)
+            if img_small is not None:
+                self.show_monitor_window(img_small, boxes, self.record_sfps)
             self.check_z()
 
             # final step is to check keys
@@ -451,44 +794,135 @@ class App(object):
             # loop might be terminated here if check returns False
             if not self.wait_and_check_keys(events):
                 break
+            self.perf.mark(poxperf.S_KEY)
+            self.perf.end()
+
+            # adjust scale from processing time (not camera wait)
+            # scale is held while recording (clips keep one frame size)
+            if adapt and self.scale_adapt and not self.is_recording():
+                x = self.scale_ctl.update(time.time() - t_frame,
+                                          self.cvx.face_w)
+                if x != img_scale:
+                    img_scale = x
+                    self.cvx.set_scale(img_scale)
+                    print "Scale:", img_scale
+            if self.profiler.active:
+                name = self.profiler.tick()
+                if name is not None:
+                    print "Profile saved:", name
 
         # loop was terminated
         # be sure any external action is also halted
         self.external_action(False)
+        if self.profiler.active:
+            print "Profile saved:", self.profiler.stop()
 
         # When everything done, release the capture
+        if grabber is not None:
+            grabber.stop()
+            print "Capture:", grabber.report()
+        else:
+            print "Frames:", vcap.k
+        poxutil.set_clock(None)
+        print "Detection:", self.cvx.report()
+        print "Motion gate:", self.gate.report()
+        print "Stage times:"
+        print self.perf.report()
+        self.recorder.stop()
+        if self.ring is not None:
+            self.ring.close()
+        print "Recording:", self.recorder.report()
         vcap.release()
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
 
     def main(self):
 
+        self.t_launch = time.time()
         print "*** Python OpenCV Example (POX) ***"
         print "OS: ", sys.platform
         print "EXE:", sys.executable
         if not self.record_ok:
             print "Recording disabled.  Path not found:", self.record_path
-
-        # lazy hard-code for the port settings
-        # (used a Keyspan USB-Serial adapter)
-        if self.thread_com.open("/dev/cu.USA19H142P1.1", 9600):
-            print "Serial Port Opened OK"
-        else:
+        if self.headless:
+            if self.control_port is None:
+                print "Headless mode.  Key commands from stdin."
+            else:
+                print "Headless mode.  Key commands from port", \
+                    self.control_port
+
+        def open_serial():
+            # lazy hard-code for the port settings
+            # (used a Keyspan USB-Serial adapter)
+            if self.thread_com.open("/dev/cu.USA19H142P1.1", 9600):
+                print "Serial Port Opened OK"
+                self.thread_com.start(self.event_queue)
+                return True
             print "Failure opening serial port!"
+            return False
 
-        if self.phrase_mgr.load("phrases.txt"):
-            print "Phrase File Loaded OK"
-        else:
+        def load_phrases():
+            if self.phrase_mgr.load("phrases.txt"):
+                print "Phrase File Loaded OK"
+                return True
             print "Failure loading phrases!"
+            return False
 
-        # just look in working folder for cascades
-        if self.cvx.load_cascades(path="./"):
-            self.thread_tts.start(self.event_queue)
-            self.thread_rec.start(self.event_queue)
-            self.thread_com.start(self.event_queue)
+        def load_eyes():
+            # eye detection is on by default so don't wait for first use
+            return startup.wait("cascades") and self.cvx.cc_eyes.load()
+
+        def print_report(tasks):
+            print "Startup:", tasks.report()
+
+        # init tasks run concurrently
+        # main loop starts as soon as face cascade and camera are ready
+        # (just look in working folder for cascades)
+        startup = poxutil.StartupTasks(print_report)
+        startup.add("serial", open_serial)
+        startup.add("phrases", load_phrases)
+        startup.add("source", self.open_source)
+        startup.add("cascades", self.cvx.load_cascades, "./")
+        if self.b_eyes:
+            startup.add("eyes", load_eyes)
+        startup.start()
+
+        self.thread_tts.start(self.event_queue)
+        self.thread_rec.start(self.event_queue)
+        self.recorder.start()
+        if self.headless:
+            self.thread_ctl.start(self.control_port)
+        # loop reports source that failed to open
+        startup.wait("source")
+        if startup.wait("cascades"):
             self.loop()
         print "DONE"
 
 
 if __name__ == '__main__':
-    app = App()
+    parser = argparse.ArgumentParser(description="Python OpenCV Example")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without monitor window")
+    parser.add_argument("--control-port", type=int, default=None,
+                        help="headless key commands from local TCP port "
+                             "instead of stdin")
+    parser.add_argument("--record-drop", choices=poxvid.DROP_POLICIES,
+                        default=poxvid.DROP_OLDEST,
+                        help="what to do with recorded frames when "
+                             "writers fall behind")
+    parser.add_argument("--record-video", action="store_true",
+                        help="record clips straight to video files "
+                             "instead of PNG frames")
+    parser.add_argument("--source", default=None,
+                        help="camera number, video file, frame directory, "
+                             "or 'synthetic' (default: camera 0)")
+    parser.add_argument("--free-run", action="store_true",
+                        help="process recorded frames as fast as possible "
+                             "with timers on frame time")
+    parser.add_argument("--detector", choices=poxdet.BACKENDS,
+                        default="haar",
+                        help="face detector backend")
+    args = parser.parse_args()
+    app = App(args.headless, args.control_port, args.record_drop,
+              args.record_video, args.source, args.detector, args.free_run)
     app.main()
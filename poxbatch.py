@@ -0,0 +1,246 @@
+#! /usr/bin/env python2.7
+
+# poxbatch.py
+
+"""POX Batch Detection
+
+Runs CVMain.detect over recorded footage (video file or directory of
+recorded img_*.png frames) to audit detection results offline.
+
+- Frames are split into shards spread over a process pool
+- Each worker loads its own cascades once and opens its own reader
+- Frames go through same scale/ROI/detect steps as the App
+- Per-frame results are saved as columns in an NPZ file
+
+Output NPZ arrays:
+    found
+    - Detection flag per frame (bool)
+    faces
+    - One row per face seen in a frame as
+      frame, track id, primary, found, x, y, w, h (int32)
+    features
+    - One row per eye/grin box as frame, track id, x1, y1, x2, y2 (int32)
+    roi
+    - ROI of scaled frame as y0, y1, x0, x1
+    shard_size
+    - Frames per shard
+
+Boxes are in ROI coordinates of the scaled frame.
+Track IDs are numbered from 1 in each shard (frame // shard_size)
+since every shard starts a new detection sequence.
+
+Example:
+    python poxbatch.py movie/ -o results.npz --workers 8
+
+"""
+
+import sys
+import argparse
+import functools
+import multiprocessing
+
+import cv2
+import numpy as np
+
+import poxcv
+import poxcompat
+import poxdet
+import poxsrc
+
+
+# per-process detector (loaded once by pool initializer)
+_worker = {}
+
+
+def count_frames(spec):
+    """
+    Returns number of frames in a video file or frame directory.
+    """
+    src = poxsrc.open_source(spec, free_run=True)
+    if isinstance(src, poxsrc.FrameDirSource):
+        return len(src.frame_paths)
+    n = int(src.vcap.get(poxcompat.CAP_PROP_FRAME_COUNT))
+    src.release()
+    return n
+
+
+def make_shards(n, shard_size):
+    """
+    Splits frame numbers into (start, stop) ranges.
+    """
+    return [(k, min(n, k + shard_size)) for k in range(0, n, shard_size)]
+
+
+def read_range(spec, start, stop):
+    """
+    Yields frames start..stop-1 of a video file or frame directory.
+    """
+    src = poxsrc.open_source(spec, free_run=True)
+    if isinstance(src, poxsrc.FrameDirSource):
+        for k in range(start, stop):
+            yield cv2.imread(src.frame_paths[k])
+    else:
+        src.vcap.set(poxcompat.CAP_PROP_POS_FRAMES, start)
+        for _ in range(start, stop):
+            ret, img = src.vcap.read()
+            if not ret:
+                break
+            yield img
+        src.release()
+
+
+def detect_range(cvx, settings, spec, start, stop):
+    """
+    Runs detection on a range of frames.
+    Detector forgets earlier frames first (same results whichever
+    shards a worker ran before).
+    :param cvx: CVMain with cascades loaded
+    :param settings: Dictionary with scale, roi, eyes, grin
+    :param spec: Video file or frame directory
+    :param start: First frame number
+    :param stop: Frame number after last
+    :return: (start, found, faces, features) with frame number
+             in first column of face and feature rows
+    """
+    n = stop - start
+    found = np.zeros(n, np.bool_)
+    faces = [np.zeros((0, 8), np.int32)]
+    features = [np.zeros((0, 6), np.int32)]
+    get_roi = functools.partial(poxcv.get_roi, perc_h=settings["roi"][0],
+                                perc_w=settings["roi"][1])
+    pool = poxcv.FramePool()
+    cvx.new_sequence()
+    for k, img in enumerate(read_range(spec, start, stop)):
+        if img is None:
+            continue
+        _, imgx = pool.prepare(img, settings["scale"], get_roi, False)
+        b_found, _ = cvx.detect(imgx, settings["eyes"], settings["grin"],
+                                pool.gray)
+        found[k] = b_found
+        for rows, table in zip((faces, features), cvx.face_table()):
+            col = np.empty((len(table), 1), np.int32)
+            col[:] = start + k
+            rows.append(np.hstack((col, table)))
+    return start, found, np.vstack(faces), np.vstack(features)
+
+
+def load_detector(cascade_path, settings):
+    """
+    Makes detector with backend and cascades from settings.
+    :param cascade_path: Directory with cascade (and model) files
+    :param settings: Dictionary with detector backend name
+    :return: CVMain or None if files failed to load
+    """
+    cvx = poxcv.CVMain()
+    cvx.set_backend(settings.get("detector", "haar"))
+    if not cvx.load_cascades(cascade_path):
+        return None
+    return cvx
+
+
+def _init_worker(cascade_path, settings):
+    # one detector per process, no OpenCV threads (pool is parallel)
+    # (never raises, pool would keep respawning failed workers)
+    cv2.setNumThreads(1)
+    _worker["cvx"] = load_detector(cascade_path, settings)
+    _worker["settings"] = settings
+    _worker["path"] = cascade_path
+
+
+def _detect_shard(args):
+    # returns (error message or None, shard result)
+    spec, start, stop = args
+    if _worker["cvx"] is None:
+        return "cascades not found in " + _worker["path"], None
+    return None, detect_range(_worker["cvx"], _worker["settings"], spec,
+                              start, stop)
+
+
+def run_batch(spec, out_path, settings, cascade_path="./", workers=None,
+              shard_size=200):
+    """
+    Runs detection over all frames on a process pool and saves results.
+    :param spec: Video file or frame directory
+    :param out_path: Output NPZ file
+    :param settings: Dictionary with scale, roi, eyes, grin
+    :param cascade_path: Directory with cascade files
+    :param workers: Number of processes (None for one per core)
+    :param shard_size: Frames per task
+    :return: Number of frames processed
+    :raise IOError: If cascades fail to load
+    """
+    # check files once here so workers are only started if they can load
+    if load_detector(cascade_path, settings) is None:
+        raise IOError("cascades not found in " + cascade_path)
+
+    n = count_frames(spec)
+    found = np.zeros(n, np.bool_)
+    faces = {}
+    features = {}
+
+    tasks = [(spec, a, b) for a, b in make_shards(n, shard_size)]
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (cascade_path, settings))
+    try:
+        for error, result in pool.imap_unordered(_detect_shard, tasks):
+            if error is not None:
+                pool.terminate()
+                raise IOError(error)
+            start, f, a, b = result
+            found[start:start + len(f)] = f
+            faces[start] = a
+            features[start] = b
+    finally:
+        pool.close()
+        pool.join()
+
+    # face and feature rows in frame order
+    order = sorted(faces)
+    faces = [np.zeros((0, 8), np.int32)] + [faces[k] for k in order]
+    features = [np.zeros((0, 6), np.int32)] + [features[k] for k in order]
+    np.savez(out_path, found=found, faces=np.vstack(faces),
+             features=np.vstack(features), roi=np.array(settings["roi"]),
+             scale=settings["scale"], shard_size=shard_size)
+    return n
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Run face detection over recorded footage.")
+    parser.add_argument("source", help="video file or frame directory")
+    parser.add_argument("-o", "--out", default="results.npz",
+                        help="output NPZ file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: one per core)")
+    parser.add_argument("--shard", type=int, default=200,
+                        help="frames per task")
+    parser.add_argument("--cascades", default="./",
+                        help="directory with cascade files")
+    parser.add_argument("--scale", type=float, default=0.5,
+                        help="image scale (same as App)")
+    parser.add_argument("--no-eyes", action="store_true",
+                        help="skip eye detection")
+    parser.add_argument("--grin", action="store_true",
+                        help="include grin detection")
+    parser.add_argument("--detector", choices=poxdet.BACKENDS,
+                        default="haar",
+                        help="face detector backend")
+    args = parser.parse_args(argv)
+
+    settings = {"scale": args.scale,
+                "roi": (0.1, 0.2),
+                "eyes": not args.no_eyes,
+                "grin": args.grin,
+                "detector": args.detector}
+    try:
+        n = run_batch(args.source, args.out, settings, args.cascades,
+                      args.workers, args.shard)
+    except IOError as e:
+        print "Batch failed:", e
+        return 1
+    print n, "frames ->", args.out
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
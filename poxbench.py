@@ -0,0 +1,632 @@
+# poxbench.py
+
+"""POX Benchmarks
+
+Run from the command line to print timing results.
+
+- HUD render time per frame (direct drawing vs. cached panel)
+- Face detection latency over a fixed corpus of frames
+  at several resolutions, image scales and eye/grin settings
+- Face detector backends side by side (speed, and agreement with a
+  reference backend as a measure of accuracy)
+- State machine events per second (transition tables vs. the
+  original if/elif crank, kept here as LegacyLoop for comparison)
+
+Detection results can be saved as a JSON baseline.  Later runs are
+compared with it and exit with an error if any case got slower
+(or allocates more) by more than a threshold.
+
+Allocations per frame are memory blocks counted by tracemalloc where
+it is available (Python 3).  Otherwise they are not counted ("-")
+and only latency is compared with the baseline.
+
+The default corpus is seeded synthetic frames (no faces so only the
+face cascade runs).  Use a directory of recorded frames with a face
+in view to measure eye and grin detection too.
+
+Examples:
+    python poxbench.py hud
+    python poxbench.py detect --save
+    python poxbench.py detect --corpus movie/ --threshold 0.1
+    python poxbench.py backends --corpus movie/ --reference dnn
+    python poxbench.py fsm
+
+"""
+
+import sys
+import argparse
+import itertools
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import pox
+import poxfsm
+import poxcv
+import poxdet
+import poxsrc
+import poxutil as pu
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# detection benchmark cases
+BENCH_SHAPES = [(240, 320), (480, 640), (720, 1280)]
+BENCH_SCALES = [0.25, 0.5, 1.0]
+BENCH_FEATURES = [(False, False), (True, False), (True, True)]
+
+
+def bench_hud(n=1000, shape=(240, 320, 3)):
+    """
+    Times HUD status rendering per frame, direct drawing vs. cached panel.
+    Status label changes every 30 frames (about once a second).
+    Also checks that both methods produce identical frames.
+    :param n: Number of frames
+    :param shape: Frame shape
+    :return: (direct ms per frame, cached ms per frame)
+    """
+    app = pox.App()
+    app.b_grin = True
+    app.s_strikes = "XX"
+    rng = np.random.RandomState(0)
+    src = rng.randint(0, 256, shape).astype(np.uint8)
+    img = np.empty_like(src)
+    results = []
+    frames = []
+    for cached in (False, True):
+        app.hud_cache_key = None
+        dt = 0.0
+        for k in range(n):
+            app.cvsm.snapshot["label"] = str((k / 30) % 10)
+            img[:] = src
+            t0 = time.time()
+            if cached:
+                app.render_hud(img, "15.0")
+            else:
+                app.draw_hud(img, "15.0")
+            dt += time.time() - t0
+        results.append(dt * 1000.0 / n)
+        frames.append(img.copy())
+    assert np.array_equal(frames[0], frames[1])
+    return tuple(results)
+
+
+def fsm_script():
+    """
+    Returns a monitoring session as a list of state machine events.
+    Mostly detections and timer events with a few speech cycles,
+    a failure, and a halt/restart at the end.
+    """
+    ev = poxfsm.SMEvent
+    script = [ev(ev.E_KEY, poxfsm.KEY_GO), poxfsm.EV_TMR_CV]
+    script.extend([poxfsm.EV_CVOK] * 50)
+    script.append(ev(ev.E_KEY, poxfsm.KEY_LISTEN))
+    for flag in (True, False, False, False):
+        script.append(poxfsm.EV_TMR_SR)
+        script.extend([poxfsm.EV_CVOK] * 20)
+        script.append(poxfsm.EV_SDONE)
+        script.extend([poxfsm.EV_CVOK] * 20)
+        script.append(ev(ev.E_RDONE, flag))
+    script.extend([poxfsm.EV_TMR_CV, poxfsm.EV_TMR_CV, poxfsm.EV_SRFAIL,
+                   poxfsm.EV_TMR_CV])
+    script.extend([poxfsm.EV_CVOK] * 50)
+    script.append(ev(ev.E_KEY, poxfsm.KEY_HALT))
+    return script
+
+
+class LegacyPhrase(object):
+    """
+    Listen-and-Repeat machine as it was before transition tables
+    (if/elif crank returning a new output list).
+    """
+    STATE_IDLE = poxfsm.SMPhrase.STATE_IDLE
+    STATE_WAIT = poxfsm.SMPhrase.STATE_WAIT
+    STATE_SPK = poxfsm.SMPhrase.STATE_SPK
+    STATE_REC = poxfsm.SMPhrase.STATE_REC
+    STATE_STOP = poxfsm.SMPhrase.STATE_STOP
+
+    def __init__(self):
+        self.state = LegacyPhrase.STATE_IDLE
+        self.timer = pu.PolledTimer()
+        self.strikes = 0
+        self.snapshot = {"color": "black"}
+
+    def _to_wait(self):
+        self.timer.start(poxfsm.SMPhrase.WAIT_TIMEOUT_SEC)
+        self.state = LegacyPhrase.STATE_WAIT
+
+    def crank(self, this_event):
+        assert (isinstance(this_event, poxfsm.SMEvent))
+        ev = poxfsm.SMEvent
+        state_outputs = []
+
+        if self.state != LegacyPhrase.STATE_IDLE:
+            if this_event.code == ev.E_STOP:
+                self.strikes = 0
+                self.timer.stop()
+                self.state = LegacyPhrase.STATE_STOP
+                return state_outputs
+
+        if self.state == LegacyPhrase.STATE_IDLE:
+            if this_event.code == ev.E_KEY:
+                if this_event.data == poxfsm.KEY_LISTEN:
+                    self._to_wait()
+                    self.snapshot["color"] = "brick"
+                    state_outputs.append(ev(ev.E_SAY, "listen and repeat"))
+        elif self.state == LegacyPhrase.STATE_WAIT:
+            if this_event.code == ev.E_TMR_SR:
+                self.timer.start(poxfsm.SMPhrase.SPK_TIMEOUT_SEC)
+                self.state = LegacyPhrase.STATE_SPK
+                state_outputs.append(ev(ev.E_SAY_REP))
+        elif self.state == LegacyPhrase.STATE_SPK:
+            if this_event.code == ev.E_TMR_SR:
+                self._to_wait()
+            elif this_event.code == ev.E_SDONE:
+                self.timer.start(poxfsm.SMPhrase.REC_TIMEOUT_SEC)
+                self.state = LegacyPhrase.STATE_REC
+                state_outputs.append(ev(ev.E_SRGO))
+        elif self.state == LegacyPhrase.STATE_REC:
+            if this_event.code == ev.E_TMR_SR:
+                self._to_wait()
+            elif this_event.code == ev.E_RDONE:
+                self._to_wait()
+                ack_strikes = 0
+                if not this_event.data:
+                    self.strikes += 1
+                    ack_strikes = self.strikes
+                else:
+                    self.strikes = 0
+                state_outputs.append(ev(ev.E_SRACK, ack_strikes))
+        elif self.state == LegacyPhrase.STATE_STOP:
+            if this_event.code == ev.E_GO:
+                self._to_wait()
+
+        return state_outputs
+
+
+class LegacyLoop(object):
+    """
+    Main face recognition machine as it was before transition tables
+    (if/elif crank returning a new output list).
+    """
+    STATE_IDLE = poxfsm.SMLoop.STATE_IDLE
+    STATE_INH = poxfsm.SMLoop.STATE_INH
+    STATE_NORM = poxfsm.SMLoop.STATE_NORM
+    STATE_WARN = poxfsm.SMLoop.STATE_WARN
+    STATE_ACT = poxfsm.SMLoop.STATE_ACT
+
+    def __init__(self):
+        self.state = LegacyLoop.STATE_IDLE
+        self.cv_timer = pu.PolledTimer()
+        self.psm = LegacyPhrase()
+        self.level = 0
+
+    def _to_norm(self):
+        self.cv_timer.start(poxfsm.SMLoop.NORM_TIMEOUT_SEC)
+        self.state = LegacyLoop.STATE_NORM
+
+    def _to_act(self, temp_outputs):
+        ev = poxfsm.SMEvent
+        self.cv_timer.start(poxfsm.SMLoop.ACT_TIMEOUT_SEC)
+        self.state = LegacyLoop.STATE_ACT
+        if self.level < poxfsm.MAX_LEVEL:
+            self.level += 1
+        temp_outputs.extend(self.psm.crank(ev(ev.E_STOP)))
+        temp_outputs.append(ev(ev.E_XON, self.level))
+
+    def crank(self, this_event):
+        assert (isinstance(this_event, poxfsm.SMEvent))
+        ev = poxfsm.SMEvent
+        state_outputs = []
+
+        if self.state != LegacyLoop.STATE_IDLE:
+            if this_event.code == ev.E_KEY:
+                if this_event.data == poxfsm.KEY_HALT:
+                    self.cv_timer.stop()
+                    self.level = 0
+                    self.state = LegacyLoop.STATE_IDLE
+                    self.psm = LegacyPhrase()
+                    state_outputs.append(ev(ev.E_XOFF))
+                    state_outputs.append(ev(ev.E_SAY, "session halted"))
+                    return state_outputs
+
+        if self.state == LegacyLoop.STATE_IDLE:
+            if this_event.code == ev.E_KEY:
+                if this_event.data == poxfsm.KEY_GO:
+                    self.cv_timer.start(poxfsm.SMLoop.INH_TIMEOUT_SEC)
+                    self.state = LegacyLoop.STATE_INH
+                    state_outputs.append(ev(ev.E_SAY, "get ready"))
+        elif self.state == LegacyLoop.STATE_INH:
+            if this_event.code == ev.E_TMR_CV:
+                self._to_norm()
+                state_outputs.append(ev(ev.E_SAY, "go"))
+        elif self.state == LegacyLoop.STATE_NORM:
+            state_outputs.extend(self.psm.crank(this_event))
+            if this_event.code == ev.E_CVOK:
+                self._to_norm()
+            elif this_event.code == ev.E_TMR_CV:
+                self.cv_timer.start(poxfsm.SMLoop.WARN_TIMEOUT_SEC)
+                self.state = LegacyLoop.STATE_WARN
+            elif this_event.code == ev.E_SRFAIL:
+                self._to_act(state_outputs)
+        elif self.state == LegacyLoop.STATE_WARN:
+            state_outputs.extend(self.psm.crank(this_event))
+            if this_event.code == ev.E_CVOK:
+                self._to_norm()
+            elif this_event.code == ev.E_TMR_CV:
+                self._to_act(state_outputs)
+            elif this_event.code == ev.E_SRFAIL:
+                self._to_act(state_outputs)
+        elif self.state == LegacyLoop.STATE_ACT:
+            if this_event.code == ev.E_TMR_CV:
+                self._to_norm()
+                state_outputs.extend(self.psm.crank(ev(ev.E_GO)))
+                state_outputs.append(ev(ev.E_XOFF))
+
+        return state_outputs
+
+
+def _legacy_session(script):
+    # one session with if/elif crank (as main loop used to run it)
+    sm = LegacyLoop()
+    outputs = []
+    for event in script:
+        outputs.extend(sm.crank(event))
+    return outputs
+
+
+def _table_session(script):
+    # one session with transition tables (as main loop runs it now)
+    sm = poxfsm.SMLoop()
+    outputs = []
+    for event in script:
+        sm.run(event, outputs)
+    return outputs
+
+
+def bench_fsm(n=2000, repeat=5):
+    """
+    Times scripted sessions with the original if/elif crank
+    and with the transition tables.
+    :param n: Number of sessions per run
+    :param repeat: Number of runs (fastest is kept)
+    :return: Dictionary with events per second for "legacy" and "table"
+             and output (code, data) sequence of a session for each
+    """
+    script = fsm_script()
+    results = {}
+    for name, session in (("legacy", _legacy_session),
+                          ("table", _table_session)):
+        outputs = []
+        dt_best = None
+        for _ in range(repeat):
+            t0 = time.time()
+            for _ in range(n):
+                outputs = session(script)
+            dt = time.time() - t0
+            if dt_best is None or dt < dt_best:
+                dt_best = dt
+        results[name] = n * len(script) / max(dt_best, 1e-9)
+        results[name + "_outputs"] = [(x.code, x.data) for x in outputs]
+    return results
+
+
+def load_corpus(n=30, path=None):
+    """
+    Loads fixed set of benchmark frames.
+    :param n: Number of frames
+    :param path: Directory of recorded frames (None for synthetic frames)
+    :return: List of images
+    """
+    if path is None:
+        src = poxsrc.SyntheticSource(n=n, seed=0)
+    else:
+        src = poxsrc.FrameDirSource(path, free_run=True)
+    frames = []
+    while len(frames) < n:
+        ret, img = src.read()
+        if not ret:
+            break
+        frames.append(img)
+    return frames
+
+
+def case_name(shape, scale, use_eyes, use_grin):
+    return "{0}x{1}_s{2}_e{3:d}_g{4:d}".format(
+        shape[1], shape[0], scale, use_eyes, use_grin)
+
+
+def get_roi(h, w):
+    # same as App with default percentages
+    return poxcv.get_roi(h, w, 0.1, 0.2)
+
+
+def bench_case(cvx, frames, scale, use_eyes, use_grin, warmup=3):
+    """
+    Times CVMain.detect on each frame with same ROI steps as App.
+    Detector starts a new sequence at the case scale (so results do not
+    depend on cases run before) and gets its old scale back after.
+    :param cvx: CVMain with cascades loaded
+    :param frames: List of images (all same shape)
+    :param scale: Image scale
+    :param use_eyes: Eye detection flag
+    :param use_grin: Grin detection flag
+    :param warmup: Number of untimed calls before timing starts
+    :return: Dictionary of results
+    """
+    scale_old = cvx.scale
+    cvx.new_sequence()
+    cvx.set_scale(scale)
+    try:
+        return _bench_case(cvx, frames, scale, use_eyes, use_grin, warmup)
+    finally:
+        cvx.set_scale(scale_old)
+
+
+def _bench_case(cvx, frames, scale, use_eyes, use_grin, warmup):
+    # implements bench_case (detector is ready for this case)
+    pool = poxcv.FramePool()
+
+    def run(img):
+        _, imgx = pool.prepare(img, scale, get_roi, False)
+        return cvx.detect(imgx, use_eyes, use_grin, pool.gray)
+
+    for img in frames[:warmup]:
+        run(img)
+
+    dts = []
+    ct_found = 0
+    for img in frames:
+        t0 = time.time()
+        b_found, _ = run(img)
+        dts.append(time.time() - t0)
+        ct_found += int(b_found)
+
+    # allocation count is a separate pass so tracing does not skew times
+    allocs = None
+    alloc_unit = None
+    if tracemalloc is not None:
+        alloc_unit = "blocks"
+        tracemalloc.start()
+        snap0 = tracemalloc.take_snapshot()
+        for img in frames:
+            run(img)
+        snap1 = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = snap1.compare_to(snap0, "filename")
+        allocs = sum(max(0, st.count_diff) for st in stats) / len(frames)
+
+    ms = np.array(dts) * 1000.0
+    return {"p50": float(np.percentile(ms, 50)),
+            "p90": float(np.percentile(ms, 90)),
+            "p99": float(np.percentile(ms, 99)),
+            "fps": float(len(dts) / max(sum(dts), 1e-9)),
+            "allocs": allocs,
+            "alloc_unit": alloc_unit,
+            "found": ct_found}
+
+
+def bench_detect(cvx, frames, shapes=BENCH_SHAPES, scales=BENCH_SCALES,
+                 features=BENCH_FEATURES):
+    """
+    Runs all detection benchmark cases.
+    Corpus frames are resized to each benchmark resolution.
+    :param cvx: CVMain with cascades loaded
+    :param frames: List of images
+    :return: Dictionary of results for each case name
+    """
+    results = {}
+    for shape in shapes:
+        sized = [cv2.resize(img, (shape[1], shape[0])) for img in frames]
+        for scale, (use_eyes, use_grin) in itertools.product(scales,
+                                                             features):
+            name = case_name(shape, scale, use_eyes, use_grin)
+            results[name] = bench_case(cvx, sized, scale, use_eyes, use_grin)
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Finds cases that are slower or allocate more than baseline.
+    Median and 90th percentile latency are checked.
+    Allocations are checked only if both runs counted them
+    the same way.
+    :param results: Dictionary of results for each case name
+    :param baseline: Dictionary of baseline results for each case name
+    :param threshold: Allowed fractional increase, e.g. 0.2 for 20%
+    :return: List of regression description strings
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for key in ("p50", "p90", "allocs"):
+            new = results[name].get(key)
+            old = baseline[name].get(key)
+            if new is None or old is None:
+                continue
+            if key == "allocs" and results[name].get("alloc_unit") != \
+                    baseline[name].get("alloc_unit"):
+                continue
+            # tiny absolute changes are just timer noise
+            if new > old * (1.0 + threshold) and new - old > 0.01:
+                regressions.append("{0} {1}: {2:.3f} -> {3:.3f}".format(
+                    name, key, old, new))
+    return regressions
+
+
+def run_backend(cvx, frames, scale=0.5):
+    """
+    Times face detector backend on each frame (ROI steps same as App).
+    :param cvx: CVMain with backend loaded
+    :param frames: List of images
+    :param scale: Image scale
+    :return: (list of seconds per frame, list of face lists per frame)
+    """
+    pool = poxcv.FramePool()
+    dts = []
+    found = []
+    for img in frames:
+        _, imgx = pool.prepare(img, scale, get_roi, False)
+        r = cv2.cvtColor(imgx, cv2.COLOR_BGR2GRAY, dst=pool.gray)
+        cv2.equalizeHist(r, r)
+        t0 = time.time()
+        x = cvx.backend.prepare(imgx, r)
+        faces = cvx.backend.find(x, cvx.face_scale, cvx.face_neighbors,
+                                 cvx.size_face)
+        dts.append(time.time() - t0)
+        found.append(faces)
+    return dts, found
+
+
+def bench_backends(detectors, frames, reference, min_iou=0.5):
+    """
+    Runs each backend on same frames and compares its faces with
+    faces from reference backend.
+    :param detectors: Dictionary of CVMain (backend loaded) for each name
+    :param frames: List of images
+    :param reference: Name of reference backend
+    :param min_iou: Overlap for a face to match a reference face
+    :return: Dictionary of results for each backend name
+    """
+    runs = dict((name, run_backend(cvx, frames))
+                for name, cvx in detectors.items())
+    ref_faces = runs[reference][1]
+    results = {}
+    for name, (dts, found) in runs.items():
+        ct_match = 0
+        for faces, refs in zip(found, ref_faces):
+            for ref in refs:
+                if any(poxcv.rect_iou(f, ref) >= min_iou for f in faces):
+                    ct_match += 1
+        ct_ref = sum(len(x) for x in ref_faces)
+        ct_found = sum(len(x) for x in found)
+        ms = np.array(dts) * 1000.0
+        results[name] = {
+            "p50": float(np.percentile(ms, 50)),
+            "p90": float(np.percentile(ms, 90)),
+            "fps": float(len(dts) / max(sum(dts), 1e-9)),
+            "faces": ct_found,
+            "recall": float(ct_match) / ct_ref if ct_ref else None,
+            "precision": float(ct_match) / ct_found if ct_found else None}
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run POX benchmarks.")
+    parser.add_argument("bench",
+                        choices=["hud", "detect", "backends", "fsm"])
+    parser.add_argument("-n", type=int, default=30,
+                        help="number of corpus frames")
+    parser.add_argument("--corpus", default=None,
+                        help="directory of recorded frames")
+    parser.add_argument("--cascades", default="./",
+                        help="directory with cascade files")
+    parser.add_argument("--baseline", default="poxbench.json",
+                        help="JSON baseline file")
+    parser.add_argument("--save", action="store_true",
+                        help="save results as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed fractional slowdown")
+    parser.add_argument("--reference", default="haar",
+                        choices=poxdet.BACKENDS,
+                        help="backend that others are compared with")
+    args = parser.parse_args(argv)
+
+    if args.bench == "hud":
+        ms_direct, ms_cached = bench_hud()
+        print "HUD direct: {0:.3f} ms/frame".format(ms_direct)
+        print "HUD cached: {0:.3f} ms/frame".format(ms_cached)
+        return 0
+
+    if args.bench == "fsm":
+        results = bench_fsm()
+        for name in ("legacy", "table"):
+            print "FSM {0}: {1:.0f} events/s ({2} outputs per session)".format(
+                name, results[name], len(results[name + "_outputs"]))
+        print "FSM table/legacy: {0:.2f}x".format(
+            results["table"] / max(results["legacy"], 1e-9))
+        if results["table_outputs"] != results["legacy_outputs"]:
+            print "FSM outputs differ!"
+            return 1
+        return 0
+
+    if args.bench == "backends":
+        frames = load_corpus(args.n, args.corpus)
+        detectors = {}
+        for name in poxdet.BACKENDS:
+            cvx = poxcv.CVMain()
+            cvx.set_backend(name)
+            if cvx.load_cascades(args.cascades):
+                detectors[name] = cvx
+        if args.reference not in detectors or not frames:
+            print "Reference backend or corpus not available"
+            return 1
+        results = bench_backends(detectors, frames, args.reference)
+        print "{0:8} {1:>8} {2:>8} {3:>7} {4:>6} {5:>7} {6:>9}".format(
+            "backend", "p50 ms", "p90 ms", "fps", "faces", "recall",
+            "precision")
+
+        def fmt(x):
+            return "-" if x is None else "{0:.2f}".format(x)
+
+        for name in poxdet.BACKENDS:
+            if name in results:
+                r = results[name]
+                print "{0:8} {1:8.2f} {2:8.2f} {3:7.1f} {4:6} {5:>7} " \
+                      "{6:>9}".format(name, r["p50"], r["p90"], r["fps"],
+                                      r["faces"], fmt(r["recall"]),
+                                      fmt(r["precision"]))
+        print "(recall and precision vs.", args.reference + ")"
+        return 0
+
+    cvx = poxcv.CVMain()
+    if not cvx.load_cascades(args.cascades):
+        print "Failed to load cascades from", args.cascades
+        return 1
+    frames = load_corpus(args.n, args.corpus)
+    if not frames:
+        print "No corpus frames"
+        return 1
+
+    results = bench_detect(cvx, frames)
+    print "{0:24} {1:>8} {2:>8} {3:>8} {4:>7} {5:>7} {6:>5}".format(
+        "case", "p50 ms", "p90 ms", "p99 ms", "fps", "allocs", "found")
+    for name in sorted(results):
+        r = results[name]
+        allocs = "-" if r["allocs"] is None else "{0:.2f}".format(r["allocs"])
+        print "{0:24} {1:8.2f} {2:8.2f} {3:8.2f} {4:7.1f} {5:>7} " \
+              "{6:5}".format(name, r["p50"], r["p90"], r["p99"], r["fps"],
+                             allocs, r["found"])
+
+    if tracemalloc is not None:
+        print "(allocs are memory blocks per frame)"
+    else:
+        print "(allocs not counted, tracemalloc needs Python 3)"
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print "Baseline saved:", args.baseline
+        return 0
+
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for s in regressions:
+            print "REGRESSION", s
+        if regressions:
+            return 1
+        print "No regressions vs.", args.baseline
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+# poxcap.py
+
+"""POX Frame Capture stuff
+
+The FrameGrabber class reads frames from a capture device on its own
+thread so camera latency does not add to the time spent in the main loop.
+
+- Small ring of newest frames (oldest are dropped when ring is full)
+- Main loop always takes the freshest frame (stale ones are dropped)
+- Drop counts and capture-to-process latency for diagnostics
+
+"""
+
+import threading
+import collections
+import time
+
+
+class FrameGrabber(object):
+    """
+    Wraps an opened capture device (anything with read() and release()).
+    """
+
+    def __init__(self, vcap, depth=2):
+        """
+        Initializes grabber (not started).
+        :param vcap: Opened capture device, e.g. cv2.VideoCapture
+        :param depth: Number of newest frames kept in ring
+        """
+        self.vcap = vcap
+        self._ring = collections.deque(maxlen=max(1, depth))
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        # diagnostics
+        self.ct_grab = 0  # frames read from device
+        self.ct_drop = 0  # frames never taken by main loop
+        self.ct_fail = 0  # failed reads
+        self.ct_take = 0  # frames taken by main loop
+        self.t = 0.0  # capture time of last frame taken
+        self.latency = 0.0  # capture-to-process of last frame taken
+        self.latency_max = 0.0
+        self._latency_sum = 0.0
+
+    def start(self):
+        """
+        Starts capture thread.
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._thread_function)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops capture thread.  Device is not released.
+        """
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def read(self, timeout=1.0):
+        """
+        Takes freshest frame from ring and discards any older ones.
+        Blocks until a frame is available or timeout expires.
+        :param timeout: Seconds to wait for a frame
+        :return: (ret, img) same as cv2.VideoCapture.read()
+        """
+        with self._cond:
+            if not len(self._ring):
+                self._cond.wait(timeout)
+            if not len(self._ring):
+                return False, None
+            img, t = self._ring.pop()
+            self.ct_drop += len(self._ring)
+            self._ring.clear()
+
+        self.ct_take += 1
+        self.t = t
+        self.latency = time.time() - t
+        self.latency_max = max(self.latency_max, self.latency)
+        self._latency_sum += self.latency
+        return True, img
+
+    def report(self):
+        """
+        Returns summary of capture diagnostics.
+        :return: string
+        """
+        latency_avg = 0.0
+        if self.ct_take:
+            latency_avg = self._latency_sum / self.ct_take
+        return "grab={0} take={1} drop={2} fail={3} " \
+               "latency avg={4:.1f}ms max={5:.1f}ms".format(
+                   self.ct_grab, self.ct_take, self.ct_drop, self.ct_fail,
+                   latency_avg * 1000.0, self.latency_max * 1000.0)
+
+    def _thread_function(self):
+        """
+        Implements capture loop.
+        - Reads frame from device (this blocks)
+        - Stamps it with capture time
+        - Pushes it into ring, dropping oldest if full
+        """
+        while self._running:
+            ret, img = self.vcap.read()
+            t = time.time()
+            if not ret:
+                self.ct_fail += 1
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                self.ct_grab += 1
+                if len(self._ring) == self._ring.maxlen:
+                    self.ct_drop += 1
+                self._ring.append((img, t))
+                self._cond.notify()
@@ -0,0 +1,27 @@
+# poxcompat.py
+
+"""POX OpenCV Compatibility stuff
+
+Constants and functions that moved when OpenCV 3.0 dropped
+the cv2.cv module.  Use these instead of cv2.cv so the same code runs
+on OpenCV 2.4 and on 3.x/4.x (needed for the DNN face detector).
+
+"""
+
+import cv2
+
+
+if hasattr(cv2, "cv"):
+    # OpenCV 2.4
+    FILLED = cv2.cv.CV_FILLED
+    CAP_PROP_FPS = cv2.cv.CV_CAP_PROP_FPS
+    CAP_PROP_FRAME_COUNT = cv2.cv.CV_CAP_PROP_FRAME_COUNT
+    CAP_PROP_POS_FRAMES = cv2.cv.CV_CAP_PROP_POS_FRAMES
+    fourcc = cv2.cv.CV_FOURCC
+else:
+    # OpenCV 3.0 or later
+    FILLED = cv2.FILLED
+    CAP_PROP_FPS = cv2.CAP_PROP_FPS
+    CAP_PROP_FRAME_COUNT = cv2.CAP_PROP_FRAME_COUNT
+    CAP_PROP_POS_FRAMES = cv2.CAP_PROP_POS_FRAMES
+    fourcc = cv2.VideoWriter_fourcc
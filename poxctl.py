@@ -0,0 +1,112 @@
+# poxctl.py
+
+"""POX Control Input stuff
+
+The ControlDaemon class is a daemon for taking keyboard commands
+when there is no monitor window (headless mode).  Commands come from
+stdin or from a control socket on the local host.
+
+Commands are lines of text.  Each character in a line is handled
+as a key press in the monitor window would be.
+
+Input Commands:
+    <keys>
+    - One or more key characters, e.g. "g" or "1V".
+    esc
+    - Same as ESC key (quit).
+    prof
+    - Same as F key (start/stop profiling).
+
+Example with control socket on port 5050:
+    echo g | nc localhost 5050
+
+"""
+
+import sys
+import socket
+import threading
+import Queue
+
+
+KEY_ESC = 27
+
+# command words handled as a single key
+NAMED_KEYS = {"esc": KEY_ESC,
+              "prof": ord('F')}
+
+
+class ControlDaemon(object):
+
+    def __init__(self):
+        self._key_queue = Queue.Queue()
+        self._cmd_thread = None
+        self.port = None
+
+    def start(self, port=None):
+        """
+        Starts daemon thread.
+        :param port: TCP port for local control socket, None for stdin
+        """
+        self.port = port
+        if port is None:
+            target = self._stdin_function
+        else:
+            target = self._socket_function
+        self._cmd_thread = threading.Thread(target=target)
+        self._cmd_thread.setDaemon(True)
+        self._cmd_thread.start()
+
+    def post_line(self, line):
+        """
+        Converts a command line to key presses.
+        :param line: Command string
+        """
+        s = line.strip()
+        if s.lower() in NAMED_KEYS:
+            self._key_queue.put(NAMED_KEYS[s.lower()])
+        else:
+            for c in s:
+                self._key_queue.put(ord(c))
+
+    def poll_key(self):
+        """
+        Returns next key press without blocking.
+        :return: Key code, or -1 if none (same as cv2.waitKey)
+        """
+        try:
+            key = self._key_queue.get_nowait()
+            self._key_queue.task_done()
+        except Queue.Empty:
+            key = -1
+        return key
+
+    def _stdin_function(self):
+        """
+        Implements daemon loop for stdin (ends at EOF).
+        """
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                break
+            self.post_line(line)
+
+    def _socket_function(self):
+        """
+        Implements daemon loop for control socket.
+        - Accepts one local connection at a time
+        - Reads command lines until connection is closed
+        """
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", self.port))
+        server.listen(1)
+        while True:
+            conn, _ = server.accept()
+            f = conn.makefile("r")
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                self.post_line(line)
+            f.close()
+            conn.close()
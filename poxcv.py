@@ -3,29 +3,488 @@
 """POX Main Computer Vision stuff
 
 The CVMain class wraps the Python OpenCV functionality.
+The FramePool class owns preallocated buffers for the frame pipeline.
 
 - Cascade Initialization
 - Single pass of Face, Eye, and Grin finder
+- Optional detect-then-track mode for the faces
+- Optional search windows around last face locations
+- Start-up calibration of face detection settings
 
 """
 
+import os
+import json
+import itertools
+import threading
+import multiprocessing.pool
+import time
+
 import cv2
+import numpy as np
+
+import poxdet
+import poxperf
+
+
+class LazyCascade(object):
+    """
+    Cascade classifier that is loaded from its file when first used
+    (or when load() is called, e.g. from a startup thread).
+    """
+
+    def __init__(self, fname=None):
+        self.fname = fname
+        self._cc = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Loads cascade file if not already loaded.
+        :return: True if loaded
+        """
+        with self._lock:
+            if self._cc is None and self.fname is not None:
+                cc = cv2.CascadeClassifier()
+                if cc.load(self.fname):
+                    self._cc = cc
+                else:
+                    print "Cascade data failed to open:", self.fname
+                    self.fname = None
+        return self._cc is not None
+
+    def detectMultiScale(self, *args):
+        if self._cc is None and not self.load():
+            return []
+        return self._cc.detectMultiScale(*args)
+
+
+def get_roi(h, w, perc_h, perc_w):
+    """
+    Given source image dimensions, returns X and Y
+    coordinates for region-of-interest based on
+    percentages for chopping top/bottom and left/right.
+
+    :param h: Height of source image
+    :param w: Width of source image
+    :param perc_h: Fraction chopped from top and bottom (0.0 - 0.5)
+    :param perc_w: Fraction chopped from left and right (0.0 - 0.5)
+    :return: (y0, y1, x0, x1)
+    """
+    return (int(perc_h * h), int((1 - perc_h) * h),
+            int(perc_w * w), int((1 - perc_w) * w))
+
+
+def spread_order(n):
+    """
+    Returns indices 0..n-1 in an order that covers the whole range early
+    (0, n/2, n/4, 3n/4, n/8, ...).
+    """
+    step = 1
+    while step < n:
+        step *= 2
+    order = []
+    seen = set()
+    while step >= 1:
+        for k in range(0, n, step):
+            if k not in seen:
+                seen.add(k)
+                order.append(k)
+        step //= 2
+    return order
+
+
+def scale_rect(rect, ratio):
+    """
+    Returns (x, y, w, h) rectangle scaled by a ratio.
+    """
+    return tuple([int(round(v * ratio)) for v in rect])
+
+
+def rect_iou(a, b):
+    """
+    Returns intersection-over-union of two (x, y, w, h) rectangles.
+    """
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = float(w * h)
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+class FaceTrack(object):
+    """
+    A face followed from frame to frame.
+    """
+
+    def __init__(self, track_id, rect):
+        self.id = track_id
+        self.rect = rect  # (x, y, w, h)
+        self.missing = 0  # frames since last seen
+        self.found = False  # all desired features found at last search
+        self.feature_boxes = []  # eye/grin boxes from last search
+        self.eyes = None  # last eye result (found, boxes, rect, frame)
+        self.grin = None  # last grin result (found, boxes, rect, frame)
+
+
+class FaceTracks(object):
+    """
+    Gives faces stable IDs from frame to frame and picks primary subject.
+    - Faces are matched to tracks by overlap (best matches first)
+    - Tracks not seen for a few frames are dropped
+    - Primary subject stays same while its track lives,
+      otherwise it is the biggest face
+    """
+
+    def __init__(self, min_iou=0.3, max_missing=5):
+        self.min_iou = min_iou
+        self.max_missing = max_missing
+        self.tracks = []
+        self.primary = None
+        self._next_id = 1
+
+    def reset(self):
+        self.tracks = []
+        self.primary = None
+        self._next_id = 1
+
+    def rescale(self, ratio):
+        """
+        Scales tracked faces for a new working image scale.
+        Tracks keep their IDs, eyes/grin are sought again.
+        :param ratio: New scale / old scale
+        """
+        for track in self.tracks:
+            track.rect = scale_rect(track.rect, ratio)
+            track.feature_boxes = [
+                [scale_rect(p1, ratio), scale_rect(p2, ratio)]
+                for p1, p2 in track.feature_boxes]
+            track.eyes = None
+            track.grin = None
+
+    def update(self, rects):
+        """
+        Matches faces in a new frame with tracks.
+        :param rects: List of (x, y, w, h) face rectangles
+        :return: List of tracks seen in this frame (same order as rects)
+        """
+        pairs = []
+        for i, rect in enumerate(rects):
+            for track in self.tracks:
+                x = rect_iou(rect, track.rect)
+                if x >= self.min_iou:
+                    pairs.append((x, i, track))
+        pairs.sort(key=lambda p: p[0], reverse=True)
+
+        seen = [None] * len(rects)
+        matched = set()
+        for _, i, track in pairs:
+            if seen[i] is None and track.id not in matched:
+                seen[i] = track
+                matched.add(track.id)
+                track.rect = rects[i]
+                track.missing = 0
+
+        for track in self.tracks:
+            if track.id not in matched:
+                track.missing += 1
+        self.tracks = [t for t in self.tracks
+                       if t.missing <= self.max_missing]
+
+        for i, rect in enumerate(rects):
+            if seen[i] is None:
+                seen[i] = FaceTrack(self._next_id, rect)
+                self._next_id += 1
+                self.tracks.append(seen[i])
+
+        if self.primary not in self.tracks:
+            self.primary = None
+            if seen:
+                self.primary = max(seen, key=lambda t: t.rect[2] * t.rect[3])
+        return seen
+
+
+class FramePool(object):
+    """
+    Owns preallocated destination arrays for each stage of the
+    frame pipeline.  Buffers are sized once per input resolution
+    and scale, then reused so steady-state frames allocate nothing.
+    """
+
+    def __init__(self):
+        self.small = None  # scaled frame for display/recording
+        self.roi = None  # scaled ROI when there is no display frame
+        self.gray = None  # gray ROI for detection
+        self._key = None
+        self._dsize = None
+        self._roi_full = None
+        self._roi_small = None
+
+    def _alloc(self, img, scale, get_roi):
+        # size all buffers for this resolution and scale
+        h, w = img.shape[:2]
+        hs = int(round(h * scale))
+        ws = int(round(w * scale))
+        h1, h2, w1, w2 = get_roi(hs, ws)
+        self._dsize = (ws, hs)
+        self._roi_small = (h1, h2, w1, w2)
+        self._roi_full = (int(h1 / scale), int(h2 / scale),
+                          int(w1 / scale), int(w2 / scale))
+        self.small = np.zeros((hs, ws) + img.shape[2:], img.dtype)
+        self.roi = np.zeros((h2 - h1, w2 - w1) + img.shape[2:], img.dtype)
+        self.gray = np.zeros((h2 - h1, w2 - w1), img.dtype)
+        self._key = (img.shape, scale)
+
+    def prepare(self, img, scale, get_roi, display=True):
+        """
+        Scales frame and extracts ROI into preallocated buffers.
+        If there is no display frame then ROI is cropped before scaling.
+        :param img: Full size camera frame
+        :param scale: Scale factor for working images
+        :param get_roi: Function (h, w) -> (y0, y1, x0, x1)
+        :param display: True if scaled full frame is needed
+        :return: (scaled frame or None, scaled ROI)
+        """
+        if self._key != (img.shape, scale):
+            self._alloc(img, scale, get_roi)
+
+        if display:
+            # ROI is a view into scaled frame (no extra resize)
+            h1, h2, w1, w2 = self._roi_small
+            cv2.resize(img, self._dsize, dst=self.small)
+            return self.small, self.small[h1:h2, w1:w2]
+
+        # crop first then only scale what detection needs
+        h1, h2, w1, w2 = self._roi_full
+        hr, wr = self.roi.shape[:2]
+        cv2.resize(img[h1:h2, w1:w2], (wr, hr), dst=self.roi)
+        return None, self.roi
+
+
+class ScaleController(object):
+    """
+    Adjusts working image scale to hold a target frame rate.
+    - Scale goes down when loop is slower than target or when face
+      is much bigger than cascades need (as long as face stays big enough)
+    - Scale goes up when loop has time to spare and face is small
+      or not seen (far faces need more pixels)
+    - Changes are in fixed steps with a hold time after each change
+      (each new scale means new frame buffers)
+    """
+
+    def __init__(self, scale=0.5, target_fps=15.0, min_scale=0.25,
+                 max_scale=1.0, step=0.05, hold=30, face_min=50,
+                 face_max=120, alpha=0.1):
+        """
+        Initializes controller.
+        :param scale: Starting scale
+        :param target_fps: Desired loop rate
+        :param min_scale: Lowest allowed scale
+        :param max_scale: Highest allowed scale
+        :param step: Scale change per adjustment
+        :param hold: Frames to wait after each change
+        :param face_min: Face width (pixels at working scale) to keep
+        :param face_max: Face width above which scale can go down
+        :param alpha: Weight of newest frame in average loop time
+        """
+        self.scale = scale
+        self.target_fps = target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.step = step
+        self.hold = hold
+        self.face_min = face_min
+        self.face_max = face_max
+        self.alpha = alpha
+        self.dt_avg = None
+        self.ct_change = 0
+        self._k = 0
+
+    def update(self, dt, face_w):
+        """
+        Applies measurement from one loop iteration.
+        :param dt: Loop time (seconds)
+        :param face_w: Face width at working scale (0 if none)
+        :return: Scale for next frame
+        """
+        if self.dt_avg is None:
+            self.dt_avg = dt
+        self.dt_avg += self.alpha * (dt - self.dt_avg)
+        self._k += 1
+        if self._k < self.hold:
+            return self.scale
+
+        t_target = 1.0 / self.target_fps
+        down = self.scale - self.step
+        up = self.scale + self.step
+        face_ok = face_w == 0 or face_w * down / self.scale >= self.face_min
+        new = self.scale
+        if (self.dt_avg > t_target * 1.1 or face_w > self.face_max) and \
+                face_ok:
+            new = down
+        elif self.dt_avg < t_target * 0.75 and face_w < self.face_min:
+            new = up
+
+        new = round(min(self.max_scale, max(self.min_scale, new)), 2)
+        if new != self.scale:
+            self.scale = new
+            self.ct_change += 1
+            self.dt_avg = None
+            self._k = 0
+        return self.scale
+
+
+class MotionGate(object):
+    """
+    Decides if detection can be skipped because nothing has moved.
+    - Frame is shrunk to a tiny gray image and compared with the one
+      from the last full detection (NumPy difference, no loops)
+    - Last result is reused only if it was positive
+    - Full detection is forced at a minimum interval so state machine
+      timers still see fresh results
+    """
+
+    def __init__(self, width=32, pixel_diff=12, min_changed=0.01,
+                 max_reuse_sec=0.5):
+        """
+        Initializes gate.
+        :param width: Width of tiny comparison image
+        :param pixel_diff: Gray level change that counts as changed pixel
+        :param min_changed: Fraction of changed pixels that counts as motion
+        :param max_reuse_sec: Longest time a result may be reused
+        """
+        self.width = width
+        self.pixel_diff = pixel_diff
+        self.min_changed = min_changed
+        self.max_reuse_sec = max_reuse_sec
+        self.last = (False, [])
+        self.ct_run = 0
+        self.ct_skip = 0
+        self._t = 0.0
+        self._small = None
+        self._cur = None
+        self._ref = None
+        self._diff = None
+
+    def check(self, img, t):
+        """
+        Compares frame with frame from last full detection.
+        :param img: BGR image that would go to detection
+        :param t: Frame time
+        :return: True if last result can be reused
+        """
+        h, w = img.shape[:2]
+        hs = max(1, (h * self.width) / w)
+        if self._cur is None or self._cur.shape != (hs, self.width):
+            self._small = np.zeros((hs, self.width, 3), np.uint8)
+            self._cur = np.zeros((hs, self.width), np.uint8)
+            self._diff = np.zeros((hs, self.width), np.int16)
+            self._ref = None
+        cv2.resize(img, (self.width, hs), dst=self._small,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._cur)
+
+        if self._ref is None or not self.last[0]:
+            return False
+        if t - self._t >= self.max_reuse_sec:
+            return False
+        np.subtract(self._cur, self._ref, out=self._diff, dtype=np.int16)
+        np.abs(self._diff, out=self._diff)
+        changed = np.count_nonzero(self._diff > self.pixel_diff)
+        if changed > self.min_changed * self._diff.size:
+            return False
+        self.ct_skip += 1
+        return True
+
+    def reset(self):
+        """
+        Forgets reference frame and last result so next frame
+        gets full detection (e.g. when gate is turned back on).
+        """
+        self.last = (False, [])
+        self._ref = None
+
+    def store(self, b_found, boxes, t):
+        """
+        Keeps result of full detection for last checked frame.
+        Last checked frame becomes reference for motion.
+        :param b_found: Detection flag
+        :param boxes: Detection boxes
+        :param t: Frame time
+        """
+        self.last = (b_found, boxes)
+        self._t = t
+        self.ct_run += 1
+        if self._cur is None:
+            return
+        if self._ref is None:
+            self._ref = self._cur.copy()
+        else:
+            self._ref[:] = self._cur
+
+    def report(self):
+        """
+        Returns summary of gate counters.
+        :return: string
+        """
+        ct = self.ct_run + self.ct_skip
+        rate = float(self.ct_skip) / ct if ct else 0.0
+        return "run={0} skip={1} skip_rate={2:.2f}".format(
+            self.ct_run, self.ct_skip, rate)
 
 
 class CVMain(object):
 
+    # candidate face detection settings tried by calibrate()
+    CAL_SCALES = (1.05, 1.1, 1.2, 1.3)
+    CAL_NEIGHBORS = (2, 3, 4)
+    CAL_SIZES = (40, 60, 80, 100)
+
     def __init__(self):
 
-        self.cc_face = cv2.CascadeClassifier()
-        self.cc_eyes = cv2.CascadeClassifier()
-        self.cc_grin = cv2.CascadeClassifier()
+        # face detector backend is needed for first frame
+        # eye/grin cascades are loaded when first used
+        self.backend = poxdet.CascadeBackend("haar")
+        self.cc_eyes = LazyCascade()
+        self.cc_grin = LazyCascade()
 
         # assume face will be "big"
         # and eyes will be smaller
         # suitable limits here will increase frame rate
-        # TODO -- this might depend on scale (currently fixed at 0.5)
+        # these defaults suit scale 0.5 and may be replaced by calibrate()
+        self.face_scale = 1.1
+        self.face_neighbors = 2
         self.size_face = (60, 60)
         self.size_eyes = (18, 18)
+        self.profile = None
+
+        # size limits above are for reference scale
+        # and are rescaled by set_scale() when working scale changes
+        self.scale_ref = 0.5
+        self.scale = 0.5
+        self.size_ref = 60
+
+        # width of primary face found in last frame (0 if none)
+        self.face_w = 0
+
+        # all faces get track IDs
+        # eyes/grin are sought in primary subject every frame
+        # and in other faces every secondary_interval frames
+        # (at most max_faces faces per frame)
+        self.face_tracks = FaceTracks()
+        self.frame_tracks = []  # tracks seen in last frame
+        self.max_faces = 4
+        self.secondary_interval = 3
+        self._frame_k = 0
+
+        # optional staggered eye/grin search
+        # results are reused while face has not moved much
+        # (up to stale_max frames old) and are refreshed
+        # on even frames for eyes and odd frames for grin
+        self.stagger_enable = False
+        self.stagger_iou = 0.7
+        self.stale_max = 4
 
         # grin detection tweak
         # - use 2 for mouth detector
@@ -33,111 +492,625 @@ class CVMain(object):
         # TODO -- tune during start-up ?
         self.magic = 140
 
+        # optional detect-then-track mode
+        # full face cascade runs every track_interval frames
+        # (or when match score of any face drops below track_min_score)
+        # and faces are followed with template matching in between
+        self.track_enable = False
+        self.track_interval = 5
+        self.track_min_score = 0.6
+        self.ct_detect = 0
+        self.ct_track = 0
+        self._track_faces = []  # [template, (x, y, w, h)] per face
+        self._track_k = 0
+
+        # optional search window mode
+        # each face is first sought in a padded window around its last
+        # location with min/max size limited to a range around its size
+        # and whole ROI is searched after a miss in any window
+        # (and every window_interval frames to pick up new faces)
+        self.window_enable = False
+        self.window_pad = 0.5  # padding as fraction of face size
+        self.window_range = 1.25  # allowed size change between frames
+        self.window_interval = 10
+        self.window_size = (0, 0)
+        self.ct_window_hit = 0
+        self.ct_window_miss = 0
+        self._last_faces = []
+        self._window_k = 0
+
+        # optional parallel eye/grin detection
+        # grin is sought on a persistent worker thread
+        self.parallel_enable = False
+        self._pool = None
+        self._cv_threads = cv2.getNumThreads()
+
+        # optional poxperf.StageTimer for face/eyes/grin stage times
+        self.stage_timer = None
+
+    @property
+    def cc_face(self):
+        # face cascade of backend (None if backend is not a cascade)
+        return self.backend.cc
+
+    @cc_face.setter
+    def cc_face(self, cc):
+        self.backend.cc = cc
+
+    def set_backend(self, name):
+        """
+        Selects face detector backend (load_cascades() loads it).
+        Search window and calibration need a cascade backend.
+        :param name: One of poxdet.BACKENDS
+        """
+        self.backend = poxdet.make_backend(name)
+        self._last_faces = []
+
     def load_cascades(self, path):
-        # try to load standard OpenCV face/eyes/grin cascades
-        face_cascade_name = path + "haarcascade_frontalface_alt.xml"
+        # try to load face detector backend and standard OpenCV cascades
+        # eyes/grin files are only checked here and loaded on first use
         eyes_cascade_name = path + "haarcascade_eye_tree_eyeglasses.xml"
         grin_cascade_name = path + "haarcascade_smile.xml"
         #grin_cascade_name = "haarcascade_mcs_mouth.xml"
 
-        if not self.cc_face.load(face_cascade_name):
-            print "Face cascade data failed to open:", face_cascade_name
+        if not self.backend.load(path):
             return False
-        if not self.cc_eyes.load(eyes_cascade_name):
+        if not os.path.isfile(eyes_cascade_name):
             print "Eyes cascade data failed to open:", eyes_cascade_name
             return False
-        if not self.cc_grin.load(path + grin_cascade_name):
-            print "Grin cascade data failed to open."
+        if not os.path.isfile(grin_cascade_name):
+            print "Grin cascade data failed to open:", grin_cascade_name
+            return False
+        self.cc_eyes.fname = eyes_cascade_name
+        self.cc_grin.fname = grin_cascade_name
+        return True
+
+    def set_parallel(self, enable):
+        """
+        Turns parallel eye/grin detection on or off.
+        OpenCV runs each detection on several threads of its own,
+        so its thread count is halved while two detections run at once
+        (otherwise they would compete for the same cores).
+        :param enable: True to find grin while eyes are sought
+        """
+        self.parallel_enable = enable
+        if enable:
+            if self._pool is None:
+                self._pool = multiprocessing.pool.ThreadPool(1)
+            cv2.setNumThreads(max(1, self._cv_threads // 2))
+        else:
+            cv2.setNumThreads(self._cv_threads)
+
+    def apply_profile(self, profile):
+        """
+        Applies face detection settings.
+        Eye size limit keeps its ratio to face size limit.
+        :param profile: Dictionary from calibrate() or saved profile file
+        """
+        self.size_ref = int(profile["size_face"])
+        self.face_scale = float(profile["face_scale"])
+        self.face_neighbors = int(profile["face_neighbors"])
+        self.profile = profile
+        self.set_scale(self.scale)
+
+    def set_scale(self, scale):
+        """
+        Rescales face and eye size limits for a working image scale.
+        Grin size limits follow face box so they need no change.
+        Face tracks and search windows are rescaled (IDs are kept).
+        Template tracking is reset (templates are wrong size).
+        :param scale: Working image scale
+        """
+        ratio = float(scale) / self.scale
+        self.scale = scale
+        size = max(20, int(round(self.size_ref * scale / self.scale_ref)))
+        self.size_face = (size, size)
+        self.size_eyes = ((size * 18) / 60, (size * 18) / 60)
+        self.track_reset()
+        if ratio != 1.0:
+            self.face_tracks.rescale(ratio)
+            self._last_faces = [scale_rect(face, ratio)
+                                for face in self._last_faces]
+
+    def calibrate(self, frames, target_fps=15.0, stability_budget=0.1,
+                  max_sec=5.0):
+        """
+        Searches face scaleFactor, minNeighbors, and minSize on sample
+        frames.  Stability is the fraction of frames with exactly one face.
+        The fastest setting that meets the target FPS and is within the
+        stability budget of the most stable setting is applied.
+        Every setting gets an equal share of the time limit and is
+        measured on at least one frame.  Frames are taken in spread-out
+        order so a setting that runs out of time still sees frames
+        from the whole sample.
+        :param frames: List of BGR ROI images (live or recorded)
+        :param target_fps: Desired face detection rate
+        :param stability_budget: Allowed stability loss vs. most stable
+        :param max_sec: Time limit for search (approximate)
+        :return: True if settings were applied, False if no face was seen
+                 (or backend is not a cascade)
+        """
+        if self.cc_face is None:
+            return False
+        grays = []
+        for img in frames:
+            r = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            cv2.equalizeHist(r, r)
+            grays.append(r)
+        if not len(grays):
+            return False
+
+        results = []
+        order = spread_order(len(grays))
+        candidates = list(itertools.product(
+            self.CAL_SIZES, self.CAL_SCALES, self.CAL_NEIGHBORS))
+        budget = max_sec / len(candidates)
+        for size, scale, neighbors in candidates:
+            hits = 0
+            ct = 0
+            t0 = time.time()
+            for k in order:
+                obj_face = self.cc_face.detectMultiScale(
+                    grays[k], scale, neighbors, 0, (size, size))
+                if len(obj_face) == 1:
+                    hits += 1
+                ct += 1
+                if time.time() - t0 >= budget:
+                    break
+            dt = (time.time() - t0) / ct
+            stability = float(hits) / ct
+            results.append((dt, stability, scale, neighbors, size))
+
+        # no face seen means nothing to tune against
+        best = max([x[1] for x in results])
+        if best == 0.0:
             return False
+
+        stable = [x for x in results if x[1] >= best - stability_budget]
+        fast = [x for x in stable if x[0] * target_fps <= 1.0]
+        dt, stability, scale, neighbors, size = min(fast or stable)
+        self.apply_profile({"face_scale": scale,
+                            "face_neighbors": neighbors,
+                            "size_face": size,
+                            "fps": round(1.0 / max(dt, 1e-6), 1),
+                            "stability": round(stability, 3)})
         return True
 
-    def detect(self, img_rgb, use_eyes=True, use_grin=False):
+    def load_profile(self, fname, key):
+        """
+        Applies saved settings for a camera and resolution.
+        :param fname: Profile file name (JSON)
+        :param key: Camera and resolution key
+        :return: True if profile was found, False otherwise
+        """
+        result = False
+        try:
+            with open(fname) as f:
+                profiles = json.load(f)
+            if key in profiles:
+                self.apply_profile(profiles[key])
+                result = True
+        except (IOError, ValueError, KeyError):
+            pass
+        return result
+
+    def save_profile(self, fname, key):
+        """
+        Saves current settings for a camera and resolution.
+        Profiles for other keys in the file are kept.
+        :param fname: Profile file name (JSON)
+        :param key: Camera and resolution key
+        """
+        profiles = {}
+        try:
+            with open(fname) as f:
+                profiles = json.load(f)
+        except (IOError, ValueError):
+            pass
+        profiles[key] = self.profile
+        with open(fname, "w") as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+
+    def new_sequence(self):
+        """
+        Forgets faces from earlier frames so results of a new frame
+        sequence do not depend on what was processed before it.
+        """
+        self.track_reset()
+        self.face_tracks.reset()
+        self.frame_tracks = []
+        self._frame_k = 0
+        self._last_faces = []
+        self._window_k = 0
+
+    def track_reset(self):
+        # forget tracked faces so next frame runs full detection
+        self._track_faces = []
+        self._track_k = 0
+
+    def _track_one(self, r, tmpl, face):
+        """
+        Looks for face template in a window around last location.
+        :param r: Equalized gray image
+        :param tmpl: Face template
+        :param face: Last (x, y, w, h) of face
+        :return: (x, y, w, h) of face or None if match is poor
+        """
+        # search window is face box padded by half its size
+        x, y, w, h = face
+        rh, rw = r.shape[:2]
+        x0 = max(0, x - w / 2)
+        y0 = max(0, y - h / 2)
+        x1 = min(rw, x + w + w / 2)
+        y1 = min(rh, y + h + h / 2)
+        if (x1 - x0) < w or (y1 - y0) < h:
+            return None
+
+        res = cv2.matchTemplate(r[y0:y1, x0:x1], tmpl,
+                                cv2.TM_CCOEFF_NORMED)
+        _, score, _, loc = cv2.minMaxLoc(res)
+        if score < self.track_min_score:
+            return None
+        return x0 + loc[0], y0 + loc[1], w, h
+
+    def _track(self, r):
+        """
+        Follows every tracked face with its template.
+        :param r: Equalized gray image
+        :return: List of (x, y, w, h) or None if any match is poor
+        """
+        faces = []
+        for tmpl, face in self._track_faces:
+            face = self._track_one(r, tmpl, face)
+            if face is None:
+                return None
+            faces.append(face)
+        for item, face in zip(self._track_faces, faces):
+            item[1] = face
+        return faces
+
+    def _window_one(self, r, face):
+        """
+        Runs face cascade in a window around a face location.
+        :param r: Equalized gray image
+        :param face: Last (x, y, w, h) of face
+        :return: (x, y, w, h) of face or None if not found in window
+        """
+        x, y, w, h = face
+        rh, rw = r.shape[:2]
+        pad_w = int(w * self.window_pad)
+        pad_h = int(h * self.window_pad)
+        x0 = max(0, x - pad_w)
+        y0 = max(0, y - pad_h)
+        x1 = min(rw, x + w + pad_w)
+        y1 = min(rh, y + h + pad_h)
+        self.window_size = (x1 - x0, y1 - y0)
+
+        # limit scale range to sizes near last face size
+        size_min = (max(self.size_face[0], int(w / self.window_range)),
+                    max(self.size_face[1], int(h / self.window_range)))
+        size_max = (int(w * self.window_range), int(h * self.window_range))
+        obj_face = self.cc_face.detectMultiScale(r[y0:y1, x0:x1],
+                                                 self.face_scale,
+                                                 self.face_neighbors, 0,
+                                                 size_min, size_max)
+        if len(obj_face) != 1:
+            return None
+        fx, fy, fw, fh = [int(v) for v in obj_face[0]]
+        return x0 + fx, y0 + fy, fw, fh
+
+    def _window_detect(self, r):
+        """
+        Seeks each face from last frame in a window around it.
+        :param r: Equalized gray image
+        :return: List of (x, y, w, h) or None if any face was missed
+                 (or two windows found same face)
+        """
+        faces = []
+        for face in self._last_faces:
+            face = self._window_one(r, face)
+            if face is None:
+                return None
+            for other in faces:
+                if rect_iou(face, other) > 0.5:
+                    return None
+            faces.append(face)
+        return faces
+
+    def _detect_faces(self, r, img=None):
+        """
+        Runs face detector (in search window first if enabled).
+        :param r: Equalized gray image
+        :param img: BGR image (None if detector only needs gray image)
+        :return: Sequence of (x, y, w, h) face rectangles
+        """
+        self.ct_detect += 1
+        if self.window_enable and self._last_faces and \
+                self.cc_face is not None and \
+                self._window_k < self.window_interval:
+            faces = self._window_detect(r)
+            if faces is not None:
+                self.ct_window_hit += 1
+                self._window_k += 1
+                self._last_faces = faces
+                return faces
+            # fall back to whole ROI
+            self.ct_window_miss += 1
+
+        x = r if img is None else self.backend.prepare(img, r)
+        faces = self.backend.find(x, self.face_scale, self.face_neighbors,
+                                  self.size_face)
+        obj_face = [f[:4] for f in faces]
+        self._last_faces = [tuple([int(v) for v in face])
+                            for face in obj_face]
+        self._window_k = 0
+        return obj_face
+
+    def face_table(self):
+        """
+        Returns faces seen in last frame and their eye/grin boxes
+        as rows with track IDs.
+        :return: (faces, features) int32 arrays,
+                 faces rows are (track id, primary, found, x, y, w, h),
+                 features rows are (track id, x1, y1, x2, y2)
+        """
+        faces = np.zeros((len(self.frame_tracks), 7), np.int32)
+        features = []
+        for i, track in enumerate(self.frame_tracks):
+            faces[i] = ((track.id, track is self.face_tracks.primary,
+                         track.found) + tuple(track.rect))
+            for pt1, pt2 in track.feature_boxes:
+                features.append((track.id, pt1[0], pt1[1], pt2[0], pt2[1]))
+        features = np.array(features, np.int32).reshape(-1, 5)
+        return faces, features
+
+    def report(self):
+        """
+        Returns summary of face search counters.
+        :return: string
+        """
+        ct_window = self.ct_window_hit + self.ct_window_miss
+        hit_rate = 0.0
+        if ct_window:
+            hit_rate = float(self.ct_window_hit) / ct_window
+        return "detect={0} track={1} window={2}x{3} " \
+               "hit={4} fallback={5} hit_rate={6:.2f}".format(
+                   self.ct_detect, self.ct_track,
+                   self.window_size[0], self.window_size[1],
+                   self.ct_window_hit, self.ct_window_miss, hit_rate)
+
+    def _find_faces(self, r, img=None):
+        """
+        Runs face detector or tracker (if enabled and due).
+        :param r: Equalized gray image
+        :param img: BGR image (None if detector only needs gray image)
+        :return: Sequence of (x, y, w, h) face rectangles
+        """
+        if self.track_enable and self._track_faces:
+            if self._track_k < self.track_interval:
+                faces = self._track(r)
+                if faces is not None:
+                    self._track_k += 1
+                    self.ct_track += 1
+                    return faces
+
+        obj_face = self._detect_faces(r, img)
+        self.track_reset()
+        if self.track_enable:
+            # new templates for tracking in following frames
+            for face in obj_face:
+                x, y, w, h = [int(v) for v in face]
+                self._track_faces.append([r[y:y + h, x:x + w].copy(),
+                                          (x, y, w, h)])
+        return obj_face
+
+    def _find_eyes(self, r, face):
+        """
+        Seeks eyes in upper part of face box.
+        :param r: Equalized gray image
+        :param face: (x, y, w, h) face rectangle
+        :return: (True if any eyes found, eye boxes)
+        """
+        face_x, face_y, face_w, face_h = face
+        yfrac = (face_h * 5) / 8
+
+        # seek eyes in face region
+        # use "4" for rectangle threshold (fewer False detections)
+        # assume frame is "good" if more than 2 eyes
+        face_roi = r[face_y:face_y + yfrac, face_x:face_x + face_w]
+        obj_eyes = self.cc_eyes.detectMultiScale(face_roi, 1.1, 4, 0,
+                                                 self.size_eyes)
+        if len(obj_eyes) > 2:
+            # just FYI if needed for debugging
+            # print "invalid eye count"
+            pass
+
+        # generate eye box data
+        boxes = []
+        for eye in obj_eyes:
+            eye_x, eye_y = eye[:2]
+            eye_w, eye_h = eye[2:]
+            eye_pt1 = (face_x + eye_x, face_y + eye_y)
+            eye_pt2 = (eye_pt1[0] + eye_w, eye_pt1[1] + eye_h)
+            boxes.append([eye_pt1, eye_pt2])
+        return len(obj_eyes) > 0, boxes
+
+    def _find_grin(self, r, face):
+        """
+        Seeks grin in mouth part of face box.
+        :param r: Equalized gray image
+        :param face: (x, y, w, h) face rectangle
+        :return: (True if grin found, grin boxes)
+        """
+        face_x, face_y, face_w, face_h = face
+        yfrac = (face_h * 5) / 8
+
+        # increase upper/lower bounds on mouth region
+        # need even bigger lower bounds if using "mouth" detector
+        # (makes it possible to detect wide-open mouth)
+        # inc_y = (face_h / 8)
+        y1m = (face_y + yfrac) # - inc_y
+        y2m = (face_y + face_h) # + inc_y
+
+        # try to find grin in mouth area
+        grin_roi = r[y1m:y2m, face_x:face_x + face_w]
+        gw = (face_w * 3) / 8  # min 3/8 of mouth region w
+        gh = (face_h - yfrac) / 3  # min 1/3 of mouth region h
+        obj_grin = self.cc_grin.detectMultiScale(grin_roi, 1.1, self.magic,
+                                                 0, (gw, gh))
+
+        # generate grin box data
+        # must uncomment offset below if using bigger mouth region
+        boxes = []
+        for grin in obj_grin:
+            grin_x, grin_y = grin[:2]
+            grin_w, grin_h = grin[2:]
+            grin_pt1 = (face_x + grin_x, face_y + yfrac + grin_y) # - inc_y)
+            grin_pt2 = (grin_pt1[0] + grin_w, grin_pt1[1] + grin_h)
+            boxes.append([grin_pt1, grin_pt2])
+        return len(obj_grin) > 0, boxes
+
+    def _refresh(self, result, track, slot):
+        """
+        Decides if eye or grin search must run for a face.
+        :param result: Last result of search
+        :param track: Face track
+        :param slot: Frame parity for refresh (0 for eyes, 1 for grin)
+        :return: True if search must run this frame
+        """
+        if not self.stagger_enable or result is None:
+            return True
+        if rect_iou(result[2], track.rect) < self.stagger_iou:
+            # face moved too much
+            return True
+        age = self._frame_k - result[3]
+        if age >= self.stale_max:
+            return True
+        return age >= self.stale_max - 1 and self._frame_k % 2 == slot
+
+    @staticmethod
+    def _feature(result, track, use):
+        """
+        Returns eye or grin result for a face.
+        Boxes are shifted by face movement since search.
+        :return: (found flag, boxes), (True, []) if feature not wanted
+        """
+        if not use:
+            return True, []
+        b_found, boxes, rect, _ = result
+        dx = track.rect[0] - rect[0]
+        dy = track.rect[1] - rect[1]
+        if dx or dy:
+            boxes = [[(p1[0] + dx, p1[1] + dy), (p2[0] + dx, p2[1] + dy)]
+                     for p1, p2 in boxes]
+        return b_found, boxes
+
+    def _eye_pass(self, r, faces):
+        # eye search over batch of faces
+        return [self._find_eyes(r, face) for face in faces]
+
+    def _grin_pass(self, r, faces):
+        # grin search over batch of faces
+        return [self._find_grin(r, face) for face in faces]
+
+    def detect(self, img_rgb, use_eyes=True, use_grin=False, gray=None):
+        """
+        Finds faces and seeks eyes and/or grin in them.
+        Primary subject's eyes/grin are sought every frame.
+        Other faces are done every secondary_interval frames
+        (at most max_faces faces per frame) and keep their last boxes
+        in between.
+        :param img_rgb: BGR image
+        :param use_eyes: True to require eyes
+        :param use_grin: True to require grin
+        :param gray: Preallocated gray buffer (optional)
+        :return: (True if primary subject has all desired features,
+                  list of [pt1, pt2] boxes for all faces)
+        """
 
         # convert to gray
         # and equalize (since demo code does this too)
-        r = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
+        # use preallocated gray buffer if caller has one
+        r = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY, dst=gray)
         cv2.equalizeHist(r, r)
 
-        # assume eyes found
-        # this will be applied to debounce
-        # if face or eye detections fail (rare)
-        b_found = False
+        # find faces and match them with faces from earlier frames
+        obj_face = self._find_faces(r, img_rgb)
+        if self.stage_timer is not None:
+            self.stage_timer.mark(poxperf.S_FACE)
+        tracks = self.face_tracks.update(
+            [tuple([int(v) for v in face[:4]]) for face in obj_face])
+        primary = self.face_tracks.primary
+        self.frame_tracks = tracks
+
+        # pick faces due for eye/grin search (primary first)
+        self._frame_k += 1
+        due = []
+        for track in sorted(tracks, key=lambda x: x is not primary):
+            if len(due) == self.max_faces:
+                break
+            if track is primary or \
+                    self._frame_k % self.secondary_interval == 0:
+                due.append(track)
+
+        # pick faces that need a fresh eye or grin search
+        eye_due = [t for t in due if use_eyes and self._refresh(t.eyes, t, 0)]
+        grin_due = [t for t in due if use_grin and self._refresh(t.grin, t, 1)]
+
+        # start grin search on worker thread
+        # while eyes are sought in this one
+        grin_job = None
+        if eye_due and grin_due and self.parallel_enable:
+            grin_job = self._pool.apply_async(
+                self._grin_pass, (r, [t.rect for t in grin_due]))
+
+        if eye_due:
+            eyes = self._eye_pass(r, [t.rect for t in eye_due])
+            for track, (b_eyes, eye_boxes) in zip(eye_due, eyes):
+                track.eyes = (b_eyes, eye_boxes, track.rect, self._frame_k)
+            if self.stage_timer is not None:
+                self.stage_timer.mark(poxperf.S_EYES)
+
+        if grin_due:
+            if grin_job is not None:
+                grins = grin_job.get()
+            else:
+                grins = self._grin_pass(r, [t.rect for t in grin_due])
+            for track, (b_grin, grin_boxes) in zip(grin_due, grins):
+                track.grin = (b_grin, grin_boxes, track.rect, self._frame_k)
+            if self.stage_timer is not None:
+                self.stage_timer.mark(poxperf.S_GRIN)
+
+        # apply eye/grin detection to found flag of each face
+        # reused boxes move with face
+        for track in due:
+            b_eyes, eye_boxes = self._feature(track.eyes, track, use_eyes)
+            b_grin, grin_boxes = self._feature(track.grin, track, use_grin)
+            track.found = b_eyes and b_grin
+            track.feature_boxes = eye_boxes + grin_boxes
 
         # each box element will be a list of form [pt1, pt2]
         boxes = []
+        for track in tracks:
+            # create face box with sub-boxes for eyes and mouth
+            # horizontal line 5/8 from top of face box
+            # to separate mouth region and rest of face
+            x1, y1, face_w, face_h = track.rect
+            yfrac = (face_h * 5) / 8
+            halfx = x1 + face_w / 2
+            boxes.append([(x1, y1), (halfx, y1 + yfrac)])
+            boxes.append([(halfx, y1), (x1 + face_w, y1 + yfrac)])
+            boxes.append([(x1, y1 + yfrac), (x1 + face_w, y1 + face_h)])
+            boxes.extend(track.feature_boxes)
 
-        # first find one face
-        obj_face = self.cc_face.detectMultiScale(r, 1.1, 2, 0, self.size_face)
-        if len(obj_face) == 1:
-            for face in obj_face:
-                # create face box with sub-boxes for eyes and mouth
-                # horizontal line 5/8 from top of face box
-                # to separate mouth region and rest of face
-                face_x, face_y = face[:2]
-                face_w, face_h = face[2:]
-                yfrac = (face_h * 5) / 8
-                halfx = face_x + face_w / 2
-                y1 = face_y
-                x1 = face_x
-
-                boxes.append([(x1, y1), (halfx, y1 + yfrac)])
-                boxes.append([(halfx, y1), (x1 + face_w, y1 + yfrac)])
-                boxes.append([(x1, y1 + yfrac), (x1 + face_w, y1 + face_h)])
-                b_found = True
-
-                if use_eyes:
-                    # seek eyes in face region
-                    # use "4" for rectangle threshold (fewer False detections)
-                    # assume frame is "good" if more than 2 eyes
-                    face_roi = r[y1:y1 + yfrac, x1:x1 + face_w]
-                    obj_eyes = self.cc_eyes.detectMultiScale(face_roi, 1.1, 4,
-                                                             0,
-                                                             self.size_eyes)
-
-                    b_found = b_found and (len(obj_eyes) > 0)
-                    if len(obj_eyes) > 2:
-                        # just FYI if needed for debugging
-                        # print "invalid eye count"
-                        pass
-
-                    # generate eye box data
-                    for eye in obj_eyes:
-                        eye_x, eye_y = eye[:2]
-                        eye_w, eye_h = eye[2:]
-                        eye_pt1 = (face_x + eye_x, face_y + eye_y)
-                        eye_pt2 = (eye_pt1[0] + eye_w, eye_pt1[1] + eye_h)
-                        boxes.append([eye_pt1, eye_pt2])
-
-                if use_grin:
-                    # increase upper/lower bounds on mouth region
-                    # need even bigger lower bounds if using "mouth" detector
-                    # (makes it possible to detect wide-open mouth)
-                    # inc_y = (face_h / 8)
-                    y1m = (y1 + yfrac) # - inc_y
-                    y2m = (y1 +face_h) # + inc_y
-
-                    # try to find grin in mouth area
-                    grin_roi = r[y1m:y2m, x1:x1 + face_w]
-                    gw = (face_w * 3) / 8  # min 3/8 of mouth region w
-                    gh = (face_h - yfrac) / 3  # min 1/3 of mouth region h
-                    obj_grin = self.cc_grin.detectMultiScale(grin_roi, 1.1,
-                                                             self.magic, 0,
-                                                             (gw, gh))
-
-                    # apply grin detection to found flag
-                    b_found = b_found and (len(obj_grin) > 0)
-
-                    # generate grin box data
-                    # must uncomment offset below if using bigger mouth region
-                    for grin in obj_grin:
-                        grin_x, grin_y = grin[:2]
-                        grin_w, grin_h = grin[2:]
-                        grin_pt1 = (face_x + grin_x,
-                                    face_y + yfrac + grin_y) # - inc_y)
-                        grin_pt2 = (grin_pt1[0] + grin_w,
-                                    grin_pt1[1] + grin_h)
-                        boxes.append([grin_pt1, grin_pt2])
-
-        # return a flag indicating success if all desired features found
-        # and a list of data for drawing boxes around what was found
+        # flag indicates success if all desired features found
+        # for primary subject (and it was seen in this frame)
+        b_found = False
+        self.face_w = 0
+        if primary is not None and primary.missing == 0:
+            b_found = primary.found
+            self.face_w = primary.rect[2]
+
+        # return flag and list of data for drawing boxes
+        # around what was found
         return b_found, boxes
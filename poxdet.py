@@ -0,0 +1,159 @@
+# poxdet.py
+
+"""POX Face Detector Backends
+
+Face detectors behind CVMain.detect.  Each backend has its own
+preprocessing and returns the same result type (list of Face).
+
+- haar: Haar cascade on equalized gray image (default)
+- lbp: LBP cascade on equalized gray image (faster, a bit less accurate)
+- dnn: OpenCV DNN ResNet-10 SSD on mean-subtracted 300x300 BGR blob
+  (needs OpenCV 3.3 or later)
+
+Data files are looked up in the cascade folder:
+    haarcascade_frontalface_alt.xml
+    lbpcascade_frontalface.xml
+    deploy.prototxt
+    res10_300x300_ssd_iter_140000.caffemodel
+
+"""
+
+import collections
+import os
+
+import cv2
+
+
+BACKENDS = ("haar", "lbp", "dnn")
+
+# common result type
+# position and size in pixels of detection image, score from 0.0 to 1.0
+# (cascades have no score so they always give 1.0)
+Face = collections.namedtuple("Face", "x y w h score")
+
+
+class CascadeBackend(object):
+    """
+    Haar or LBP cascade classifier.
+    """
+
+    FILES = {"haar": "haarcascade_frontalface_alt.xml",
+             "lbp": "lbpcascade_frontalface.xml"}
+
+    def __init__(self, name="haar"):
+        self.name = name
+        self.cc = cv2.CascadeClassifier()
+
+    def load(self, path):
+        """
+        Loads cascade file.
+        :param path: Folder with data files
+        :return: True if loaded
+        """
+        fname = path + CascadeBackend.FILES[self.name]
+        if not self.cc.load(fname):
+            print "Face cascade data failed to open:", fname
+            return False
+        return True
+
+    def prepare(self, img, gray):
+        """
+        Returns detection input.
+        :param img: BGR image
+        :param gray: Equalized gray version of img
+        """
+        return gray
+
+    def find(self, x, scale, neighbors, size_min):
+        """
+        Finds faces.
+        :param x: Detection input from prepare()
+        :param scale: Cascade scale factor
+        :param neighbors: Cascade min neighbors
+        :param size_min: Smallest face (w, h)
+        :return: List of Face
+        """
+        rects = self.cc.detectMultiScale(x, scale, neighbors, 0, size_min)
+        return [Face(int(a), int(b), int(c), int(d), 1.0)
+                for (a, b, c, d) in rects]
+
+
+class DNNBackend(object):
+    """
+    OpenCV DNN face detector (Caffe ResNet-10 SSD, CPU).
+    """
+
+    PROTO = "deploy.prototxt"
+    MODEL = "res10_300x300_ssd_iter_140000.caffemodel"
+    SIZE = (300, 300)
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, min_score=0.5):
+        self.name = "dnn"
+        self.cc = None  # no cascade (no search window or calibration)
+        self.net = None
+        self.min_score = min_score
+        self._shape = None
+
+    def load(self, path):
+        """
+        Loads network.
+        :param path: Folder with data files
+        :return: True if loaded
+        """
+        if not hasattr(cv2, "dnn"):
+            print "DNN face detector needs OpenCV 3.3 or later"
+            return False
+        proto = path + DNNBackend.PROTO
+        model = path + DNNBackend.MODEL
+        if not (os.path.isfile(proto) and os.path.isfile(model)):
+            print "DNN face model failed to open:", proto, model
+            return False
+        self.net = cv2.dnn.readNetFromCaffe(proto, model)
+        return True
+
+    def prepare(self, img, gray):
+        """
+        Returns detection input (network blob).
+        :param img: BGR image
+        :param gray: Equalized gray version of img (not used)
+        """
+        self._shape = img.shape[:2]
+        return cv2.dnn.blobFromImage(cv2.resize(img, DNNBackend.SIZE), 1.0,
+                                     DNNBackend.SIZE, DNNBackend.MEAN)
+
+    def find(self, x, scale, neighbors, size_min):
+        """
+        Finds faces.
+        :param x: Detection input from prepare()
+        :param scale: Not used
+        :param neighbors: Not used
+        :param size_min: Smallest face (w, h)
+        :return: List of Face
+        """
+        self.net.setInput(x)
+        out = self.net.forward()
+        h, w = self._shape
+        faces = []
+        for det in out[0, 0]:
+            score = float(det[2])
+            if score < self.min_score:
+                continue
+            x1 = max(0, int(det[3] * w))
+            y1 = max(0, int(det[4] * h))
+            x2 = min(w, int(det[5] * w))
+            y2 = min(h, int(det[6] * h))
+            if x2 - x1 >= size_min[0] and y2 - y1 >= size_min[1]:
+                faces.append(Face(x1, y1, x2 - x1, y2 - y1, score))
+        return faces
+
+
+def make_backend(name):
+    """
+    Creates face detector backend.
+    :param name: One of BACKENDS
+    :return: Backend object (not loaded)
+    """
+    if name == "dnn":
+        return DNNBackend()
+    return CascadeBackend(name)
@@ -1,10 +1,24 @@
 # poxfsm.py
 
 """POX Finite State Machine stuff
-- SMEvent class and codes
+- SMEvent class and codes (immutable, shared EV_xxx events for codes
+  without data)
+- TableSM base class for state machines defined by a transition table
 - SMPhrase class for Listen-and-Repeat state machine
 - SMLoop class for main face recognition state machine
 
+Transition table rows are (state, event code, guard, actions, next state).
+- guard is None or function(sm, event) returning True if row applies
+- actions are functions(sm, event, outputs) run in order
+- rows for a state are tried in table order
+- a row with next state None passes the event on to the rows after it
+- any other matching row sets the next state and ends the search
+- event code ANY matches every event
+
+The table is compiled once per class to a dict of dicts:
+state -> event code -> tuple of (guard, actions, next state),
+so cranking an event is two lookups and a short loop.
+
 """
 
 import poxutil as pu
@@ -20,6 +34,13 @@ USER_KEYS = [KEY_GO, KEY_HALT, KEY_LISTEN]
 
 
 class SMEvent(object):
+    """
+    Immutable (code, data) event.  Events without data can be shared,
+    so use the EV_xxx events instead of creating new ones.
+    """
+
+    __slots__ = ("code", "data")
+
     # unique event codes
     E_NONE = 0x0
     E_KEY = 0x1  # key pressed
@@ -39,11 +60,117 @@ class SMEvent(object):
     E_RDONE = 0x21  # recognition done
 
     def __init__(self, code=E_NONE, data=None):
-        self.code = code
-        self.data = data
+        _set_slot(self, "code", code)
+        _set_slot(self, "data", data)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SMEvent is immutable")
+
+    def __eq__(self, other):
+        return (isinstance(other, SMEvent) and
+                self.code == other.code and self.data == other.data)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.code, self.data))
+
+    def __repr__(self):
+        return "SMEvent({0}, {1!r})".format(self.code, self.data)
+
+
+_set_slot = object.__setattr__
+
+
+# shared events without data
+EV_CVOK = SMEvent(SMEvent.E_CVOK)
+EV_TMR_CV = SMEvent(SMEvent.E_TMR_CV)
+EV_TMR_SR = SMEvent(SMEvent.E_TMR_SR)
+EV_STOP = SMEvent(SMEvent.E_STOP)
+EV_GO = SMEvent(SMEvent.E_GO)
+EV_XOFF = SMEvent(SMEvent.E_XOFF)
+EV_SDONE = SMEvent(SMEvent.E_SDONE)
+EV_SRFAIL = SMEvent(SMEvent.E_SRFAIL)
+EV_SRGO = SMEvent(SMEvent.E_SRGO)
+EV_SAY_REP = SMEvent(SMEvent.E_SAY_REP)
+
+
+ANY = -1  # table event code matching any event
+
+
+def compile_table(table):
+    """
+    Compiles transition table rows to dispatch dict.
+    :param table: List of (state, code, guard, actions, next state)
+    :return: Dict state -> code -> tuple of (guard, actions, next state),
+             code ANY gives rows for codes not in dict
+    """
+    codes = {}
+    for state, code, _, _, _ in table:
+        codes.setdefault(state, set()).add(code)
+    dispatch = {}
+    for state in codes:
+        by_code = {}
+        for code in codes[state] | {ANY}:
+            by_code[code] = tuple(
+                (guard, tuple(actions), next_state)
+                for (s, c, guard, actions, next_state) in table
+                if s == state and (c == code or c == ANY))
+        dispatch[state] = by_code
+    return dispatch
 
 
-class SMPhrase(object):
+class TableSM(object):
+    """
+    State machine run from compiled transition table.
+    Subclass sets TABLE, then DISPATCH = compile_table(TABLE).
+    """
+
+    TABLE = []
+    DISPATCH = {}
+
+    def crank(self, this_event):
+        """
+        Applies event to state machine.
+        :param this_event: SMEvent
+        :return: List of output SMEvents
+        """
+        assert (isinstance(this_event, SMEvent))
+        state_outputs = []
+        self.run(this_event, state_outputs)
+        return state_outputs
+
+    def run(self, this_event, state_outputs):
+        """
+        Applies event to state machine (no checks, for main loop and
+        sub-machines).
+        :param this_event: SMEvent
+        :param state_outputs: List that gets output SMEvents
+        """
+        by_code = self.DISPATCH.get(self.state)
+        if by_code is None:
+            return
+        rows = by_code.get(this_event.code)
+        if rows is None:
+            rows = by_code[ANY]
+        for guard, actions, next_state in rows:
+            if guard is None or guard(self, this_event):
+                for action in actions:
+                    action(self, this_event, state_outputs)
+                if next_state is not None:
+                    self.state = next_state
+                    return
+
+
+def _is_key(key):
+    # makes guard for a key event with given key
+    def guard(sm, this_event):
+        return this_event.data == key
+    return guard
+
+
+class SMPhrase(TableSM):
     # states
     STATE_IDLE = 0
     STATE_WAIT = 1
@@ -62,77 +189,63 @@ class SMPhrase(object):
         self.strikes = 0
         self.snapshot = {"color": "black"}
 
-    def _to_wait(self):
+    def _stop(self, this_event, state_outputs):
+        # reset strikes and stop timer
+        self.strikes = 0
+        self.timer.stop()
+
+    def _to_wait(self, this_event, state_outputs):
         # helper for transition to wait state (no outputs generated)
         self.timer.start(SMPhrase.WAIT_TIMEOUT_SEC)
-        self.state = SMPhrase.STATE_WAIT
-
-    def crank(self, this_event):
-        assert (isinstance(this_event, SMEvent))
-
-        state_outputs = []
-
-        # CHECK FOR HIGH-PRIORITY STOP
-        # if in any state other than idle and STOP occurs
-        # - reset strikes
-        # - stop timer
-        # - enter STOP state
-        if self.state != SMPhrase.STATE_IDLE:
-            if this_event.code == SMEvent.E_STOP:
-                self.strikes = 0
-                self.timer.stop()
-                self.state = SMPhrase.STATE_STOP
-                # *** EARLY EXIT ***
-                return state_outputs
-
-        if self.state == SMPhrase.STATE_IDLE:
-            # if key LISTEN then TO WAIT
-            if this_event.code == SMEvent.E_KEY:
-                if this_event.data == KEY_LISTEN:
-                    self._to_wait()
-                    # ANNOUNCE START OF SPEECH MODE
-                    self.snapshot["color"] = "brick"
-                    state_outputs.append(SMEvent(SMEvent.E_SAY,
-                                                 "listen and repeat"))
-        elif self.state == SMPhrase.STATE_WAIT:
-            if this_event.code == SMEvent.E_TMR_SR:
-                self.timer.start(SMPhrase.SPK_TIMEOUT_SEC)
-                self.state = SMPhrase.STATE_SPK
-                # command phrase to be spoken
-                state_outputs.append(SMEvent(SMEvent.E_SAY_REP))
-        elif self.state == SMPhrase.STATE_SPK:
-            if this_event.code == SMEvent.E_TMR_SR:
-                # likely due to TTS process not started
-                self._to_wait()
-            elif this_event.code == SMEvent.E_SDONE:
-                self.timer.start(SMPhrase.REC_TIMEOUT_SEC)
-                self.state = SMPhrase.STATE_REC
-                # COMMAND START OF RECOGNITION
-                state_outputs.append(SMEvent(SMEvent.E_SRGO))
-        elif self.state == SMPhrase.STATE_REC:
-            if this_event.code == SMEvent.E_TMR_SR:
-                # likely due to REC process not started (or hung)
-                self._to_wait()
-            elif this_event.code == SMEvent.E_RDONE:
-                self._to_wait()
-                # GOT A RESULT SO UPDATE STRIKE COUNT
-                # THEN ACK RESULT WITH THE NUMBER OF STRIKES
-                ack_strikes = 0
-                if not this_event.data:
-                    self.strikes += 1
-                    ack_strikes = self.strikes
-                else:
-                    self.strikes = 0
-                srack_event = SMEvent(SMEvent.E_SRACK, ack_strikes)
-                state_outputs.append(srack_event)
-        elif self.state == SMPhrase.STATE_STOP:
-            if this_event.code == SMEvent.E_GO:
-                self._to_wait()
-
-        return state_outputs
 
-
-class SMLoop(object):
+    def _announce(self, this_event, state_outputs):
+        # ANNOUNCE START OF SPEECH MODE
+        self.snapshot["color"] = "brick"
+        state_outputs.append(SMEvent(SMEvent.E_SAY, "listen and repeat"))
+
+    def _to_spk(self, this_event, state_outputs):
+        # command phrase to be spoken
+        self.timer.start(SMPhrase.SPK_TIMEOUT_SEC)
+        state_outputs.append(EV_SAY_REP)
+
+    def _to_rec(self, this_event, state_outputs):
+        # COMMAND START OF RECOGNITION
+        self.timer.start(SMPhrase.REC_TIMEOUT_SEC)
+        state_outputs.append(EV_SRGO)
+
+    def _ack(self, this_event, state_outputs):
+        # GOT A RESULT SO UPDATE STRIKE COUNT
+        # THEN ACK RESULT WITH THE NUMBER OF STRIKES
+        ack_strikes = 0
+        if not this_event.data:
+            self.strikes += 1
+            ack_strikes = self.strikes
+        else:
+            self.strikes = 0
+        state_outputs.append(SMEvent(SMEvent.E_SRACK, ack_strikes))
+
+    TABLE = [
+        # HIGH-PRIORITY STOP in any state other than idle
+        (STATE_WAIT, SMEvent.E_STOP, None, [_stop], STATE_STOP),
+        (STATE_SPK, SMEvent.E_STOP, None, [_stop], STATE_STOP),
+        (STATE_REC, SMEvent.E_STOP, None, [_stop], STATE_STOP),
+        (STATE_STOP, SMEvent.E_STOP, None, [_stop], STATE_STOP),
+        (STATE_IDLE, SMEvent.E_KEY, _is_key(KEY_LISTEN),
+         [_to_wait, _announce], STATE_WAIT),
+        (STATE_WAIT, SMEvent.E_TMR_SR, None, [_to_spk], STATE_SPK),
+        # timeout likely due to TTS process not started
+        (STATE_SPK, SMEvent.E_TMR_SR, None, [_to_wait], STATE_WAIT),
+        (STATE_SPK, SMEvent.E_SDONE, None, [_to_rec], STATE_REC),
+        # timeout likely due to REC process not started (or hung)
+        (STATE_REC, SMEvent.E_TMR_SR, None, [_to_wait], STATE_WAIT),
+        (STATE_REC, SMEvent.E_RDONE, None, [_to_wait, _ack], STATE_WAIT),
+        (STATE_STOP, SMEvent.E_GO, None, [_to_wait], STATE_WAIT),
+    ]
+
+SMPhrase.DISPATCH = compile_table(SMPhrase.TABLE)
+
+
+class SMLoop(TableSM):
     # states
     STATE_IDLE = 0  # stopped
     STATE_INH = 1  # start-up delay
@@ -158,23 +271,6 @@ class SMLoop(object):
     def is_idle(self):
         return self.state == SMLoop.STATE_IDLE
 
-    def _to_norm(self):
-        # helper for transition to norm state (no outputs generated)
-        self.cv_timer.start(SMLoop.NORM_TIMEOUT_SEC)
-        self.state = SMLoop.STATE_NORM
-
-    def _to_act(self, temp_outputs):
-        # helper for transition to ACT state
-        self.cv_timer.start(SMLoop.ACT_TIMEOUT_SEC)
-        self.state = SMLoop.STATE_ACT
-        # INCREASE LEVEL UP TO ITS MAXIMUM
-        # STOP PHRASE MACHINE
-        # TURN ON EXTERNAL ACTION (PASS ALONG NEW LEVEL DATA)
-        if self.level < MAX_LEVEL:
-            self.level += 1
-        temp_outputs.extend(self.psm.crank(SMEvent(SMEvent.E_STOP)))
-        temp_outputs.append(SMEvent(SMEvent.E_XON, self.level))
-
     def check_timers(self):
 
         # first update snapshot that is used for display
@@ -208,81 +304,81 @@ class SMLoop(object):
         # handle own timeouts first
         flag, t = self.cv_timer.update()
         if flag:
-            tmr_outputs.append(SMEvent(SMEvent.E_TMR_CV))
+            tmr_outputs.append(EV_TMR_CV)
 
         # then those of sub-machine for phrase control
         flag, t = self.psm.timer.update()
         if flag:
-            tmr_outputs.append(SMEvent(SMEvent.E_TMR_SR))
+            tmr_outputs.append(EV_TMR_SR)
 
         return tmr_outputs
 
-    def crank(self, this_event):
-        assert (isinstance(this_event, SMEvent))
+    def _halt(self, this_event, state_outputs):
+        # stop timer, reset level
+        # NEW PHRASE STATE MACHINE (IDLE, MUST BE RESTARTED)
+        # TURN OFF ANY EXTERNAL ACTION
+        # ANNOUNCE HALT
+        self.cv_timer.stop()
+        self.level = 0
+        self.psm = SMPhrase()
+        state_outputs.append(EV_XOFF)
+        state_outputs.append(SMEvent(SMEvent.E_SAY, "session halted"))
 
-        state_outputs = []
+    def _to_inh(self, this_event, state_outputs):
+        # ANNOUNCE COUNTDOWN HAS STARTED
+        self.cv_timer.start(SMLoop.INH_TIMEOUT_SEC)
+        state_outputs.append(SMEvent(SMEvent.E_SAY, "get ready"))
 
-        # CHECK FOR HIGH-PRIORITY HALT
-        # in any state other than idle and halt event occurs
-        # - stop timer
-        # - reset level
-        # - go back to idle
-        # - stop everything else related to monitoring
-        if self.state != SMLoop.STATE_IDLE:
-            if this_event.code == SMEvent.E_KEY:
-                if this_event.data == KEY_HALT:
-                    self.cv_timer.stop()
-                    self.level = 0
-                    self.state = SMLoop.STATE_IDLE
-                    # NEW PHRASE STATE MACHINE (IDLE, MUST BE RESTARTED)
-                    # TURN OFF ANY EXTERNAL ACTION
-                    # ANNOUNCE HALT
-                    self.psm = SMPhrase()
-                    state_outputs.append(SMEvent(SMEvent.E_XOFF))
-                    state_outputs.append(SMEvent(SMEvent.E_SAY,
-                                                 "session halted"))
-                    # EARLY EXIT
-                    return state_outputs
+    def _to_norm(self, this_event, state_outputs):
+        # helper for transition to norm state (no outputs generated)
+        self.cv_timer.start(SMLoop.NORM_TIMEOUT_SEC)
 
-        if self.state == SMLoop.STATE_IDLE:
-            if this_event.code == SMEvent.E_KEY:
-                if this_event.data == KEY_GO:
-                    self.cv_timer.start(SMLoop.INH_TIMEOUT_SEC)
-                    self.state = SMLoop.STATE_INH
-                    # ANNOUNCE COUNTDOWN HAS STARTED
-                    state_outputs.append(SMEvent(SMEvent.E_SAY,
-                                                 "get ready"))
-        elif self.state == SMLoop.STATE_INH:
-            if this_event.code == SMEvent.E_TMR_CV:
-                self._to_norm()
-                # ANNOUNCE START OF MONITORING
-                state_outputs.append(SMEvent(SMEvent.E_SAY,
-                                             "go"))
-        elif self.state == SMLoop.STATE_NORM:
-            # in NORM pass event to phrase sub-machine
-            state_outputs.extend(self.psm.crank(this_event))
-            if this_event.code == SMEvent.E_CVOK:
-                self._to_norm()
-            elif this_event.code == SMEvent.E_TMR_CV:
-                self.cv_timer.start(SMLoop.WARN_TIMEOUT_SEC)
-                self.state = SMLoop.STATE_WARN
-            elif this_event.code == SMEvent.E_SRFAIL:
-                self._to_act(state_outputs)
-        elif self.state == SMLoop.STATE_WARN:
-            # in WARN pass event to phrase sub-machine
-            state_outputs.extend(self.psm.crank(this_event))
-            if this_event.code == SMEvent.E_CVOK:
-                self._to_norm()
-            elif this_event.code == SMEvent.E_TMR_CV:
-                self._to_act(state_outputs)
-            elif this_event.code == SMEvent.E_SRFAIL:
-                self._to_act(state_outputs)
-        elif self.state == SMLoop.STATE_ACT:
-            if this_event.code == SMEvent.E_TMR_CV:
-                self._to_norm()
-                # RESTART PHRASE MACHINE
-                # TURN OFF ANY EXTERNAL ACTION
-                state_outputs.extend(self.psm.crank(SMEvent(SMEvent.E_GO)))
-                state_outputs.append(SMEvent(SMEvent.E_XOFF))
+    def _say_go(self, this_event, state_outputs):
+        # ANNOUNCE START OF MONITORING
+        state_outputs.append(SMEvent(SMEvent.E_SAY, "go"))
 
-        return state_outputs
+    def _to_warn(self, this_event, state_outputs):
+        self.cv_timer.start(SMLoop.WARN_TIMEOUT_SEC)
+
+    def _to_act(self, this_event, state_outputs):
+        # helper for transition to ACT state
+        # INCREASE LEVEL UP TO ITS MAXIMUM
+        # STOP PHRASE MACHINE
+        # TURN ON EXTERNAL ACTION (PASS ALONG NEW LEVEL DATA)
+        self.cv_timer.start(SMLoop.ACT_TIMEOUT_SEC)
+        if self.level < MAX_LEVEL:
+            self.level += 1
+        self.psm.run(EV_STOP, state_outputs)
+        state_outputs.append(SMEvent(SMEvent.E_XON, self.level))
+
+    def _pass(self, this_event, state_outputs):
+        # pass event to phrase sub-machine
+        self.psm.run(this_event, state_outputs)
+
+    def _restart(self, this_event, state_outputs):
+        # RESTART PHRASE MACHINE
+        # TURN OFF ANY EXTERNAL ACTION
+        self.psm.run(EV_GO, state_outputs)
+        state_outputs.append(EV_XOFF)
+
+    TABLE = [
+        # HIGH-PRIORITY HALT in any state other than idle
+        (STATE_INH, SMEvent.E_KEY, _is_key(KEY_HALT), [_halt], STATE_IDLE),
+        (STATE_NORM, SMEvent.E_KEY, _is_key(KEY_HALT), [_halt], STATE_IDLE),
+        (STATE_WARN, SMEvent.E_KEY, _is_key(KEY_HALT), [_halt], STATE_IDLE),
+        (STATE_ACT, SMEvent.E_KEY, _is_key(KEY_HALT), [_halt], STATE_IDLE),
+        (STATE_IDLE, SMEvent.E_KEY, _is_key(KEY_GO), [_to_inh], STATE_INH),
+        (STATE_INH, SMEvent.E_TMR_CV, None, [_to_norm, _say_go], STATE_NORM),
+        # in NORM and WARN pass every event to phrase sub-machine first
+        (STATE_NORM, ANY, None, [_pass], None),
+        (STATE_NORM, SMEvent.E_CVOK, None, [_to_norm], STATE_NORM),
+        (STATE_NORM, SMEvent.E_TMR_CV, None, [_to_warn], STATE_WARN),
+        (STATE_NORM, SMEvent.E_SRFAIL, None, [_to_act], STATE_ACT),
+        (STATE_WARN, ANY, None, [_pass], None),
+        (STATE_WARN, SMEvent.E_CVOK, None, [_to_norm], STATE_NORM),
+        (STATE_WARN, SMEvent.E_TMR_CV, None, [_to_act], STATE_ACT),
+        (STATE_WARN, SMEvent.E_SRFAIL, None, [_to_act], STATE_ACT),
+        (STATE_ACT, SMEvent.E_TMR_CV, None, [_to_norm, _restart], STATE_NORM),
+    ]
+
+SMLoop.DISPATCH = compile_table(SMLoop.TABLE)
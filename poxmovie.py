@@ -0,0 +1,202 @@
+#! /usr/bin/env python2.7
+
+# poxmovie.py
+
+"""POX Movie Builder
+
+Builds movie files from directories of recorded PNG frames.
+
+- Frames are grouped by clip and sorted by frame number
+  (file names are <prefix>_<clip>_<frame>.png)
+- One movie per clip: <prefix>_<clip>.mov
+- PNG decoding runs ahead on a thread pool while one thread encodes
+- Frame rate is estimated from file times unless given
+
+The MovieDaemon class runs the builder in the background for the App.
+
+Output Responses:
+    MOV <string>
+    - String is summary of movies that were made.
+
+Can also be run from the command line:
+    python poxmovie.py movie/ --workers 4
+
+"""
+
+import os
+import re
+import sys
+import argparse
+import threading
+import collections
+from multiprocessing.pool import ThreadPool
+
+import cv2
+
+import poxcompat
+
+
+POX_MOV = "MOV"
+
+FRAME_NAME = re.compile(r"^(.+)_(\d+)_(\d+)\.png$")
+
+
+def group_frames(img_path):
+    """
+    Gathers recorded frame files by clip.
+    :param img_path: Directory of PNG files
+    :return: Ordered dictionary of clip name -> frame paths in order
+    """
+    clips = {}
+    for each in os.listdir(img_path):
+        m = FRAME_NAME.match(each)
+        if m is not None:
+            clip = "{0}_{1}".format(m.group(1), m.group(2))
+            frame_path = os.path.join(img_path, each)
+            clips.setdefault(clip, []).append((int(m.group(3)), frame_path))
+    result = collections.OrderedDict()
+    for clip in sorted(clips):
+        result[clip] = [x[1] for x in sorted(clips[clip])]
+    return result
+
+
+def estimate_fps(frame_paths, default=15.0):
+    """
+    Estimates frame rate from modification times of frame files.
+    :param frame_paths: Frame file paths in order
+    :param default: Frame rate if times are no use
+    :return: Frames per second
+    """
+    if len(frame_paths) < 2:
+        return default
+    dt = os.path.getmtime(frame_paths[-1]) - os.path.getmtime(frame_paths[0])
+    if dt <= 0.0:
+        return default
+    return min(120.0, max(1.0, (len(frame_paths) - 1) / dt))
+
+
+def make_clip_movie(frame_paths, movie_path, fps, pool, ahead=16):
+    """
+    Encodes one movie while frames are decoded ahead on a pool.
+    :param frame_paths: Frame file paths in order
+    :param movie_path: Output movie path
+    :param fps: Frames per second
+    :param pool: ThreadPool for decoding
+    :param ahead: Maximum number of frames decoded ahead of encoder
+    :return: Number of frames written
+    """
+    pending = collections.deque()
+    paths = iter(frame_paths)
+    video_maker = None
+    ct = 0
+
+    while True:
+        # keep decoders busy up to lookahead limit
+        for each in paths:
+            pending.append(pool.apply_async(cv2.imread, (each,)))
+            if len(pending) >= ahead:
+                break
+        if not len(pending):
+            break
+
+        img = pending.popleft().get()
+        if img is None:
+            continue
+        if video_maker is None:
+            h, w = img.shape[:2]
+            video_maker = cv2.VideoWriter(movie_path,
+                                          poxcompat.fourcc('m', 'p', '4', 'v'),
+                                          fps, (w, h))
+            if not video_maker.isOpened():
+                break
+        video_maker.write(img)
+        ct += 1
+
+    if video_maker is not None:
+        video_maker.release()
+    return ct
+
+
+def make_movies(img_path, fps=None, workers=4):
+    """
+    Generates one MOV file per recorded clip in a directory of PNG files.
+    :param img_path: Directory of PNG files
+    :param fps: Frames per second, None to estimate from file times
+    :param workers: Number of decoding threads
+    :return: List of (movie path, frame count)
+    """
+    results = []
+    pool = ThreadPool(workers)
+    try:
+        for clip, frame_paths in group_frames(img_path).items():
+            clip_fps = fps
+            if clip_fps is None:
+                clip_fps = estimate_fps(frame_paths)
+            movie_path = os.path.join(img_path, clip + ".mov")
+            ct = make_clip_movie(frame_paths, movie_path, clip_fps, pool,
+                                 workers * 4)
+            results.append((movie_path, ct))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+class MovieDaemon(object):
+    """
+    Runs movie builder on a background thread so the App keeps running.
+    """
+
+    def __init__(self):
+        self._cmd_tx_queue = None
+        self._cmd_thread = None
+
+    def is_busy(self):
+        return self._cmd_thread is not None and self._cmd_thread.is_alive()
+
+    def start(self, cmd_tx_queue, img_path, fps=None, workers=4):
+        """
+        Starts building movies unless already busy.
+        :param cmd_tx_queue: App's event Queue
+        :param img_path: Directory of PNG files
+        :param fps: Frames per second, None to estimate from file times
+        :param workers: Number of decoding threads
+        :return: True if started, False if already busy
+        """
+        if self.is_busy():
+            return False
+        self._cmd_tx_queue = cmd_tx_queue
+        self._cmd_thread = threading.Thread(target=self._thread_function,
+                                            args=(img_path, fps, workers))
+        self._cmd_thread.setDaemon(True)
+        self._cmd_thread.start()
+        return True
+
+    def _thread_function(self, img_path, fps, workers):
+        results = make_movies(img_path, fps, workers)
+        if self._cmd_tx_queue is not None:
+            # let main app know movies are done
+            n = sum([x[1] for x in results])
+            s = "{0} {1} movies {2} frames".format(POX_MOV, len(results), n)
+            self._cmd_tx_queue.put(s)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Build one movie per clip from recorded PNG frames.")
+    parser.add_argument("img_path", help="directory of recorded frames")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="frame rate (default: estimate from file times)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of decoding threads")
+    args = parser.parse_args(argv)
+
+    results = make_movies(args.img_path, args.fps, args.workers)
+    if not len(results):
+        print "No PNG files found!"
+    for movie_path, ct in results:
+        print movie_path, ct, "frames"
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,137 @@
+# poxperf.py
+
+"""POX Performance Instrumentation
+
+The StageTimer class times each stage of a main loop iteration.
+
+- Stages are marked in order, each mark charges time since previous mark
+- A stage may be marked several times per iteration (times add up)
+- Per-iteration stage times go into fixed-bucket histograms
+- Recent average per stage for a live display
+
+"""
+
+import bisect
+import time
+
+
+# main loop stages
+S_CAPTURE = 0
+S_ROI = 1
+S_FACE = 2
+S_EYES = 3
+S_GRIN = 4
+S_RING = 5
+S_QUEUE = 6
+S_FSM = 7
+S_HUD = 8
+S_RECORD = 9
+S_KEY = 10
+
+STAGE_NAMES = ["capture", "roi", "face", "eyes", "grin", "ring",
+               "queue", "fsm", "hud", "record", "key"]
+
+# upper bounds of histogram buckets (ms), last bucket has no bound
+BUCKET_MS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200]
+
+
+class StageTimer(object):
+    """
+    Collects loop stage times.  Call start() before the loop,
+    mark() after each stage, and end() at the end of each iteration.
+    """
+
+    def __init__(self, names=STAGE_NAMES, bucket_ms=BUCKET_MS, alpha=0.05):
+        """
+        Initializes timer with empty histograms.
+        :param names: Stage names (in order of stage numbers)
+        :param bucket_ms: Upper bounds of histogram buckets in ms
+        :param alpha: Weight of newest iteration in recent averages
+        """
+        self.names = list(names)
+        self.bucket_ms = list(bucket_ms)
+        self._edges = [x / 1000.0 for x in bucket_ms]
+        self.alpha = alpha
+        n = len(self.names)
+        self.hist = [[0] * (len(bucket_ms) + 1) for _ in range(n)]
+        self.total = [0.0] * n
+        self.worst = [0.0] * n
+        self.recent = [0.0] * n
+        self.ct = 0
+        self._cur = [0.0] * n
+        self._t = time.time()
+
+    def start(self):
+        """
+        Starts timing first stage of next iteration from now.
+        """
+        self._t = time.time()
+
+    def mark(self, stage):
+        """
+        Charges time since previous mark to a stage.
+        :param stage: Stage number
+        """
+        t = time.time()
+        self._cur[stage] += t - self._t
+        self._t = t
+
+    def end(self):
+        """
+        Adds stage times of this iteration to histograms.
+        """
+        edges = self._edges
+        a = self.alpha
+        for i, dt in enumerate(self._cur):
+            self.hist[i][bisect.bisect_left(edges, dt)] += 1
+            self.total[i] += dt
+            if dt > self.worst[i]:
+                self.worst[i] = dt
+            self.recent[i] += a * (dt - self.recent[i])
+            self._cur[i] = 0.0
+        self.ct += 1
+
+    def percentile(self, stage, p):
+        """
+        Estimates a percentile from histogram.
+        :param stage: Stage number
+        :param p: Percentile (0 - 100)
+        :return: Upper bound of bucket with the percentile (ms),
+                 inf if in last bucket, None if no iterations
+        """
+        if not self.ct:
+            return None
+        target = self.ct * p / 100.0
+        acc = 0
+        for k, ct in enumerate(self.hist[stage]):
+            acc += ct
+            if acc >= target:
+                break
+        if k < len(self.bucket_ms):
+            return self.bucket_ms[k]
+        return float("inf")
+
+    def report(self):
+        """
+        Returns table of stage times (mean, max, p50, p90)
+        and histogram bucket counts.
+        :return: string
+        """
+        def fmt(x):
+            if x is None:
+                return "-"
+            if x > self.bucket_ms[-1]:
+                return ">{0}".format(self.bucket_ms[-1])
+            return str(x)
+
+        lines = ["iterations={0}".format(self.ct),
+                 "{0:8} {1:>8} {2:>8} {3:>6} {4:>6}  buckets (ms) {5}".format(
+                     "stage", "mean ms", "max ms", "p50<=", "p90<=",
+                     " ".join(str(x) for x in self.bucket_ms))]
+        for i, name in enumerate(self.names):
+            mean = self.total[i] * 1000.0 / max(self.ct, 1)
+            lines.append("{0:8} {1:8.2f} {2:8.2f} {3:>6} {4:>6}  {5}".format(
+                name, mean, self.worst[i] * 1000.0,
+                fmt(self.percentile(i, 50)), fmt(self.percentile(i, 90)),
+                " ".join(str(x) for x in self.hist[i])))
+        return "\n".join(lines)
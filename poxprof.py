@@ -0,0 +1,118 @@
+# poxprof.py
+
+"""POX Profiling stuff
+
+The LoopProfiler class profiles a number of main loop iterations
+on demand (no restart under cProfile needed).
+
+- Main thread is profiled with cProfile (saved as pstats file)
+- Main thread and any worker threads are also sampled every few ms
+- Samples are saved as collapsed stacks (one line per stack with count)
+  for flamegraph tools, e.g. flamegraph.pl prof_xxx.folded > prof.svg
+- Nothing runs until profiler is started
+
+"""
+
+import os
+import sys
+import time
+import threading
+import collections
+import cProfile
+
+
+def collapse(name, frame):
+    """
+    Converts a stack to a collapsed stack string.
+    :param name: Thread name (root of stack)
+    :param frame: Innermost frame
+    :return: String "name;file:func;file:func..." (outermost first)
+    """
+    items = []
+    while frame is not None:
+        code = frame.f_code
+        items.append("{0}:{1}".format(os.path.basename(code.co_filename),
+                                      code.co_name))
+        frame = frame.f_back
+    items.append(name)
+    return ";".join(reversed(items))
+
+
+class LoopProfiler(object):
+
+    def __init__(self, out_path, iterations=300, interval=0.005):
+        """
+        Initializes profiler (not started).
+        :param out_path: Folder for output files
+        :param iterations: Loop iterations to profile before stopping
+        :param interval: Seconds between stack samples
+        """
+        self.out_path = out_path
+        self.iterations = iterations
+        self.interval = interval
+        self.active = False
+        self._prof = None
+        self._k = 0
+        self._name = None
+        self._threads = []
+        self._stacks = None
+        self._sampler = None
+
+    def start(self, threads=None):
+        """
+        Starts profiling calling thread and sampling threads.
+        :param threads: List of (name, threading.Thread) for other threads
+        """
+        self._name = os.path.join(
+            self.out_path, "prof_{0}".format(time.strftime("%Y%m%d_%H%M%S")))
+        self._threads = [("main", threading.current_thread())]
+        self._threads.extend(threads or [])
+        self._stacks = collections.Counter()
+        self._k = 0
+        self.active = True
+        self._sampler = threading.Thread(target=self._sample_function)
+        self._sampler.setDaemon(True)
+        self._sampler.start()
+        self._prof = cProfile.Profile()
+        self._prof.enable()
+
+    def tick(self):
+        """
+        Counts a loop iteration and stops after last one.
+        :return: Output file name prefix if stopped, otherwise None
+        """
+        self._k += 1
+        if self._k >= self.iterations:
+            return self.stop()
+        return None
+
+    def stop(self):
+        """
+        Stops profiling and writes output files.
+        - <prefix>.pstats
+        - <prefix>.folded
+        :return: Output file name prefix
+        """
+        self._prof.disable()
+        self.active = False
+        self._sampler.join(1.0)
+        self._prof.dump_stats(self._name + ".pstats")
+        with open(self._name + ".folded", "w") as f:
+            for stack, ct in sorted(self._stacks.items()):
+                f.write("{0} {1}\n".format(stack, ct))
+        self._prof = None
+        return self._name
+
+    def _sample_function(self):
+        """
+        Implements sampling loop.
+        Takes a stack sample of each live thread until stopped.
+        """
+        while self.active:
+            frames = sys._current_frames()
+            for name, thread in self._threads:
+                frame = frames.get(thread.ident)
+                if frame is not None:
+                    self._stacks[collapse(name, frame)] += 1
+            frames = None
+            time.sleep(self.interval)
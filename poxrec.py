@@ -40,11 +40,19 @@ class RecWrapper(object):
     def __init__(self):
         self.r = None
         self.ok = False
+        self.ready = threading.Event()
 
     def go(self):
         """
         Initializes speech recognition and performs self-test with WAV file.
+        Sets ready event when done.
         """
+        try:
+            return self._go()
+        finally:
+            self.ready.set()
+
+    def _go(self):
         # TODO -- get own Google API key
         self.r = sr.Recognizer()
 
@@ -144,6 +152,8 @@ class RECDaemon(object):
             # requires at least two tokens:  <cmd> <data>
             if stokens[0] == "hear":
                 s = " ".join(stokens[1:])
+                # self-test may still be running
+                self.srec.ready.wait(TIMEOUT)
                 # subtracting some time makes sure next loop behaves
                 tx = time.time() + TIMEOUT - 1.0
                 while not result:
@@ -154,20 +164,28 @@ class RECDaemon(object):
                         break
         return result
 
-    def _thread_function(self):
+    def _self_test_function(self):
         """
-        Implements initialization, self-test, and daemon loop.
-        - Checks for command
-        - Begins speech recognition
-        - Let's App know when recognition is done and the result
+        Implements initialization and self-test.
+        Lets App know the result.
         """
-
-        # first do init and self-test
         result = self.srec.go()
         if self._cmd_tx_queue is not None:
             s = "{0} {1} {2}".format(POX_REC, "init", result)
             self._cmd_tx_queue.put(s)
 
+    def _thread_function(self):
+        """
+        Implements daemon loop.
+        - Starts init and self-test on its own thread (takes seconds)
+        - Checks for command
+        - Begins speech recognition
+        - Let's App know when recognition is done and the result
+        """
+        test_thread = threading.Thread(target=self._self_test_function)
+        test_thread.setDaemon(True)
+        test_thread.start()
+
         while True:
             item = self._cmd_rx_queue.get()
             self._cmd_rx_queue.task_done()
@@ -0,0 +1,206 @@
+# poxring.py
+
+"""POX Replay Ring stuff
+
+The FrameRing class is an always-on ring buffer of recent frames backed
+by a memory-mapped file.  Each slot also has the frame time and the
+detection result so the moments leading up to an event can be replayed.
+
+- Main loop pays a single copy per frame (into the mapped slot)
+- Slots keep shape of first frame, later frames of another size
+  (working scale changes) are resized into the slot with their face
+  rows so history survives scale changes
+- Last N seconds can be frozen to disk straight from the mapping
+  (on a background thread, main loop only copies slot metadata)
+- Frozen replays are loaded back with load_replay()
+
+Frozen replay files:
+    <name>.frames
+    - Raw frames in time order (uint8, shape is in metadata)
+    <name>.npz
+    - Frame times, found flags, frame shape, face rows as
+      frame, track id, primary, found, x, y, w, h and eye/grin rows as
+      frame, track id, x1, y1, x2, y2 (frame is index in replay)
+
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+# empty face and eye/grin tables (see CVMain.face_table)
+NO_FACES = np.zeros((0, 7), np.int32)
+NO_FEATURES = np.zeros((0, 5), np.int32)
+
+
+class FrameRing(object):
+
+    def __init__(self, path, seconds=20.0, fps=30.0):
+        """
+        Initializes ring (file is created when first frame arrives).
+        :param path: Backing file for frames
+        :param seconds: Ring duration at given frame rate
+        :param fps: Highest expected frame rate (for sizing)
+        """
+        self.path = path
+        self.size = max(1, int(seconds * fps))
+        self.frames = None
+        self.times = np.zeros(self.size, np.float64)
+        self.found = np.zeros(self.size, np.bool_)
+        self.faces = [NO_FACES] * self.size
+        self.features = [NO_FEATURES] * self.size
+        self.k = 0  # next slot
+        self.ct = 0  # frames pushed since (re)allocation
+        self._writers = []
+
+    def _alloc(self, shape, dtype):
+        # map backing file for this frame shape
+        self.frames = None
+        self.frames = np.memmap(self.path, dtype, "w+",
+                                shape=(self.size,) + shape)
+        self.k = 0
+        self.ct = 0
+
+    def push(self, frame, t, b_found, faces=NO_FACES,
+             features=NO_FEATURES):
+        """
+        Copies frame and detection result into next slot.
+        :param frame: Image (resized to slot size if needed)
+        :param t: Frame time
+        :param b_found: Detection flag
+        :param faces: Face rows (track id, primary, found, x, y, w, h)
+        :param features: Eye/grin rows (track id, x1, y1, x2, y2)
+        """
+        if self.frames is None or \
+                self.frames.shape[3:] != frame.shape[2:] or \
+                self.frames.dtype != frame.dtype:
+            self._alloc(frame.shape, frame.dtype)
+
+        k = self.k
+        h, w = self.frames.shape[1:3]
+        fx = fy = 1.0
+        if frame.shape[:2] == (h, w):
+            self.frames[k] = frame
+        else:
+            fx = float(w) / frame.shape[1]
+            fy = float(h) / frame.shape[0]
+            cv2.resize(frame, (w, h), dst=self.frames[k])
+        self.times[k] = t
+        self.found[k] = b_found
+        faces = np.array(faces, np.int32).reshape(-1, 7)
+        features = np.array(features, np.int32).reshape(-1, 5)
+        if fx != 1.0 or fy != 1.0:
+            faces[:, 3:] = faces[:, 3:] * (fx, fy, fx, fy)
+            features[:, 1:] = features[:, 1:] * (fx, fy, fx, fy)
+        self.faces[k] = faces
+        self.features[k] = features
+        self.k = (k + 1) % self.size
+        self.ct += 1
+
+    def _last_slots(self, seconds):
+        # slot index ranges (oldest first) covering last N seconds
+        n = min(self.ct, self.size)
+        if n == 0:
+            return []
+        start = (self.k - n) % self.size
+        order = np.roll(np.arange(self.size), -start)[:n]
+        if seconds is not None:
+            t_last = self.times[order[-1]]
+            order = order[self.times[order] >= t_last - seconds]
+        if not len(order):
+            return []
+        a = int(order[0])
+        b = int(order[-1]) + 1
+        if a < b:
+            return [(a, b)]
+        return [(a, self.size), (0, b)]
+
+    def freeze(self, name, seconds=None, on_done=None):
+        """
+        Writes last N seconds of frames and results to disk.
+        Slot metadata is copied here and files are written on
+        a background thread.  Frames go from mapped slots to file
+        without an extra copy (oldest first, ahead of new frames).
+        :param name: Output path without extension
+        :param seconds: Duration to keep, None for whole ring
+        :param on_done: Optional function(name, n, ok) called by writer
+                        (ok is False if ring overwrote frames being saved)
+        :return: Number of frames to be written
+        """
+        if self.frames is None:
+            return 0
+        slots = self._last_slots(seconds)
+        idx = [np.arange(a, b) for a, b in slots]
+        idx = np.concatenate(idx) if len(idx) else np.zeros(0, np.int64)
+        meta = {"times": self.times[idx], "found": self.found[idx],
+                "faces": self._rows(self.faces, idx, NO_FACES),
+                "features": self._rows(self.features, idx, NO_FEATURES),
+                "shape": np.array(self.frames.shape[1:]),
+                "dtype": np.array(self.frames.dtype.str)}
+        writer = threading.Thread(
+            target=self._write_function,
+            args=(name, self.frames, slots, meta, self.ct, on_done))
+        writer.setDaemon(True)
+        self._writers = [x for x in self._writers if x.is_alive()]
+        self._writers.append(writer)
+        writer.start()
+        return len(idx)
+
+    def _rows(self, tables, idx, empty):
+        # slot tables stacked with replay frame index in first column
+        rows = [np.zeros((0, empty.shape[1] + 1), np.int32)]
+        for i, k in enumerate(idx):
+            table = tables[k]
+            col = np.empty((len(table), 1), np.int32)
+            col[:] = i
+            rows.append(np.hstack((col, table)))
+        return np.vstack(rows)
+
+    def _write_function(self, name, frames, slots, meta, ct0, on_done):
+        """
+        Implements replay writer.
+        Frames are safe until ring wraps around onto the oldest one.
+        """
+        n = len(meta["times"])
+        with open(name + ".frames", "wb") as f:
+            for a, b in slots:
+                frames[a:b].tofile(f)
+        ok = self.ct - ct0 <= self.size - n
+        np.savez(name + ".npz", **meta)
+        if on_done is not None:
+            on_done(name, n, ok)
+
+    def wait(self):
+        """
+        Waits for replay writers to finish.
+        """
+        for writer in self._writers:
+            writer.join()
+        self._writers = []
+
+    def close(self):
+        """
+        Unmaps and removes backing file (after pending replays are saved).
+        """
+        self.wait()
+        if self.frames is not None:
+            self.frames = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def load_replay(name):
+    """
+    Loads a frozen replay.
+    :param name: Path given to FrameRing.freeze()
+    :return: (frames memmap, metadata dictionary)
+    """
+    meta = dict(np.load(name + ".npz"))
+    shape = tuple(meta["shape"])
+    n = len(meta["times"])
+    frames = np.memmap(name + ".frames", str(meta["dtype"]), "r",
+                       shape=(n,) + shape) if n else None
+    return frames, meta
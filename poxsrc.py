@@ -0,0 +1,215 @@
+# poxsrc.py
+
+"""POX Frame Source stuff
+
+Frame sources look like cv2.VideoCapture (isOpened, read, release)
+so the App can process frames from somewhere other than a live camera.
+
+- CameraSource for a live camera
+- VideoFileSource for a recorded video file
+- FrameDirSource for a directory of recorded img_*.png frames
+- SyntheticSource for generated frames (moving blob on noise)
+
+Recorded and synthetic sources either play at their frame rate or
+"free-run" as fast as frames can be processed.  In free-run mode
+each frame gets a virtual timestamp (frame number / frame rate) that
+the App feeds to the timers, so hours of footage go through detection
+and the state machines in minutes with the same timer behavior.
+
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+import poxmovie
+import poxcompat
+
+
+class FrameSource(object):
+    """
+    Base class for recorded and generated frames.
+    """
+
+    live = False
+
+    def __init__(self, fps=15.0, free_run=False):
+        """
+        :param fps: Frame rate for playback and virtual timestamps
+        :param free_run: True to read frames as fast as possible
+        """
+        self.fps = fps
+        self.free_run = free_run
+        self.t = 0.0  # timestamp of last frame read
+        self.k = 0  # frames read
+        self._t0 = None
+        self._done = False
+
+    def isOpened(self):
+        return True
+
+    def is_done(self):
+        return self._done
+
+    def release(self):
+        pass
+
+    def _grab(self):
+        """
+        Returns next image, or None at end of source.
+        """
+        raise NotImplementedError
+
+    def read(self):
+        """
+        Reads next frame and sets its timestamp.
+        :return: (ret, img) same as cv2.VideoCapture.read()
+        """
+        img = self._grab()
+        if img is None:
+            self._done = True
+            return False, None
+
+        if self._t0 is None:
+            self._t0 = time.time()
+        t_frame = self._t0 + self.k / self.fps
+        if self.free_run:
+            self.t = t_frame
+        else:
+            # play at frame rate
+            dt = t_frame - time.time()
+            if dt > 0.0:
+                time.sleep(dt)
+            self.t = time.time()
+        self.k += 1
+        return True, img
+
+
+class CameraSource(FrameSource):
+    """
+    Live camera (never free-runs).
+    """
+
+    live = True
+
+    def __init__(self, device=0):
+        FrameSource.__init__(self)
+        self.device = device
+        self.vcap = cv2.VideoCapture(device)
+
+    def isOpened(self):
+        return self.vcap.isOpened()
+
+    def release(self):
+        self.vcap.release()
+
+    def read(self):
+        ret, img = self.vcap.read()
+        self.t = time.time()
+        return ret, img
+
+
+class VideoFileSource(FrameSource):
+    """
+    Recorded video file.  Frame rate comes from file if available.
+    """
+
+    def __init__(self, path, free_run=False):
+        self.vcap = cv2.VideoCapture(path)
+        fps = self.vcap.get(poxcompat.CAP_PROP_FPS)
+        if not fps > 0.0:
+            fps = 15.0
+        FrameSource.__init__(self, fps, free_run)
+
+    def isOpened(self):
+        return self.vcap.isOpened()
+
+    def release(self):
+        self.vcap.release()
+
+    def _grab(self):
+        ret, img = self.vcap.read()
+        return img if ret else None
+
+
+class FrameDirSource(FrameSource):
+    """
+    Directory of recorded frames, clip by clip in frame number order.
+    Frame rate is estimated from file times unless given.
+    """
+
+    def __init__(self, path, fps=None, free_run=False, prefix="img"):
+        self.frame_paths = []
+        for clip, frame_paths in poxmovie.group_frames(path).items():
+            if clip.startswith(prefix + "_"):
+                self.frame_paths.extend(frame_paths)
+        if fps is None:
+            fps = poxmovie.estimate_fps(self.frame_paths)
+        FrameSource.__init__(self, fps, free_run)
+
+    def isOpened(self):
+        return len(self.frame_paths) > 0
+
+    def _grab(self):
+        while self.k < len(self.frame_paths):
+            img = cv2.imread(self.frame_paths[self.k])
+            if img is not None:
+                return img
+            # skip unreadable file
+            self.k += 1
+        return None
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated frames: a bright blob circling over fixed noise.
+    """
+
+    def __init__(self, shape=(480, 640, 3), fps=30.0, n=None,
+                 free_run=True, seed=0):
+        """
+        :param shape: Frame shape
+        :param fps: Frame rate
+        :param n: Number of frames, None for endless
+        :param free_run: True to read frames as fast as possible
+        :param seed: Random seed for noise background
+        """
+        FrameSource.__init__(self, fps, free_run)
+        rng = np.random.RandomState(seed)
+        self.n = n
+        self.bg = rng.randint(0, 64, shape).astype(np.uint8)
+
+    def frame_at(self, k):
+        """
+        Returns generated frame number k.
+        """
+        h, w = self.bg.shape[:2]
+        r = min(h, w) / 4
+        a = 2.0 * np.pi * k / 90.0
+        center = (int(w / 2 + r * np.cos(a)), int(h / 2 + r * np.sin(a)))
+        img = self.bg.copy()
+        cv2.circle(img, center, r / 2, (200, 200, 200), -1)
+        return img
+
+    def _grab(self):
+        if self.n is not None and self.k >= self.n:
+            return None
+        return self.frame_at(self.k)
+
+
+def open_source(spec, free_run=False):
+    """
+    Creates frame source from a command line style spec.
+    :param spec: Camera number, "synthetic", frame directory or video file
+    :param free_run: True to read recorded frames as fast as possible
+    :return: Frame source
+    """
+    if spec is None or spec.isdigit():
+        return CameraSource(int(spec or 0))
+    if spec == "synthetic":
+        return SyntheticSource(free_run=free_run)
+    if os.path.isdir(spec):
+        return FrameDirSource(spec, free_run=free_run)
+    return VideoFileSource(spec, free_run)
@@ -1,11 +1,45 @@
 """POX Utility Classes
 - PhraseManager Class
 - PolledTimer Class
+- VirtualClock Class (timer clock for replay faster than real time)
+- StartupTasks Class (concurrent timed init tasks)
 
 """
 
 import time
 import random
+import threading
+import collections
+
+
+# clock used by all PolledTimer objects
+# (replaced with a VirtualClock when replaying recorded frames)
+_clock = time.time
+
+
+def set_clock(clock=None):
+    """
+    Sets clock for all timers.
+    :param clock: Function returning seconds, None for system time
+    """
+    global _clock
+    _clock = clock if clock is not None else time.time
+
+
+class VirtualClock(object):
+    """
+    A VirtualClock only moves when it is set, e.g. to the timestamp of
+    each replayed frame, so timers expire in replay time.
+    """
+
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+    def set(self, t):
+        self.t = t
 
 
 class PolledTimer(object):
@@ -48,7 +82,7 @@ class PolledTimer(object):
         # set expiration time in the future
         # set integer seconds remaining with input value
         checked_time = min(self.MAX_INTERVAL, max(t_exp, self.MIN_INTERVAL))
-        self._texp = time.time() + checked_time
+        self._texp = _clock() + checked_time
         self._sec = t_exp
         self._maxsec = t_exp
 
@@ -62,7 +96,7 @@ class PolledTimer(object):
         """
         result = False
         if self._sec != 0:
-            t = time.time()
+            t = _clock()
             self._sec = int(self._texp - t) + 1
             if t > self._texp:
                 # issue "one-shot" flag for expiration
@@ -73,6 +107,82 @@ class PolledTimer(object):
         return result, self._sec
 
 
+class StartupTasks(object):
+    """
+    Runs init tasks concurrently, each on its own daemon thread,
+    and records how long each one took.
+    """
+
+    def __init__(self, on_done=None):
+        """
+        Initializes task runner.
+        :param on_done: Function called with this object after last task
+        """
+        self.t0 = time.time()
+        self.on_done = on_done
+        self._tasks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name, func, *args):
+        """
+        Adds a task (tasks begin when start() is called).
+        :param name: Task name
+        :param func: Task function
+        :param args: Task function arguments
+        """
+        task = {"result": None, "t": None, "dt": None}
+        task["thread"] = threading.Thread(target=self._run,
+                                          args=(task, func, args))
+        task["thread"].setDaemon(True)
+        self._tasks[name] = task
+
+    def start(self):
+        """
+        Starts all tasks.
+        """
+        for task in self._tasks.values():
+            task["thread"].start()
+
+    def wait(self, name, timeout=None):
+        """
+        Waits for a task to finish.
+        :param name: Task name
+        :param timeout: Seconds to wait, None for no limit
+        :return: Task function result (None if not finished)
+        """
+        task = self._tasks[name]
+        task["thread"].join(timeout)
+        return task["result"]
+
+    def report(self):
+        """
+        Returns task times.  Each task has total time since
+        runner was created and its own time in parentheses.
+        :return: string
+        """
+        items = []
+        for name, task in self._tasks.items():
+            if task["t"] is None:
+                items.append("{0}=...".format(name))
+            else:
+                items.append("{0}={1:.0f}ms({2:.0f}ms)".format(
+                    name, (task["t"] - self.t0) * 1000.0,
+                    task["dt"] * 1000.0))
+        return " ".join(items)
+
+    def _run(self, task, func, args):
+        t = time.time()
+        try:
+            task["result"] = func(*args)
+        finally:
+            with self._lock:
+                task["t"] = time.time()
+                task["dt"] = task["t"] - t
+                done = all(x["t"] is not None for x in self._tasks.values())
+            if done and self.on_done is not None:
+                self.on_done(self)
+
+
 class PhraseManager(object):
     """
     Container class for strings (phrases) read from a file.
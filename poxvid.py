@@ -0,0 +1,325 @@
+# poxvid.py
+
+"""POX Video Recording stuff
+
+The FrameRecorder class writes recorded frames to image files on a pool
+of writer threads so that file compression never stalls the main loop.
+
+- Bounded queue between main loop and writer threads
+- Drop policy when queue is full (drop oldest, drop newest, or block)
+- Counters for written and dropped frames
+- Clean flush on exit
+
+The ClipRecorder class streams frames straight into video files instead.
+
+- One or more segments per clip (rolled over by time or file size)
+- Segments stamped with frame rate measured from frame timestamps
+
+"""
+
+import os
+import time
+import threading
+import Queue
+
+import cv2
+
+import poxcompat
+
+
+DROP_OLDEST = "oldest"
+DROP_NEWEST = "newest"
+DROP_BLOCK = "block"
+
+DROP_POLICIES = [DROP_OLDEST, DROP_NEWEST, DROP_BLOCK]
+
+
+class FrameQueue(Queue.Queue):
+    """
+    Bounded queue of (file_path, frame, t) items that can discard its
+    oldest frame.  Control items (None, or file_path None for end of
+    clip) are never discarded.
+    """
+
+    def drop_oldest(self):
+        """
+        Removes oldest frame item (as if taken and done).
+        :return: True if a frame was removed
+        """
+        with self.mutex:
+            for k, item in enumerate(self.queue):
+                if item is not None and item[0] is not None:
+                    del self.queue[k]
+                    self.unfinished_tasks -= 1
+                    if self.unfinished_tasks == 0:
+                        self.all_tasks_done.notify_all()
+                    self.not_full.notify()
+                    return True
+        return False
+
+
+class FrameRecorder(object):
+
+    def __init__(self, workers=2, depth=32, policy=DROP_OLDEST,
+                 writer=cv2.imwrite):
+        """
+        Initializes recorder (not started).
+        :param workers: Number of writer threads
+        :param depth: Maximum number of frames waiting to be written
+        :param policy: What to do when queue is full (see DROP_POLICIES)
+        :param writer: Function (file_path, frame) that writes one frame
+        """
+        assert (policy in DROP_POLICIES)
+        self.policy = policy
+        self.writer = writer
+        self._workers = workers
+        self._frame_queue = FrameQueue(depth)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.ct_written = 0
+        self.ct_dropped = 0
+
+    def start(self):
+        """
+        Starts writer threads.
+        """
+        for _ in range(self._workers):
+            thread = threading.Thread(target=self._thread_function)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def post_frame(self, file_path, frame):
+        """
+        Enqueues a frame to be written.  Frame must not be modified
+        afterwards so caller should pass a copy of a reused buffer.
+        :param file_path: Output file path
+        :param frame: Image
+        """
+        item = (file_path, frame, time.time())
+        if self.policy == DROP_BLOCK:
+            self._frame_queue.put(item)
+        elif self.policy == DROP_NEWEST:
+            try:
+                self._frame_queue.put_nowait(item)
+            except Queue.Full:
+                self._count_drop()
+        else:
+            # make room by discarding oldest frames
+            # (new frame is dropped if queue only holds control items)
+            while True:
+                try:
+                    self._frame_queue.put_nowait(item)
+                    break
+                except Queue.Full:
+                    if self._frame_queue.drop_oldest():
+                        self._count_drop()
+                    elif self._frame_queue.full():
+                        self._count_drop()
+                        break
+
+    def flush(self):
+        """
+        Waits until all queued frames are written.
+        """
+        if len(self._threads):
+            self._frame_queue.join()
+
+    def stop(self):
+        """
+        Flushes queue and stops writer threads.
+        """
+        self.flush()
+        for _ in self._threads:
+            self._frame_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def report(self):
+        """
+        Returns summary of recorder counters.
+        :return: string
+        """
+        return "written={0} dropped={1} policy={2}".format(
+            self.ct_written, self.ct_dropped, self.policy)
+
+    def end_clip(self):
+        """
+        Marks end of a recorded clip (nothing to do for image files).
+        """
+        pass
+
+    def _write(self, file_path, frame, t):
+        """
+        Writes one frame.
+        :param file_path: Output file path
+        :param frame: Image
+        :param t: Time frame was posted
+        """
+        self.writer(file_path, frame)
+
+    def _count_drop(self):
+        with self._lock:
+            self.ct_dropped += 1
+
+    def _thread_function(self):
+        """
+        Implements writer loop.
+        - Takes frame from queue (this blocks)
+        - Writes it to file
+        """
+        while True:
+            item = self._frame_queue.get()
+            if item is None:
+                self._frame_queue.task_done()
+                break
+            self._write(*item)
+            if item[0] is not None:
+                with self._lock:
+                    self.ct_written += 1
+            self._frame_queue.task_done()
+
+
+class ClipRecorder(FrameRecorder):
+    """
+    Streams frames of each clip into video segments on a single
+    writer thread (so frames stay in order).  The first frames of a clip
+    are held until its frame rate can be measured.
+    """
+
+    MIN_FPS = 1.0
+    MAX_FPS = 120.0
+
+    def __init__(self, depth=32, policy=DROP_OLDEST, seg_sec=300.0,
+                 seg_bytes=200000000, fps_probe=30, ext=".mov"):
+        """
+        Initializes recorder (not started).
+        :param depth: Maximum number of frames waiting to be written
+        :param policy: What to do when queue is full (see DROP_POLICIES)
+        :param seg_sec: Maximum duration of a segment in seconds
+        :param seg_bytes: Maximum size of a segment file
+        :param fps_probe: Number of frames used to measure frame rate
+        :param ext: Video file extension
+        """
+        FrameRecorder.__init__(self, 1, depth, policy)
+        self.seg_sec = seg_sec
+        self.seg_bytes = seg_bytes
+        self.fps_probe = fps_probe
+        self.ext = ext
+        self.fourcc = poxcompat.fourcc('m', 'p', '4', 'v')
+        self.ct_segments = 0
+        self.seg_fps = 0.0
+        self._clip = None
+        self._probe = []
+        self._video = None
+        self._seg = 0
+        self._seg_path = None
+        self._seg_t0 = 0.0
+        self._seg_k = 0
+        self._clip_t0 = 0.0
+        self._clip_k = 0
+        self._last_t = 0.0
+
+    def end_clip(self):
+        """
+        Closes current segment once queued frames are written.
+        End marker is never dropped (frames queued after it are dropped
+        instead, see FrameQueue).
+        """
+        if len(self._threads):
+            self._frame_queue.put((None, None, time.time()))
+
+    def stop(self):
+        """
+        Flushes queue, stops writer thread, and closes segment.
+        """
+        FrameRecorder.stop(self)
+        self._close()
+
+    def report(self):
+        """
+        Returns summary of recorder counters.
+        :return: string
+        """
+        return "{0} segments={1} fps={2:.1f}".format(
+            FrameRecorder.report(self), self.ct_segments, self.seg_fps)
+
+    def _measure_fps(self):
+        # frame rate from timestamps of clip so far
+        # (limited since very short clips give silly numbers)
+        if self._clip_k < 2 or self._last_t <= self._clip_t0:
+            return 15.0
+        fps = (self._clip_k - 1) / (self._last_t - self._clip_t0)
+        return min(ClipRecorder.MAX_FPS, max(ClipRecorder.MIN_FPS, fps))
+
+    def _open(self, frame):
+        # new segment file for current clip
+        h, w = frame.shape[:2]
+        self.seg_fps = self._measure_fps()
+        self._seg_path = "{0}_{1}{2}".format(self._clip,
+                                            str(self._seg).zfill(2),
+                                            self.ext)
+        self._video = cv2.VideoWriter(self._seg_path, self.fourcc,
+                                      self.seg_fps, (w, h))
+        self._seg_t0 = self._clip_t0 if self._seg == 0 else self._last_t
+        self._seg_k = 0
+        self.ct_segments += 1
+
+    def _flush_probe(self):
+        # open segment and write frames held for measuring frame rate
+        if len(self._probe):
+            self._open(self._probe[0])
+            for frame in self._probe:
+                self._video.write(frame)
+            self._seg_k = len(self._probe)
+            self._probe = []
+
+    def _close(self):
+        self._flush_probe()
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+    def _segment_full(self, t):
+        # roll over by time, check file size every so often
+        if t - self._seg_t0 > self.seg_sec:
+            return True
+        if self._seg_k % 30 == 0 and os.path.exists(self._seg_path):
+            return os.path.getsize(self._seg_path) > self.seg_bytes
+        return False
+
+    def _write(self, file_path, frame, t):
+        """
+        Writes one frame to current segment of clip.
+        :param file_path: Clip path prefix (None to end clip)
+        :param frame: Image (None to end clip)
+        :param t: Time frame was posted
+        """
+        if frame is None or file_path != self._clip:
+            # end of previous clip
+            self._close()
+            self._clip = file_path
+            self._seg = 0
+            self._clip_k = 0
+            if frame is None:
+                return
+
+        if self._clip_k == 0:
+            self._clip_t0 = t
+        self._clip_k += 1
+        self._last_t = t
+
+        if self._video is None:
+            # hold first frames of clip until frame rate can be measured
+            self._probe.append(frame)
+            if self._clip_k >= self.fps_probe:
+                self._flush_probe()
+            return
+
+        if self._segment_full(t):
+            self._close()
+            self._seg += 1
+            self._open(frame)
+        self._video.write(frame)
+        self._seg_k += 1
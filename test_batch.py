@@ -0,0 +1,103 @@
+import unittest
+
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+import poxcv as pcv
+import poxbatch as pb
+from testutil import FakeCascade
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_batch1_shards(self):
+        # shards cover all frames without overlap
+        self.assertEqual(pb.make_shards(5, 2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(pb.make_shards(0, 2), [])
+
+    def setUp(self):
+        self.img_path = tempfile.mkdtemp()
+        for k in range(10):
+            img = np.zeros((100, 100, 3), np.uint8)
+            name = "img_01_{0:05d}.png".format(k)
+            cv2.imwrite(os.path.join(self.img_path, name), img)
+
+    def tearDown(self):
+        shutil.rmtree(self.img_path)
+
+    def test_batch2_range(self):
+        # results for a range of recorded frames in frame order
+        self.assertEqual(pb.count_frames(self.img_path), 10)
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(8, 8, 32, 32)])
+        settings = {"scale": 0.5, "roi": (0.1, 0.2),
+                    "eyes": False, "grin": False}
+        start, found, faces, features = pb.detect_range(
+            cvx, settings, self.img_path, 1, 4)
+        self.assertEqual(start, 1)
+        self.assertEqual(found.tolist(), [True] * 3)
+        self.assertEqual(faces[:, 0].tolist(), [1, 2, 3])
+        self.assertEqual(faces[0].tolist(), [1, 1, 1, 1, 8, 8, 32, 32])
+        self.assertEqual(features.shape, (0, 6))
+
+    def test_batch4_faces(self):
+        # every face gets a row with its track ID, features follow faces
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(2, 2, 20, 20), (26, 26, 28, 28)])
+        cvx.cc_eyes = FakeCascade([(2, 2, 6, 6)])
+        cvx.secondary_interval = 1
+        settings = {"scale": 0.5, "roi": (0.1, 0.2),
+                    "eyes": True, "grin": False}
+        _, found, faces, features = pb.detect_range(
+            cvx, settings, self.img_path, 0, 2)
+        self.assertEqual(faces[:, :4].tolist(),
+                         [[0, 1, 0, 1], [0, 2, 1, 1],
+                          [1, 1, 0, 1], [1, 2, 1, 1]])
+        self.assertEqual(features.tolist(),
+                         [[0, 1, 4, 4, 10, 10], [0, 2, 28, 28, 34, 34],
+                          [1, 1, 4, 4, 10, 10], [1, 2, 28, 28, 34, 34]])
+
+    def test_batch3_order(self):
+        # shard results do not depend on shards run before by worker
+        settings = {"scale": 0.5, "roi": (0.1, 0.2),
+                    "eyes": True, "grin": False}
+
+        def make():
+            cvx = pcv.CVMain()
+            cvx.cc_face = FakeCascade([(8, 8, 24, 24), (30, 30, 24, 24)])
+            cvx.cc_eyes = FakeCascade([(2, 2, 6, 6)])
+            return cvx
+
+        fresh = pb.detect_range(make(), settings, self.img_path, 5, 10)
+        cvx = make()
+        pb.detect_range(cvx, settings, self.img_path, 0, 4)
+        used = pb.detect_range(cvx, settings, self.img_path, 5, 10)
+        for a, b in zip(fresh[1:], used[1:]):
+            self.assertEqual(a.tolist(), b.tolist())
+
+    def test_batch5_bad_cascades(self):
+        # missing cascade files end batch with an error before any pool
+        out = os.path.join(self.img_path, "out.npz")
+        t0 = time.time()
+        ret = pb.main([self.img_path, "-o", out, "--workers", "2",
+                       "--cascades", "/nonexistent/"])
+        self.assertEqual(ret, 1)
+        self.assertTrue(time.time() - t0 < 5.0)
+        self.assertFalse(os.path.exists(out))
+
+    def test_batch6_worker_error(self):
+        # worker that failed to load reports error instead of raising
+        pb._init_worker("/nonexistent/", {"detector": "haar"})
+        try:
+            error, result = pb._detect_shard((self.img_path, 0, 2))
+        finally:
+            pb._worker.clear()
+        self.assertTrue("/nonexistent/" in error)
+        self.assertTrue(result is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
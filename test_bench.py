@@ -0,0 +1,101 @@
+import unittest
+
+import poxcv as pcv
+import poxbench as pbn
+from testutil import FakeCascade
+
+
+class TestBench(unittest.TestCase):
+
+    def test_bench1_case(self):
+        # one result per case with ordered percentiles
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(8, 8, 32, 32)])
+        cvx.cc_eyes = FakeCascade([(2, 2, 6, 6)])
+        frames = pbn.load_corpus(5)
+        self.assertEqual(len(frames), 5)
+        results = pbn.bench_detect(cvx, frames, shapes=[(120, 160)],
+                                   scales=[0.5, 1.0],
+                                   features=[(False, False), (True, False)])
+        self.assertEqual(sorted(results), ["160x120_s0.5_e0_g0",
+                                           "160x120_s0.5_e1_g0",
+                                           "160x120_s1.0_e0_g0",
+                                           "160x120_s1.0_e1_g0"])
+        r = results["160x120_s1.0_e1_g0"]
+        self.assertEqual(r["found"], 5)
+        self.assertTrue(r["p50"] <= r["p90"] <= r["p99"])
+        self.assertTrue(r["fps"] > 0)
+        # allocations only counted where tracemalloc is available
+        if pbn.tracemalloc is None:
+            self.assertTrue(r["allocs"] is None)
+        else:
+            self.assertTrue(r["allocs"] >= 0)
+
+    def test_bench5_case_state(self):
+        # case runs at its own scale and does not depend on earlier cases
+        def make():
+            cvx = pcv.CVMain()
+            cvx.cc_face = FakeCascade([(8, 8, 32, 32), (60, 8, 40, 40)])
+            cvx.cc_eyes = FakeCascade([(2, 2, 6, 6)])
+            cvx.secondary_interval = 3
+            return cvx
+
+        frames = pbn.load_corpus(5)
+        fresh = make()
+        pbn.bench_case(fresh, frames, 1.0, True, False)
+        used = make()
+        pbn.bench_case(used, frames[:4], 0.5, True, False)
+        ct0 = used.cc_eyes.ct
+        pbn.bench_case(used, frames, 1.0, True, False)
+        self.assertEqual(used.cc_eyes.ct - ct0, fresh.cc_eyes.ct)
+        ref = pcv.CVMain()
+        ref.set_scale(1.0)
+        self.assertEqual(used.cc_face.args[4], ref.size_face)
+        self.assertEqual(used.scale, 0.5)
+        self.assertEqual(used.size_face, pcv.CVMain().size_face)
+
+    def test_bench3_backends(self):
+        # agreement with reference backend
+        ref = pcv.CVMain()
+        ref.cc_face = FakeCascade([(8, 8, 32, 32)])
+        other = pcv.CVMain()
+        other.set_backend("lbp")
+        other.cc_face = FakeCascade([(10, 10, 32, 32), (60, 0, 20, 20)])
+        frames = pbn.load_corpus(3)
+        results = pbn.bench_backends({"haar": ref, "lbp": other}, frames,
+                                     "haar")
+        self.assertEqual(results["haar"]["recall"], 1.0)
+        self.assertEqual(results["lbp"]["faces"], 6)
+        self.assertEqual(results["lbp"]["recall"], 1.0)
+        self.assertEqual(results["lbp"]["precision"], 0.5)
+
+    def test_bench4_fsm(self):
+        # scripted session runs to the end (halted) with same outputs
+        # from original crank and transition tables
+        results = pbn.bench_fsm(2, repeat=1)
+        self.assertTrue(results["legacy"] > 0)
+        self.assertTrue(results["table"] > 0)
+        self.assertEqual(len(results["legacy_outputs"]), 19)
+        self.assertEqual(results["table_outputs"],
+                         results["legacy_outputs"])
+
+    def test_bench2_compare(self):
+        # only increases above threshold are regressions
+        baseline = {"a": {"p50": 10.0, "p90": 20.0, "allocs": None},
+                    "b": {"p50": 10.0, "p90": 20.0, "allocs": 100}}
+        results = {"a": {"p50": 11.0, "p90": 30.0, "allocs": 5},
+                   "b": {"p50": 5.0, "p90": 20.0, "allocs": 150},
+                   "c": {"p50": 99.0, "p90": 99.0, "allocs": None}}
+        regressions = pbn.compare(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("a p90"))
+        self.assertTrue(regressions[1].startswith("b allocs"))
+
+        # allocations counted different ways are not compared
+        results["b"]["alloc_unit"] = "blocks"
+        baseline["b"]["alloc_unit"] = "bytes"
+        self.assertEqual(len(pbn.compare(results, baseline, 0.2)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import time
+import poxcap as pc
+
+
+class FakeCapture(object):
+    # produces numbered "frames" at a fixed rate
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.k = 0
+
+    def read(self):
+        time.sleep(self.interval)
+        self.k += 1
+        return True, self.k
+
+    def release(self):
+        pass
+
+
+class TestCap(unittest.TestCase):
+
+    def test_cap1_freshest(self):
+        # slow consumer always gets newest frame and older ones are dropped
+        grabber = pc.FrameGrabber(FakeCapture(0.01), depth=2)
+        grabber.start()
+        time.sleep(0.2)
+        ret, img = grabber.read()
+        grabber.stop()
+        self.assertTrue(ret)
+        self.assertTrue(img >= grabber.ct_grab - 1)
+        self.assertTrue(grabber.ct_drop > 0)
+        self.assertEqual(grabber.ct_take, 1)
+
+    def test_cap2_timeout(self):
+        # nothing captured before timeout
+        grabber = pc.FrameGrabber(FakeCapture(1.0))
+        grabber.start()
+        ret, img = grabber.read(timeout=0.1)
+        grabber.stop()
+        self.assertFalse(ret)
+        self.assertTrue(img is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
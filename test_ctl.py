@@ -0,0 +1,48 @@
+import unittest
+
+import time
+import socket
+import poxctl as pc
+
+
+class TestCtl(unittest.TestCase):
+
+    def test_ctl1_keys(self):
+        # each character is a key press, command words are one key
+        ctl = pc.ControlDaemon()
+        self.assertEqual(ctl.poll_key(), -1)
+        ctl.post_line("g1\n")
+        ctl.post_line(" esc \n")
+        ctl.post_line("prof\n")
+        self.assertEqual(ctl.poll_key(), ord('g'))
+        self.assertEqual(ctl.poll_key(), ord('1'))
+        self.assertEqual(ctl.poll_key(), pc.KEY_ESC)
+        self.assertEqual(ctl.poll_key(), ord('F'))
+        self.assertEqual(ctl.poll_key(), -1)
+
+    def test_ctl2_socket(self):
+        # keys sent through local control socket
+        ctl = pc.ControlDaemon()
+        ctl.start(50507)
+        conn = None
+        for _ in range(20):
+            try:
+                conn = socket.create_connection(("127.0.0.1", 50507))
+                break
+            except socket.error:
+                time.sleep(0.05)
+        conn.sendall("hV\n")
+        conn.close()
+        keys = []
+        for _ in range(20):
+            key = ctl.poll_key()
+            if key != -1:
+                keys.append(key)
+            if len(keys) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual(keys, [ord('h'), ord('V')])
+
+
+if __name__ == '__main__':
+    unittest.main()
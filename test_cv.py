@@ -0,0 +1,464 @@
+import unittest
+
+import os
+import tempfile
+import threading
+import numpy as np
+import poxcv as pcv
+from testutil import FakeCascade
+
+
+def make_scene(x, y):
+    # flat gray scene with a textured "face" patch at (x, y)
+    rng = np.random.RandomState(1)
+    patch = rng.randint(0, 255, (40, 40)).astype(np.uint8)
+    scene = np.zeros((120, 160), np.uint8)
+    scene[:] = 128
+    scene[y:y + 40, x:x + 40] = patch
+    return scene
+
+
+class PickyCascade(object):
+    # finds one face only with strict neighbors and smaller min sizes
+
+    def detectMultiScale(self, r, scale, neighbors, flags, size):
+        if neighbors >= 3 and size[0] <= 80:
+            return [(10, 10, 90, 90)]
+        return []
+
+
+def get_roi(h, w):
+    # same as App.get_roi with default percentages
+    return int(0.1 * h), int(0.9 * h), int(0.2 * w), int(0.8 * w)
+
+
+class ThreadCascade(FakeCascade):
+    # remembers which thread used it
+
+    def detectMultiScale(self, *args):
+        self.thread = threading.current_thread()
+        return FakeCascade.detectMultiScale(self, *args)
+
+
+class TestCV(unittest.TestCase):
+
+    def test_lazy1_missing(self):
+        # missing cascade file is reported once and finds nothing
+        cc = pcv.LazyCascade("no_such_cascade.xml")
+        r = np.zeros((40, 40), np.uint8)
+        self.assertEqual(cc.detectMultiScale(r, 1.1, 2, 0, (10, 10)), [])
+        self.assertEqual(cc.fname, None)
+        self.assertFalse(cc.load())
+
+    def test_track1_follow(self):
+        # template follows patch that moved a few pixels
+        cvx = pcv.CVMain()
+        r = make_scene(50, 40)
+        cvx._track_faces = [[r[40:80, 50:90].copy(), (50, 40, 40, 40)]]
+        faces = cvx._track(make_scene(56, 37))
+        self.assertEqual(faces, [(56, 37, 40, 40)])
+        self.assertEqual(cvx._track_faces[0][1], (56, 37, 40, 40))
+
+    def test_track2_lost(self):
+        # patch gone so tracker gives up
+        cvx = pcv.CVMain()
+        r = make_scene(50, 40)
+        cvx._track_faces = [[r[40:80, 50:90].copy(), (50, 40, 40, 40)]]
+        blank = np.zeros((120, 160), np.uint8)
+        blank[:] = 128
+        blank[::2, ::3] = 0
+        self.assertTrue(cvx._track(blank) is None)
+
+    def test_track3_interval(self):
+        # cascade runs once then tracker for track_interval frames
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(50, 40, 40, 40)])
+        cvx.track_enable = True
+        cvx.track_interval = 3
+        r = make_scene(50, 40)
+        for _ in range(8):
+            self.assertEqual(len(cvx._find_faces(r)), 1)
+        self.assertEqual(cvx.cc_face.ct, 2)
+        self.assertEqual(cvx.ct_track, 6)
+
+    def test_track4_multi(self):
+        # every detected face is tracked, losing one means full detection
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(10, 10, 40, 40), (100, 60, 40, 40)])
+        cvx.track_enable = True
+        r = make_scene(10, 10)
+        r[60:100, 100:140] = make_scene(0, 0)[0:40, 0:40]
+        self.assertEqual(len(cvx._find_faces(r)), 2)
+        self.assertEqual(cvx._find_faces(r),
+                         [(10, 10, 40, 40), (100, 60, 40, 40)])
+        self.assertEqual(cvx.ct_track, 1)
+        r[60:100, 100:140] = 128
+        cvx._find_faces(r)
+        self.assertEqual(cvx.cc_face.ct, 2)
+
+    def test_window1_hit(self):
+        # second search is in padded window at limited scale range
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(50, 40, 80, 80)])
+        cvx.window_enable = True
+        r = np.zeros((300, 400), np.uint8)
+        cvx._detect_faces(r)
+        self.assertEqual(cvx._last_faces, [(50, 40, 80, 80)])
+        cvx.cc_face.rects = [(10, 10, 80, 80)]
+        faces = cvx._detect_faces(r)
+        self.assertEqual(faces, [(20, 10, 80, 80)])
+        self.assertEqual(cvx.window_size, (160, 160))
+        self.assertEqual(cvx.cc_face.args[4], (64, 64))
+        self.assertEqual(cvx.cc_face.args[5], (100, 100))
+        self.assertEqual(cvx.ct_window_hit, 1)
+
+    def test_window2_fallback(self):
+        # miss in window falls back to whole ROI
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(50, 40, 80, 80)])
+        cvx.window_enable = True
+        r = np.zeros((300, 400), np.uint8)
+        cvx._detect_faces(r)
+        cvx.cc_face.rects = []
+        cvx._detect_faces(r)
+        self.assertEqual(cvx.ct_window_miss, 1)
+        self.assertEqual(cvx.cc_face.ct, 3)
+        self.assertEqual(cvx._last_faces, [])
+
+    def test_window3_multi(self):
+        # each face gets its own window, full search every interval
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(50, 40, 80, 80), (250, 40, 80, 80)])
+        cvx.window_enable = True
+        cvx.window_interval = 2
+        r = np.zeros((300, 400), np.uint8)
+        cvx._detect_faces(r)
+        cvx.cc_face.rects = [(10, 10, 80, 80)]
+        faces = cvx._detect_faces(r)
+        self.assertEqual(faces, [(20, 10, 80, 80), (220, 10, 80, 80)])
+        self.assertEqual(cvx.cc_face.ct, 3)
+        cvx._detect_faces(r)
+        self.assertEqual(cvx.cc_face.ct, 5)
+        cvx._detect_faces(r)
+        self.assertEqual(cvx.cc_face.ct, 6)
+        self.assertEqual(cvx._last_faces, [(10, 10, 80, 80)])
+        self.assertEqual(cvx.ct_window_hit, 2)
+
+    def test_iou1(self):
+        # overlap ratio of face rectangles
+        self.assertEqual(pcv.rect_iou((0, 0, 10, 10), (0, 0, 10, 10)), 1.0)
+        self.assertEqual(pcv.rect_iou((0, 0, 10, 10), (20, 0, 10, 10)), 0.0)
+        self.assertAlmostEqual(
+            pcv.rect_iou((0, 0, 10, 10), (5, 0, 10, 10)), 1.0 / 3.0)
+
+    def _pipeline(self, pool, cvx, img):
+        # steady-state frame stages from App.loop (no drawing)
+        small, roi = pool.prepare(img, 0.5, get_roi)
+        return cvx.detect(roi, True, False, pool.gray)
+
+    def test_pool1_reuse(self):
+        # buffers are allocated once and reused for every frame
+        pool = pcv.FramePool()
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade(())
+        img = np.zeros((480, 640, 3), np.uint8)
+        self._pipeline(pool, cvx, img)
+        small, gray = pool.small, pool.gray
+        for k in range(5):
+            img[:] = k
+            self._pipeline(pool, cvx, img)
+        self.assertTrue(pool.small is small)
+        self.assertTrue(pool.gray is gray)
+        self.assertEqual(pool.small.shape, (240, 320, 3))
+        self.assertEqual(pool.gray.shape, (192, 192))
+        self.assertTrue(np.all(pool.gray == 4))
+
+    def test_pool2_crop_first(self):
+        # without display the ROI is cropped then scaled
+        pool = pcv.FramePool()
+        img = np.zeros((480, 640, 3), np.uint8)
+        small, roi = pool.prepare(img, 0.5, get_roi, display=False)
+        self.assertTrue(small is None)
+        self.assertTrue(roi is pool.roi)
+        self.assertEqual(roi.shape, (192, 192, 3))
+
+    def test_pool3_no_alloc(self):
+        # steady-state frames write into same memory every time
+        # (for display and no-display paths)
+        def ptr(a):
+            return a.__array_interface__["data"][0]
+
+        pool = pcv.FramePool()
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade(())
+        img = np.zeros((480, 640, 3), np.uint8)
+        for display in (True, False):
+            small, roi = pool.prepare(img, 0.5, get_roi, display)
+            cvx.detect(roi, True, False, pool.gray)
+            bufs = [ptr(roi), ptr(pool.gray)]
+            if display:
+                bufs.append(ptr(small))
+            for k in range(10):
+                img[:] = k
+                small, roi = pool.prepare(img, 0.5, get_roi, display)
+                cvx.detect(roi, True, False, pool.gray)
+                x = [ptr(roi), ptr(pool.gray)]
+                if display:
+                    x.append(ptr(small))
+                self.assertEqual(x, bufs)
+            self.assertTrue(np.all(pool.gray == 9))
+
+    def test_par1_same(self):
+        # grin found on worker thread gives same results as serial
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(10, 10, 80, 80)])
+        cvx.cc_eyes = FakeCascade([(5, 5, 10, 10), (40, 5, 10, 10)])
+        cvx.cc_grin = ThreadCascade([(8, 4, 30, 10)])
+        img = np.zeros((120, 160, 3), np.uint8)
+        serial = cvx.detect(img, True, True)
+        self.assertEqual(cvx.cc_grin.thread, threading.current_thread())
+        cvx.set_parallel(True)
+        try:
+            parallel = cvx.detect(img, True, True)
+        finally:
+            cvx.set_parallel(False)
+        self.assertNotEqual(cvx.cc_grin.thread, threading.current_thread())
+        self.assertEqual(serial, parallel)
+        self.assertEqual(len(parallel[1]), 6)
+        self.assertEqual(parallel[1][5], [(18, 64), (48, 74)])
+
+    def test_scale1_sizes(self):
+        # size limits follow working scale
+        cvx = pcv.CVMain()
+        cvx.apply_profile({"face_scale": 1.1, "face_neighbors": 3,
+                           "size_face": 80})
+        cvx.set_scale(0.25)
+        self.assertEqual(cvx.size_face, (40, 40))
+        self.assertEqual(cvx.size_eyes, (12, 12))
+        cvx.set_scale(0.5)
+        self.assertEqual(cvx.size_face, (80, 80))
+
+    def test_scale3_tracks(self):
+        # scale change keeps track IDs and moves faces to new scale
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(20, 10, 40, 40), (80, 10, 60, 60)])
+        cvx.cc_eyes = FakeCascade([(4, 4, 10, 10)])
+        img = np.zeros((160, 200, 3), np.uint8)
+        cvx.detect(img, True, False)
+        cvx.set_scale(0.25)
+        tracks = cvx.face_tracks.tracks
+        self.assertEqual([t.id for t in tracks], [1, 2])
+        self.assertEqual([t.rect for t in tracks],
+                         [(10, 5, 20, 20), (40, 5, 30, 30)])
+        self.assertEqual(tracks[1].feature_boxes, [[(42, 7), (47, 12)]])
+        cvx.cc_face.rects = [(11, 5, 20, 20), (40, 6, 30, 30)]
+        cvx.detect(img, True, False)
+        faces, features = cvx.face_table()
+        self.assertEqual(faces[:, 0].tolist(), [1, 2])
+        self.assertEqual(faces[:, 1].tolist(), [0, 1])
+        self.assertEqual(faces[1].tolist(), [2, 1, 1, 40, 6, 30, 30])
+        self.assertEqual(features.tolist(), [[2, 44, 10, 54, 20]])
+
+    def test_scale2_control(self):
+        # slow loop steps down, then holds, fast loop with small face
+        # steps up, big face steps down only while face stays big enough
+        ctl = pcv.ScaleController(0.5, target_fps=10.0, hold=5)
+        for _ in range(5):
+            x = ctl.update(0.2, 0)
+        self.assertEqual(x, 0.45)
+        for _ in range(4):
+            x = ctl.update(0.001, 0)
+        self.assertEqual(x, 0.45)
+        x = ctl.update(0.001, 30)
+        self.assertEqual(x, 0.5)
+        for _ in range(5):
+            x = ctl.update(0.08, 200)
+        self.assertEqual(x, 0.45)
+        for _ in range(5):
+            x = ctl.update(0.2, 52)
+        self.assertEqual(x, 0.45)
+        self.assertEqual(ctl.ct_change, 3)
+
+    def test_gate1_static(self):
+        # static scene reuses positive result until interval expires
+        gate = pcv.MotionGate(max_reuse_sec=0.5)
+        img = np.zeros((120, 160, 3), np.uint8)
+        img[40:80, 60:100] = 200
+        result = (True, [[(1, 2), (3, 4)]])
+        self.assertFalse(gate.check(img, 0.0))
+        gate.store(result[0], result[1], 0.0)
+        self.assertTrue(gate.check(img, 0.1))
+        self.assertEqual(gate.last, result)
+        self.assertTrue(gate.check(img, 0.4))
+        self.assertFalse(gate.check(img, 0.5))
+        gate.store(result[0], result[1], 0.5)
+        self.assertEqual((gate.ct_run, gate.ct_skip), (2, 2))
+
+    def test_gate2_motion(self):
+        # motion or negative result means full detection
+        gate = pcv.MotionGate()
+        img = np.zeros((120, 160, 3), np.uint8)
+        gate.check(img, 0.0)
+        gate.store(False, [], 0.0)
+        self.assertFalse(gate.check(img, 0.1))
+        gate.store(True, [], 0.1)
+        self.assertTrue(gate.check(img, 0.2))
+        img[40:80, 60:100] = 200
+        self.assertFalse(gate.check(img, 0.3))
+        gate.store(True, [], 0.3)
+        img += 5
+        self.assertTrue(gate.check(img, 0.4))
+
+    def test_gate3_reset(self):
+        # stale reference from before gate was off is not reused
+        gate = pcv.MotionGate()
+        img = np.zeros((120, 160, 3), np.uint8)
+        gate.check(img, 0.0)
+        gate.store(True, [], 0.0)
+        # gate off: detections stored without checks
+        gate.store(True, [], 0.1)
+        gate.reset()
+        self.assertFalse(gate.check(img, 0.2))
+        gate.store(True, [], 0.2)
+        self.assertTrue(gate.check(img, 0.3))
+
+    def test_faces1_ids(self):
+        # IDs follow moving faces, primary stays while its track lives
+        tracks = pcv.FaceTracks(max_missing=1)
+        seen = tracks.update([(10, 10, 40, 40), (100, 10, 60, 60)])
+        self.assertEqual([t.id for t in seen], [1, 2])
+        self.assertEqual(tracks.primary.id, 2)
+        seen = tracks.update([(104, 12, 60, 60), (12, 10, 40, 40)])
+        self.assertEqual([t.id for t in seen], [2, 1])
+        seen = tracks.update([(12, 10, 40, 40)])
+        self.assertEqual([t.id for t in seen], [1])
+        self.assertEqual(tracks.primary.id, 2)
+        seen = tracks.update([(12, 10, 40, 40), (200, 10, 80, 80)])
+        self.assertEqual([t.id for t in seen], [1, 3])
+        self.assertEqual(tracks.primary.id, 3)
+
+    def test_faces2_secondary(self):
+        # all faces get boxes, secondary faces searched every Nth frame
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(10, 10, 40, 40), (80, 10, 60, 60)])
+        cvx.cc_eyes = FakeCascade([(5, 5, 10, 10)])
+        cvx.secondary_interval = 3
+        img = np.zeros((120, 160, 3), np.uint8)
+        ct = []
+        for _ in range(6):
+            b_found, boxes = cvx.detect(img, True, False)
+            self.assertTrue(b_found)
+            ct.append(cvx.cc_eyes.ct)
+        self.assertEqual(ct, [1, 2, 4, 5, 6, 8])
+        self.assertEqual(len(boxes), 8)
+        self.assertEqual(cvx.face_w, 60)
+        cvx.cc_eyes.rects = []
+        b_found, boxes = cvx.detect(img, True, False)
+        self.assertFalse(b_found)
+        self.assertEqual(len(boxes), 7)
+
+    def test_stagger1_steady(self):
+        # still face: eyes and grin refreshed in turn every stale_max frames
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(10, 10, 80, 80)])
+        cvx.cc_eyes = FakeCascade([(5, 5, 10, 10)])
+        cvx.cc_grin = FakeCascade([(8, 4, 30, 10)])
+        cvx.stagger_enable = True
+        cvx.stale_max = 4
+        img = np.zeros((120, 160, 3), np.uint8)
+        calls = []
+        for _ in range(12):
+            eyes0, grin0 = cvx.cc_eyes.ct, cvx.cc_grin.ct
+            b_found, boxes = cvx.detect(img, True, True)
+            self.assertTrue(b_found)
+            self.assertEqual(len(boxes), 5)
+            calls.append((cvx.cc_eyes.ct - eyes0, cvx.cc_grin.ct - grin0))
+        self.assertEqual(calls, [(1, 1), (0, 0), (0, 0), (1, 0),
+                                 (0, 1), (0, 0), (0, 0), (1, 0),
+                                 (0, 1), (0, 0), (0, 0), (1, 0)])
+
+    def test_stagger2_moved(self):
+        # small move reuses shifted boxes, big move searches again
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([(10, 10, 80, 80)])
+        cvx.cc_eyes = FakeCascade([(5, 5, 10, 10)])
+        cvx.stagger_enable = True
+        img = np.zeros((120, 160, 3), np.uint8)
+        cvx.detect(img, True, False)
+        cvx.cc_face.rects = [(12, 11, 80, 80)]
+        b_found, boxes = cvx.detect(img, True, False)
+        self.assertEqual(cvx.cc_eyes.ct, 1)
+        self.assertEqual(boxes[3], [(17, 16), (27, 26)])
+        cvx.cc_face.rects = [(40, 10, 80, 80)]
+        b_found, boxes = cvx.detect(img, True, False)
+        self.assertEqual(cvx.cc_eyes.ct, 2)
+        self.assertEqual(boxes[3], [(45, 15), (55, 25)])
+
+    def test_cal1_choose(self):
+        # fastest stable setting is chosen (timing all similar here)
+        cvx = pcv.CVMain()
+        cvx.cc_face = PickyCascade()
+        frames = [np.zeros((60, 80, 3), np.uint8)] * 3
+        self.assertTrue(cvx.calibrate(frames, target_fps=1.0))
+        self.assertTrue(cvx.face_neighbors >= 3)
+        self.assertTrue(cvx.size_face[0] <= 80)
+        self.assertEqual(cvx.size_eyes[0], (cvx.size_face[0] * 18) / 60)
+        self.assertEqual(cvx.profile["stability"], 1.0)
+
+    def test_cal2_no_face(self):
+        # nothing seen so defaults are kept
+        cvx = pcv.CVMain()
+        cvx.cc_face = FakeCascade([])
+        frames = [np.zeros((60, 80, 3), np.uint8)] * 3
+        self.assertFalse(cvx.calibrate(frames))
+        self.assertEqual(cvx.size_face, (60, 60))
+        self.assertTrue(cvx.profile is None)
+
+    def test_cal4_all_sizes(self):
+        # every candidate is measured even with no time to spare
+        cc = FakeCascade([(10, 10, 60, 60)])
+        sizes = []
+        cc.detectMultiScale = lambda *args: sizes.append(args[4][0]) or []
+        cvx = pcv.CVMain()
+        cvx.cc_face = cc
+        frames = [np.zeros((60, 80, 3), np.uint8)] * 5
+        cvx.calibrate(frames, max_sec=0.0)
+        n = len(cvx.CAL_SCALES) * len(cvx.CAL_NEIGHBORS)
+        self.assertEqual(len(sizes), n * len(cvx.CAL_SIZES))
+        self.assertEqual(sorted(set(sizes)), list(cvx.CAL_SIZES))
+
+    def test_cal5_spread(self):
+        # spread order visits ends and middle first and every index once
+        self.assertEqual(pcv.spread_order(5), [0, 4, 2, 1, 3])
+        self.assertEqual(sorted(pcv.spread_order(13)), range(13))
+        self.assertEqual(pcv.spread_order(0), [])
+
+    def test_cal3_persist(self):
+        # profile saved for one key is reused and other keys are kept
+        fd, fname = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        os.remove(fname)
+        try:
+            cvx = pcv.CVMain()
+            self.assertFalse(cvx.load_profile(fname, "cam0_640x480_0.5"))
+            cvx.apply_profile({"face_scale": 1.2, "face_neighbors": 3,
+                               "size_face": 80})
+            cvx.save_profile(fname, "cam0_640x480_0.5")
+            cvx.apply_profile({"face_scale": 1.3, "face_neighbors": 4,
+                               "size_face": 40})
+            cvx.save_profile(fname, "cam0_1280x720_0.5")
+
+            cvx = pcv.CVMain()
+            self.assertTrue(cvx.load_profile(fname, "cam0_640x480_0.5"))
+            self.assertEqual(cvx.face_scale, 1.2)
+            self.assertEqual(cvx.face_neighbors, 3)
+            self.assertEqual(cvx.size_face, (80, 80))
+            self.assertEqual(cvx.size_eyes, (24, 24))
+            self.assertTrue(cvx.load_profile(fname, "cam0_1280x720_0.5"))
+            self.assertEqual(cvx.size_face, (40, 40))
+        finally:
+            os.remove(fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
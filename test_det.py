@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+import poxdet as pd
+from testutil import FakeCascade
+
+
+class FakeNet(object):
+    # SSD style output with one row per detection
+
+    def __init__(self, rows):
+        self.out = np.array([[rows]], np.float32)
+
+    def setInput(self, x):
+        self.x = x
+
+    def forward(self):
+        return self.out
+
+
+class TestDet(unittest.TestCase):
+
+    def test_det1_cascade(self):
+        # cascade rectangles become faces with full score
+        det = pd.make_backend("lbp")
+        self.assertEqual(det.name, "lbp")
+        det.cc = FakeCascade(np.array([[1, 2, 30, 40]]))
+        gray = np.zeros((100, 100), np.uint8)
+        x = det.prepare(None, gray)
+        faces = det.find(x, 1.1, 3, (20, 20))
+        self.assertEqual(faces, [pd.Face(1, 2, 30, 40, 1.0)])
+        self.assertEqual(det.cc.args, (gray, 1.1, 3, 0, (20, 20)))
+
+    def test_det2_dnn(self):
+        # scores below limit and small faces are dropped
+        det = pd.make_backend("dnn")
+        self.assertEqual(det.cc, None)
+        det.net = FakeNet([[0, 1, 0.9, 0.125, 0.25, 0.5, 0.75],
+                           [0, 1, 0.3, 0.1, 0.2, 0.5, 0.7],
+                           [0, 1, 0.8, 0.0, 0.0, 0.05, 0.05]])
+        det._shape = (100, 200)
+        faces = det.find(None, 1.1, 3, (20, 20))
+        self.assertEqual(len(faces), 1)
+        self.assertEqual(faces[0][:4], (25, 25, 75, 50))
+        self.assertAlmostEqual(faces[0].score, 0.9, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
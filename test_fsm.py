@@ -235,6 +235,50 @@ class TestFSM(unittest.TestCase):
         cvsm.crank(pm.SMEvent(pm.SMEvent.E_TMR_SR))
         self.assertEqual(cvsm.psm.state, pm.SMPhrase.STATE_WAIT)
 
+    def test_fsm200(self):
+        # compiled table, ANY row passes event on, first final row wins
+        def log(tag):
+            return lambda sm, e, out: out.append(tag)
+        table = [(0, pm.ANY, None, [log("any")], None),
+                 (0, 5, lambda sm, e: e.data, [log("a")], 1),
+                 (0, 5, None, [log("b")], 0),
+                 (1, 6, None, [], 0)]
+        dispatch = pm.compile_table(table)
+        self.assertEqual(len(dispatch[0][5]), 3)
+        self.assertEqual(len(dispatch[0][pm.ANY]), 1)
+        self.assertEqual(len(dispatch[1][pm.ANY]), 0)
+
+        class Toy(pm.TableSM):
+            DISPATCH = dispatch
+        sm = Toy()
+        sm.state = 0
+        self.assertEqual(sm.crank(pm.SMEvent(7)), ["any"])
+        self.assertEqual(sm.crank(pm.SMEvent(5, False)), ["any", "b"])
+        self.assertEqual(sm.state, 0)
+        self.assertEqual(sm.crank(pm.SMEvent(5, True)), ["any", "a"])
+        self.assertEqual(sm.state, 1)
+        outputs = ["x"]
+        sm.run(pm.SMEvent(6), outputs)
+        self.assertEqual(outputs, ["x"])
+        self.assertEqual(sm.state, 0)
+
+    def test_fsm201(self):
+        # events are immutable values, shared events have no data
+        ev = pm.SMEvent(pm.SMEvent.E_KEY, GO)
+        self.assertEqual((ev.code, ev.data), (pm.SMEvent.E_KEY, GO))
+        self.assertRaises(AttributeError, setattr, ev, "data", HALT)
+        self.assertRaises(AttributeError, setattr, ev, "other", 0)
+        self.assertFalse(hasattr(ev, "__dict__"))
+        self.assertEqual(pm.EV_CVOK, pm.SMEvent(pm.SMEvent.E_CVOK))
+        self.assertEqual(pm.EV_CVOK.data, None)
+
+        # outputs without data are the shared events
+        cvsm = pm.SMLoop()
+        cvsm.crank(pm.SMEvent(pm.SMEvent.E_KEY, GO))
+        cvsm.crank(pm.EV_TMR_CV)
+        outputs = cvsm.crank(pm.SMEvent(pm.SMEvent.E_KEY, HALT))
+        self.assertTrue(outputs[0] is pm.EV_XOFF)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+import pox
+
+
+class TestHUD(unittest.TestCase):
+
+    def _compare(self, app, sfps):
+        # cached panel must give same pixels as direct drawing
+        rng = np.random.RandomState(0)
+        src = rng.randint(0, 256, (240, 320, 3)).astype(np.uint8)
+        img_direct = src.copy()
+        img_cached = src.copy()
+        app.draw_hud(img_direct, sfps)
+        app.render_hud(img_cached, sfps)
+        self.assertTrue(np.array_equal(img_direct, img_cached))
+
+    def test_hud1_identical(self):
+        # default status then several changes to HUD inputs
+        app = pox.App()
+        self._compare(app, "???")
+        app.b_grin = True
+        app.s_strikes = "XX"
+        self._compare(app, "???")
+        app.cvsm.snapshot["prog"] = "7"
+        app.cvsm.snapshot["color"] = "yellow"
+        app.cvsm.snapshot["label"] = "2"
+        app.record_enable = True
+        self._compare(app, "14.9")
+
+    def test_hud3_wide_fps(self):
+        # FPS text wider than status box is not cut off
+        app = pox.App()
+        for sfps in ("99.9", "123.4", "1000.0", "12345.6"):
+            self._compare(app, sfps)
+        app.record_enable = True
+        app.cvsm.snapshot["label"] = "WWWWWWW"
+        self._compare(app, "1000.0")
+
+    def test_hud2_cached(self):
+        # panel is only redrawn when an input changes
+        app = pox.App()
+        img = np.zeros((240, 320, 3), np.uint8)
+        app.render_hud(img, "15.0")
+        overlay = app.hud_overlay
+        app.render_hud(img, "15.0")
+        self.assertTrue(app.hud_overlay is overlay)
+        app.b_eyes = False
+        app.render_hud(img, "15.0")
+        self.assertFalse(app.hud_overlay is overlay)
+
+
+if __name__ == '__main__':
+    unittest.main()
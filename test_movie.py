@@ -0,0 +1,45 @@
+import unittest
+
+import os
+import shutil
+import tempfile
+import poxmovie as pm
+
+
+class TestMovie(unittest.TestCase):
+
+    def setUp(self):
+        self.img_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.img_path)
+
+    def _touch(self, names):
+        for each in names:
+            open(os.path.join(self.img_path, each), "w").close()
+
+    def test_movie1_group(self):
+        # frames grouped by clip and sorted by number, other files ignored
+        self._touch(["img_02_00001.png", "img_01_00010.png",
+                     "img_01_00002.png", "img_02_00000.png",
+                     "img_01_00009.png", "movie.mov", "notes.txt"])
+        clips = pm.group_frames(self.img_path)
+        self.assertEqual(list(clips.keys()), ["img_01", "img_02"])
+        names = [os.path.basename(x) for x in clips["img_01"]]
+        self.assertEqual(names, ["img_01_00002.png", "img_01_00009.png",
+                                 "img_01_00010.png"])
+        self.assertEqual(len(clips["img_02"]), 2)
+
+    def test_movie2_fps(self):
+        # frame rate from file times
+        self._touch(["img_01_00000.png", "img_01_00001.png",
+                     "img_01_00002.png"])
+        paths = pm.group_frames(self.img_path)["img_01"]
+        for k, each in enumerate(paths):
+            os.utime(each, (1000.0 + k * 0.1, 1000.0 + k * 0.1))
+        self.assertAlmostEqual(pm.estimate_fps(paths), 10.0, 3)
+        self.assertEqual(pm.estimate_fps(paths[:1]), 15.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
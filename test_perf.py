@@ -0,0 +1,57 @@
+import unittest
+
+import poxperf as pp
+
+
+class FakeTime(object):
+    # time only moves when test says so
+
+    def __init__(self):
+        self.t = 100.0
+
+    def time(self):
+        return self.t
+
+
+class TestPerf(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeTime()
+        self.saved = pp.time
+        pp.time = self.fake
+
+    def tearDown(self):
+        pp.time = self.saved
+
+    def test_perf1_marks(self):
+        # repeated marks add up within iteration
+        st = pp.StageTimer(names=["a", "b"], bucket_ms=[1, 10])
+        st.start()
+        for dt_a, dt_b in [(0.0005, 0.002), (0.003, 0.050)]:
+            self.fake.t += dt_a
+            st.mark(0)
+            self.fake.t += dt_b / 2
+            st.mark(1)
+            self.fake.t += dt_b / 2
+            st.mark(1)
+            st.end()
+        self.assertEqual(st.ct, 2)
+        self.assertEqual(st.hist, [[1, 1, 0], [0, 1, 1]])
+        self.assertAlmostEqual(st.worst[1], 0.050)
+        self.assertAlmostEqual(st.total[0], 0.0035)
+
+    def test_perf2_percentile(self):
+        # percentile is upper bound of its bucket
+        st = pp.StageTimer(names=["a"], bucket_ms=[1, 10])
+        self.assertEqual(st.percentile(0, 50), None)
+        st.hist = [[8, 1, 1]]
+        st.ct = 10
+        self.assertEqual(st.percentile(0, 50), 1)
+        self.assertEqual(st.percentile(0, 90), 10)
+        self.assertEqual(st.percentile(0, 99), float("inf"))
+        st.hist = [[0, 0, 10]]
+        self.assertTrue(">10" in st.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
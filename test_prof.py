@@ -0,0 +1,58 @@
+import unittest
+
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import pstats
+import poxprof as pp
+
+
+def busy(sec):
+    t_end = time.time() + sec
+    while time.time() < t_end:
+        pass
+
+
+class TestProf(unittest.TestCase):
+
+    def test_prof1_collapse(self):
+        # outermost frame first with thread name at root
+        def inner():
+            return pp.collapse("main", sys._getframe())
+
+        s = inner()
+        self.assertTrue(s.startswith("main;"))
+        self.assertTrue(s.endswith("test_prof.py:inner"))
+
+    def test_prof2_loop(self):
+        # stops after N iterations and writes pstats and folded stacks
+        out_path = tempfile.mkdtemp()
+        stop = threading.Event()
+        worker = threading.Thread(target=lambda: stop.wait(5.0))
+        worker.setDaemon(True)
+        worker.start()
+        try:
+            prof = pp.LoopProfiler(out_path, iterations=5, interval=0.001)
+            self.assertFalse(prof.active)
+            prof.start([("worker", worker)])
+            name = None
+            while name is None:
+                busy(0.01)
+                name = prof.tick()
+            self.assertFalse(prof.active)
+            stats = pstats.Stats(name + ".pstats")
+            self.assertTrue(any(f[2] == "busy" for f in stats.stats))
+            with open(name + ".folded") as f:
+                lines = f.read().splitlines()
+            roots = set(x.split(";")[0] for x in lines)
+            self.assertEqual(roots, set(["main", "worker"]))
+            self.assertTrue(all(x.rsplit(" ", 1)[1].isdigit() for x in lines))
+        finally:
+            stop.set()
+            shutil.rmtree(out_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
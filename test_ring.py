@@ -0,0 +1,94 @@
+import unittest
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import poxring as pr
+
+
+class TestRing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.ring = pr.FrameRing(os.path.join(self.tmp, "ring.mmap"),
+                                 seconds=1.0, fps=10.0)
+
+    def tearDown(self):
+        self.ring.close()
+        shutil.rmtree(self.tmp)
+
+    def _push(self, n):
+        # frame k is filled with k and has k % 3 faces with one eye box
+        for k in range(n):
+            frame = np.zeros((4, 6, 3), np.uint8)
+            frame[:] = k
+            faces = [(i + 1, i == 0, 1, k, 1, 2, 2) for i in range(k % 3)]
+            features = [(i + 1, k, 1, k + 2, 3) for i in range(k % 3)]
+            self.ring.push(frame, 100.0 + k * 0.1, k % 2 == 0, faces,
+                           features)
+
+    def test_ring1_wrap(self):
+        # freeze after wrap-around gives newest frames in time order
+        self._push(25)
+        name = os.path.join(self.tmp, "replay")
+        self.assertEqual(self.ring.freeze(name), 10)
+        self.ring.wait()
+        frames, meta = pr.load_replay(name)
+        self.assertEqual(frames.shape, (10, 4, 6, 3))
+        self.assertEqual(list(frames[:, 0, 0, 0]), range(15, 25))
+        self.assertAlmostEqual(meta["times"][0], 101.5)
+        self.assertEqual(list(meta["found"][:2]), [False, True])
+        self.assertEqual(list(meta["faces"][:, 0]), [1, 2, 2, 4, 5, 5,
+                                                     7, 8, 8])
+        self.assertEqual(list(meta["faces"][2]), [2, 2, 0, 1, 17, 1, 2, 2])
+        self.assertEqual(list(meta["features"][2]), [2, 2, 17, 1, 19, 3])
+
+    def test_ring2_seconds(self):
+        # only last half second, before ring is full
+        self._push(8)
+        name = os.path.join(self.tmp, "replay")
+        self.assertEqual(self.ring.freeze(name, 0.45), 5)
+        self.ring.wait()
+        frames, meta = pr.load_replay(name)
+        self.assertEqual(list(frames[:, 0, 0, 0]), [3, 4, 5, 6, 7])
+
+    def test_ring4_background(self):
+        # frames pushed while saving do not change saved replay
+        self._push(10)
+        name = os.path.join(self.tmp, "replay")
+        done = []
+        self.ring.freeze(name, 0.45, lambda *args: done.append(args))
+        self._push(3)
+        self.ring.wait()
+        frames, meta = pr.load_replay(name)
+        self.assertEqual(list(frames[:, 0, 0, 0]), [5, 6, 7, 8, 9])
+        self.assertAlmostEqual(meta["times"][0], 100.5)
+        self.assertEqual(done, [(name, 5, True)])
+
+    def test_ring5_resize(self):
+        # frame of another size is resized into slot and keeps history
+        self._push(5)
+        frame = np.zeros((8, 12, 3), np.uint8)
+        frame[:] = 99
+        self.ring.push(frame, 101.0, True, [(1, 1, 1, 2, 4, 4, 4)],
+                       [(1, 2, 4, 6, 8)])
+        self.assertEqual(self.ring.ct, 6)
+        name = os.path.join(self.tmp, "replay")
+        self.ring.freeze(name)
+        self.ring.wait()
+        frames, meta = pr.load_replay(name)
+        self.assertEqual(frames.shape, (6, 4, 6, 3))
+        self.assertEqual(list(frames[:, 0, 0, 0]), [0, 1, 2, 3, 4, 99])
+        self.assertEqual(list(meta["faces"][-1]), [5, 1, 1, 1, 1, 2, 2, 2])
+        self.assertEqual(list(meta["features"][-1]), [5, 1, 1, 2, 3, 4])
+
+    def test_ring3_empty(self):
+        # nothing pushed yet so nothing frozen
+        name = os.path.join(self.tmp, "replay")
+        self.assertEqual(self.ring.freeze(name), 0)
+        self.assertFalse(os.path.exists(name + ".frames"))
+
+
+if __name__ == '__main__':
+    unittest.main()
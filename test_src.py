@@ -0,0 +1,50 @@
+import unittest
+
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+import poxsrc as ps
+
+
+class TestSrc(unittest.TestCase):
+
+    def test_src1_synthetic(self):
+        # free-run frames get virtual timestamps at frame rate
+        src = ps.SyntheticSource((120, 160, 3), fps=10.0, n=3)
+        times = []
+        while True:
+            ret, img = src.read()
+            if not ret:
+                break
+            self.assertEqual(img.shape, (120, 160, 3))
+            times.append(src.t)
+        self.assertTrue(src.is_done())
+        self.assertEqual(len(times), 3)
+        self.assertAlmostEqual(times[2] - times[0], 0.2)
+
+    def test_src2_dir(self):
+        # recorded frames in clip and frame number order
+        img_path = tempfile.mkdtemp()
+        try:
+            for name, k in [("img_02_00000.png", 3), ("img_01_00010.png", 2),
+                            ("img_01_00002.png", 1), ("frame_01_00000.png", 9)]:
+                img = np.zeros((8, 8, 3), np.uint8)
+                img[:] = k
+                cv2.imwrite(os.path.join(img_path, name), img)
+            src = ps.open_source(img_path, free_run=True)
+            self.assertTrue(isinstance(src, ps.FrameDirSource))
+            values = []
+            while True:
+                ret, img = src.read()
+                if not ret:
+                    break
+                values.append(img[0, 0, 0])
+            self.assertEqual(values, [1, 2, 3])
+        finally:
+            shutil.rmtree(img_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 import unittest
 
 import time
+import threading
 import poxutil as fu
 
 
@@ -73,6 +74,44 @@ class TestUtil(unittest.TestCase):
             done, t = timer.update()
         self.assertEqual(ct, 10)
 
+    def test_timer5_virtual(self):
+        # timer runs on virtual clock without any waiting
+        clock = fu.VirtualClock(1000.0)
+        fu.set_clock(clock)
+        try:
+            timer = fu.PolledTimer()
+            timer.start(3)
+            clock.set(1002.5)
+            f, t = timer.update()
+            self.assertEqual(f, False)
+            self.assertEqual(t, 1)
+            clock.set(1003.1)
+            f, t = timer.update()
+            self.assertEqual(f, True)
+        finally:
+            fu.set_clock(None)
+
+    def test_startup1(self):
+        # tasks run concurrently and report is made once after last one
+        reports = []
+        tasks = fu.StartupTasks(lambda x: reports.append(x.report()))
+        gate = threading.Event()
+        tasks.add("slow", gate.wait, 5.0)
+        tasks.add("fast", lambda a, b: a + b, 1, 2)
+        tasks.start()
+        self.assertEqual(tasks.wait("fast"), 3)
+        self.assertTrue("slow=..." in tasks.report())
+        self.assertEqual(reports, [])
+        gate.set()
+        tasks.wait("slow")
+        for _ in range(20):
+            if reports:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(reports), 1)
+        self.assertTrue(reports[0].startswith("slow="))
+        self.assertTrue("..." not in reports[0])
+
     def test_pm1(self):
         # see if we can handle non-existent file and get dummy phrase
         pm = fu.PhraseManager()
@@ -0,0 +1,147 @@
+import unittest
+
+import time
+import threading
+import numpy as np
+import poxvid as pv
+
+
+class SlowWriter(object):
+    # records file names, waits for gate before each write
+
+    def __init__(self):
+        self.names = []
+        self.gate = threading.Event()
+
+    def __call__(self, file_path, frame):
+        self.gate.wait()
+        self.names.append(file_path)
+
+
+class FakeVideo(object):
+    # stands in for cv2.VideoWriter and keeps what was written
+
+    opened = []
+
+    def __init__(self, path, fourcc, fps, size):
+        self.path = path
+        self.fps = fps
+        self.size = size
+        self.frames = 0
+        self.released = False
+        FakeVideo.opened.append(self)
+
+    def write(self, frame):
+        self.frames += 1
+
+    def release(self):
+        self.released = True
+
+
+class TestVid(unittest.TestCase):
+
+    def setUp(self):
+        self.video_writer = pv.cv2.VideoWriter
+        pv.cv2.VideoWriter = FakeVideo
+        FakeVideo.opened = []
+
+    def tearDown(self):
+        pv.cv2.VideoWriter = self.video_writer
+
+    def _run(self, policy):
+        # one writer stuck on first frame while four more are posted
+        writer = SlowWriter()
+        rec = pv.FrameRecorder(workers=1, depth=2, policy=policy,
+                               writer=writer)
+        rec.start()
+        rec.post_frame("f0", None)
+        time.sleep(0.1)
+        for k in range(1, 5):
+            rec.post_frame("f{0}".format(k), None)
+        writer.gate.set()
+        rec.stop()
+        return rec, writer.names
+
+    def test_vid1_drop_oldest(self):
+        rec, names = self._run(pv.DROP_OLDEST)
+        self.assertEqual(names, ["f0", "f3", "f4"])
+        self.assertEqual(rec.ct_dropped, 2)
+        self.assertEqual(rec.ct_written, 3)
+
+    def test_vid2_drop_newest(self):
+        rec, names = self._run(pv.DROP_NEWEST)
+        self.assertEqual(names, ["f0", "f1", "f2"])
+        self.assertEqual(rec.ct_dropped, 2)
+
+    def test_vid3_block(self):
+        # posting blocks until writer catches up so nothing is lost
+        writer = SlowWriter()
+        writer.gate.set()
+        rec = pv.FrameRecorder(workers=2, depth=1, policy=pv.DROP_BLOCK,
+                               writer=writer)
+        rec.start()
+        for k in range(20):
+            rec.post_frame("f{0}".format(k), None)
+        rec.stop()
+        self.assertEqual(rec.ct_written, 20)
+        self.assertEqual(rec.ct_dropped, 0)
+
+    def test_vid4_segments(self):
+        # clip is split by time and stamped with measured frame rate
+        rec = pv.ClipRecorder(seg_sec=1.0, fps_probe=10)
+        frame = np.zeros((120, 160, 3), np.uint8)
+        for k in range(50):
+            rec._write("img_01", frame, 100.0 + k * 0.0625)
+        rec._write(None, None, 0.0)
+        videos = FakeVideo.opened
+        self.assertEqual([v.path for v in videos],
+                         ["img_01_00.mov", "img_01_01.mov", "img_01_02.mov"])
+        self.assertEqual([v.frames for v in videos], [17, 17, 16])
+        self.assertTrue(all([v.released for v in videos]))
+        self.assertAlmostEqual(videos[0].fps, 16.0)
+        self.assertEqual(videos[0].size, (160, 120))
+
+    def test_vid5_short_clips(self):
+        # clips shorter than probe are still written when next one starts
+        rec = pv.ClipRecorder(fps_probe=30)
+        frame = np.zeros((120, 160, 3), np.uint8)
+        for k in range(5):
+            rec._write("img_01", frame, 10.0 + k * 0.1)
+        rec._write("img_02", frame, 20.0)
+        rec._close()
+        videos = FakeVideo.opened
+        self.assertEqual([v.frames for v in videos], [5, 1])
+        self.assertAlmostEqual(videos[0].fps, 10.0)
+        self.assertEqual(videos[1].fps, 15.0)
+
+    def test_vid6_end_marker(self):
+        # full queue after end of clip drops frames, never the marker
+        rec = pv.ClipRecorder(depth=2)
+        gate = threading.Event()
+        names = []
+        write = rec._write
+
+        def slow_write(file_path, frame, t):
+            gate.wait()
+            names.append(file_path)
+            write(file_path, frame, t)
+
+        rec._write = slow_write
+        rec.start()
+        frame = np.zeros((120, 160, 3), np.uint8)
+        rec.post_frame("img_01", frame)
+        time.sleep(0.1)
+        rec.end_clip()
+        for k in range(3):
+            rec.post_frame("img_01", frame)
+        gate.set()
+        rec.flush()
+        self.assertEqual(names, ["img_01", None, "img_01"])
+        self.assertEqual(rec.ct_dropped, 2)
+        self.assertEqual([v.released for v in FakeVideo.opened], [True])
+        rec.stop()
+        self.assertEqual(len(FakeVideo.opened), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+# testutil.py
+
+"""Shared test helpers (not a test module)."""
+
+
+class FakeCascade(object):
+    # always "finds" the same rectangles
+    # (counts calls and keeps last arguments)
+
+    def __init__(self, rects):
+        self.rects = rects
+        self.ct = 0
+        self.args = None
+
+    def detectMultiScale(self, *args):
+        self.ct += 1
+        self.args = args
+        return self.rects